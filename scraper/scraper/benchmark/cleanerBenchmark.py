@@ -0,0 +1,82 @@
+from scraper.transformation.transform import htmlCleaners
+from pathlib import Path
+import argparse
+import glob
+import sys
+import time
+
+
+# Small pages covering the cases where both cleaners could diverge
+syntheticPages = {
+    'comments_scripts_styles': b'<html><body><p>a<!-- c -->b<script>x</script>  d<style>s</style>e</p><template>t</template>f</body></html>',
+    'main_content_div': b'<html><body><div class="x main-content y"> hi <b>there</b></div></body></html>',
+    'main_over_div': b'<html><body><div class="main-content">D</div><main>M <i>m</i></main></body></html>',
+    'no_body': b'<p>x</p>',
+    'entities': b'<html><head><title>T</title></head><body>\xc3\xa9 &amp; &nbsp;z</body></html>',
+    'whitespace': b'<html><body><main><p>a\n</p>\n<pre> b </pre>\t</main></body></html>',
+    'xml_declaration': b'<?xml version="1.0" encoding="utf-8"?><html><body>x</body></html>',
+    'empty': b'',
+}
+
+
+def comparePages(pages, reference='bs4', candidate='lxml', repeat=5):
+    """
+        Cleans every page with both engines, checks that the outputs are identical and times them.
+
+    Args:
+    ---------------------
+        pages: dict of page name -> raw HTML bytes
+        reference: name of the reference cleaner engine
+        candidate: name of the cleaner engine compared to the reference
+        repeat: number of times each page is cleaned by each engine
+
+    Returns:
+    ---------------------
+        results: list of dicts with page, equal, reference and candidate seconds per document
+    """
+    results = []
+    for name, rawContent in pages.items():
+        expected = htmlCleaners[reference](rawContent)
+        actual = htmlCleaners[candidate](rawContent)
+        timings = {}
+        for engine in (reference, candidate):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                htmlCleaners[engine](rawContent)
+            timings[engine] = (time.perf_counter() - start) / repeat
+        results.append({'page': name, 'bytes': len(rawContent), 'equal': expected == actual,
+                         reference: timings[reference], candidate: timings[candidate]})
+    return results
+
+
+def main():
+    """
+        Diffs the lxml cleaner against the BeautifulSoup cleaner on the saved pages and synthetic pages,
+        prints the per-document timings and speedup, and exits with 1 when any output differs.
+        Run from the scrapy project directory: python -m scraper.benchmark.cleanerBenchmark
+    """
+    parser = argparse.ArgumentParser(description='Compare the HTML cleaner engines of the transform.')
+    parser.add_argument('--pages', default='Metadata/*.html', help='glob of saved HTML pages')
+    parser.add_argument('--repeat', type=int, default=5, help='cleanings per page and engine')
+    args = parser.parse_args()
+
+    pages = {Path(path).name: Path(path).read_bytes() for path in sorted(glob.glob(args.pages))}
+    pages.update(syntheticPages)
+    results = comparePages(pages, repeat=args.repeat)
+
+    for result in results:
+        speedup = result['bs4'] / result['lxml'] if result['lxml'] else float('inf')
+        status = 'OK  ' if result['equal'] else 'DIFF'
+        print(f"{status} {result['page']:<40} {result['bytes']:>9} B  bs4 {result['bs4'] * 1000:8.2f} ms  "
+              f"lxml {result['lxml'] * 1000:8.2f} ms  x{speedup:.1f}")
+    totalReference = sum(result['bs4'] for result in results)
+    totalCandidate = sum(result['lxml'] for result in results)
+    print(f"Total per pass: bs4 {totalReference * 1000:.2f} ms, lxml {totalCandidate * 1000:.2f} ms, "
+          f"speedup x{totalReference / totalCandidate:.1f}")
+
+    if not all(result['equal'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+from scraper.benchmark.stubs import InMemoryMinioClient, InMemoryMongoDBClient
+from scraper.spiders.WorkplaceRelationSpider import WorkplaceRelationSpider
+from scraper.items import ScraperItem
+from scrapy.http import HtmlResponse, Request, Response
+from unittest import mock
+from datetime import datetime
+from pathlib import Path
+import scraper.pipelines as pipelines
+import scraper.transformation.transform as transform
+import argparse
+import contextlib
+import glob
+import json
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+
+
+searchURL = 'https://www.workplacerelations.ie/en/search/?decisions=1&q=%22labour%22&from=01/01/2025&to=11/01/2025&body=3,15376'
+
+
+def syntheticSearchPage(rows, seed):
+    """
+        Builds a search results page with the layout of workplacerelations.ie holding the given number of rows.
+    """
+    items = []
+    for index in range(rows):
+        Id = f'ADJ-{seed:03d}{index:05d}'
+        items.append(
+            '<li class="each-item clearfix"><div class="row"><div class="col-sm-9">'
+            f'<h2 class="title" title="{Id}"><a href="/en/cases/2025/january/{Id.lower()}.html" title="{Id}">{Id}</a></h2></div>'
+            f'<div class="col-sm-3"><span class="date">{index % 28 + 1:02d}/01/2025</span></div></div>'
+            f'<p class="description" title="An employee V A company">An employee V A company {index}</p>'
+            f'<div class="row bottom-ref"><div class="col-sm-9 ref"><span>Ref no: </span><span class="refNO">{Id}</span></div></div></li>'
+        )
+    return ('<html><body><div class="searchhead">Shows 1 to 10 of %d results</div>'
+            '<div class="item-list search-list"><ul>%s</ul></div></body></html>' % (rows * 10, ''.join(items))).encode('utf-8')
+
+
+def syntheticDecisionPage(paragraphs, seed):
+    """
+        Builds a decision page with navigation, scripts and a main content of the given number of paragraphs.
+    """
+    generator = random.Random(seed)
+    words = ['employee', 'complaint', 'adjudication', 'officer', 'respondent', 'labour', 'court', 'section', 'act', 'pay',
+             'dismissal', 'hearing', 'evidence', 'decision', 'contract', 'redress', 'workplace', 'relations', 'commission']
+    body = ''.join('<p>%s.</p>' % ' '.join(generator.choice(words) for _ in range(60)) for _ in range(paragraphs))
+    return ('<html><head><script>var tracking = 1;</script><style>p {margin: 0}</style></head><body>'
+            '<nav><ul><li>Home</li><li>Decisions</li></ul></nav>'
+            '<div class="main-content"><h1>ADJ-%05d</h1>%s</div><footer>Footer</footer></body></html>' % (seed, body)).encode('utf-8')
+
+
+def measure(stage, makeInputs, function, sizeOf):
+    """
+        Runs a stage over fresh inputs twice: once timed, once under tracemalloc for the peak memory.
+
+    Args:
+    ---------------------
+        stage: name of the stage
+        makeInputs: callable returning the list of inputs (stages may mutate them)
+        function: callable run on each input
+        sizeOf: callable returning the bytes processed for an input
+
+    Returns:
+    ---------------------
+        result: dict of items, bytes, seconds, itemsPerSec, bytesPerSec and peakMemoryBytes
+    """
+    inputs = makeInputs()
+    totalBytes = sum(sizeOf(value) for value in inputs)
+    start = time.perf_counter()
+    for value in inputs:
+        function(value)
+    seconds = time.perf_counter() - start
+
+    inputs = makeInputs()
+    tracemalloc.start()
+    for value in inputs:
+        function(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'items': len(inputs),
+        'bytes': totalBytes,
+        'seconds': seconds,
+        'itemsPerSec': len(inputs) / seconds if seconds else None,
+        'bytesPerSec': totalBytes / seconds if seconds else None,
+        'peakMemoryBytes': peak,
+    }
+    print(f"{stage:<28} {result['items']:>6} items  {result['itemsPerSec'] or 0:>10.1f} items/s  "
+          f"{(result['bytesPerSec'] or 0) / 1e6:>8.2f} MB/s  peak {peak / 1e6:>8.2f} MB")
+    return result
+
+
+def documentResponse(url, body, callback, item):
+    """
+        Builds the response of a document request as the spider would receive it.
+    """
+    request = Request(url, callback=callback, meta={'item': item})
+    if url.endswith('.html'):
+        return HtmlResponse(url=url, body=body, request=request, encoding='utf-8')
+    return Response(url=url, body=body, request=request)
+
+
+def runBenchmarks(args):
+    """
+        Runs every stage offline: spider parse, parse_html and parse_binary on recorded and synthetic pages,
+        ScraperPipeline.process_item and Transform.processRecord on in-memory MinIO and MongoDB stand-ins.
+    """
+    searchPages = [Path(path).read_bytes() for path in sorted(glob.glob(args.pages))]
+    searchPages += [syntheticSearchPage(args.rows, seed) for seed in range(args.search_pages)]
+    decisionPages = [syntheticDecisionPage(args.paragraphs, seed) for seed in range(args.documents)]
+    decisionPages += [Path(path).read_bytes() for path in sorted(glob.glob(args.pages))]
+    binaries = [bytes(random.Random(seed).getrandbits(8) for _ in range(args.binary_size)) for seed in range(args.binaries)]
+
+    # The spider and the Transform write their log files (and the Transform its metrics summary) under Log/ of the
+    # working directory: the stages run from a temporary directory, a benchmark run leaves nothing in the source tree
+    with tempfile.TemporaryDirectory() as workDir, contextlib.chdir(workDir):
+        spider = WorkplaceRelationSpider(start_date='01/01/2025', end_date='11/01/2025', query='labour',
+                                         body='Labour Court,Workplace Relations Commission', partition='10')
+        results = {}
+
+        def newItem(index, extension):
+            item = ScraperItem()
+            item['Id'] = f'BENCH-{index:06d}'
+            item['title'] = item['Id']
+            item['description'] = 'An employee V A company'
+            item['date'] = f'{index % 28 + 1:02d}/01/2025'
+            item['partition_date'] = '01-01-2025'
+            item['sourceURL'] = searchURL
+            item['documentURL'] = f'https://www.workplacerelations.ie/en/cases/2025/january/bench-{index:06d}.{extension}'
+            item['body'] = 'Labour Court-Workplace Relations Commission'
+            return item
+
+        results['spider.parse'] = measure(
+            'spider.parse',
+            lambda: [HtmlResponse(url=searchURL, body=page, request=Request(searchURL, meta={'partition_date': '01-01-2025'}), encoding='utf-8') for page in searchPages],
+            lambda response: list(spider.parse(response)),
+            lambda response: len(response.body))
+
+        def htmlResponses():
+            return [documentResponse(newItem(index, 'html')['documentURL'], page, spider.parse_html, newItem(index, 'html'))
+                    for index, page in enumerate(decisionPages)]
+
+        def binaryResponses():
+            return [documentResponse(newItem(index, 'pdf')['documentURL'], content, spider.parse_binary, newItem(len(decisionPages) + index, 'pdf'))
+                    for index, content in enumerate(binaries)]
+
+        results['spider.parse_html'] = measure('spider.parse_html', htmlResponses, lambda response: list(spider.parse_html(response)), lambda response: len(response.body))
+        results['spider.parse_binary'] = measure('spider.parse_binary', binaryResponses, lambda response: list(spider.parse_binary(response)), lambda response: len(response.body))
+
+        def scrapedItems():
+            items = []
+            for response in htmlResponses() + binaryResponses():
+                callback = spider.parse_html if response.url.endswith('.html') else spider.parse_binary
+                items.extend(output for output in callback(response) if isinstance(output, ScraperItem))
+            return items
+
+        with mock.patch.object(pipelines, 'MinioClient', InMemoryMinioClient), \
+                mock.patch.object(pipelines, 'MongoDBClient', InMemoryMongoDBClient), \
+                mock.patch.object(transform, 'MinioClient', InMemoryMinioClient), \
+                mock.patch.object(transform, 'MongoDBClient', InMemoryMongoDBClient), \
+                tempfile.TemporaryDirectory() as indexDir, mock.patch.dict('os.environ', {'INDEX_DIR': indexDir}):
+            pipeline = pipelines.ScraperPipeline(asyncEnabled=False)
+            pipeline.open_spider(spider)
+            results['pipeline.process_item'] = measure('pipeline.process_item', scrapedItems,
+                                                       lambda item: pipeline.process_item(item, spider), lambda item: len(item['rawContent']))
+            pipeline.close_spider(spider)
+
+            transformer = transform.Transform(start_date='2025-01-01', end_date='2025-01-31')
+            landingItems = InMemoryMongoDBClient().findItems('lnd_documents_metadata')
+
+            def landingSize(item):
+                return len(InMemoryMinioClient.objects[('landing', item['filePath'].replace('landing/', '', 1))])
+
+            results['transform.processRecord'] = measure('transform.processRecord', lambda: [dict(item) for item in landingItems],
+                                                         lambda item: transformer.processRecord(item, 'benchmark'), landingSize)
+            transformer.close()
+
+        spider.closed('benchmark finished')
+        return results
+
+
+def main():
+    """
+        Runs the offline benchmark suite and writes the results as JSON, to compare runs with each other.
+        Run from the scrapy project directory: python -m scraper.benchmark.run
+    """
+    parser = argparse.ArgumentParser(description='Offline benchmark of the spider, pipeline and transform hot paths.')
+    parser.add_argument('--pages', default='Metadata/response_*.html', help='glob of recorded search pages')
+    parser.add_argument('--search-pages', type=int, default=20, help='synthetic search pages')
+    parser.add_argument('--rows', type=int, default=10, help='rows per synthetic search page')
+    parser.add_argument('--documents', type=int, default=200, help='synthetic decision pages')
+    parser.add_argument('--paragraphs', type=int, default=40, help='paragraphs per synthetic decision page')
+    parser.add_argument('--binaries', type=int, default=20, help='synthetic binary documents')
+    parser.add_argument('--binary-size', type=int, default=256 * 1024, help='size of each binary document in bytes')
+    parser.add_argument('--output', default=None, help='JSON output path, Log/Benchmark_<timestamp>.json by default')
+    args = parser.parse_args()
+
+    now = datetime.now()
+    results = runBenchmarks(args)
+    report = {
+        'timestamp': now.isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'htmlCleaner': transform.os.getenv('TRANSFORM_HTML_CLEANER', 'bs4'),
+        'parameters': vars(args),
+        'stages': results,
+    }
+    output = Path(args.output or Path('Log') / f"Benchmark_{now.strftime('%Y%m%d%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f'Results written to {output}')
+
+
+if __name__ == "__main__":
+    main()
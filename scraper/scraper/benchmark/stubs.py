@@ -0,0 +1,125 @@
+from threading import Lock
+
+
+class InMemoryMinioClient:
+    """
+        In-memory stand-in for MinioClient, used to run the pipeline and transform offline.
+        Objects of every bucket are kept in one class level dict so that buckets can copy from each other.
+    """
+    objects = {}
+
+    def __init__(self, bucketName='landing', **kwargs):
+        self.bucket_name = bucketName
+
+    def upload(self, objectPath, raw_content, **kwargs):
+        self.objects[(self.bucket_name, objectPath)] = bytes(raw_content)
+        return f"{self.bucket_name}/{objectPath}"
+
+    def uploadStream(self, objectPath, stream, length, partSize=None):
+        self.objects[(self.bucket_name, objectPath)] = stream.read(length)
+        return f"{self.bucket_name}/{objectPath}"
+
+    def copyFrom(self, sourceBucket, sourceObjectPath, objectPath):
+        self.objects[(self.bucket_name, objectPath)] = self.objects[(sourceBucket, sourceObjectPath)]
+        return f"{self.bucket_name}/{objectPath}"
+
+    def download(self, objectPath):
+        return self.objects[(self.bucket_name, objectPath)]
+
+
+class InMemoryCollection:
+    """
+        In-memory collection holding documents keyed by their Id.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+
+
+class InMemoryMongoDBClient:
+    """
+        In-memory stand-in for MongoDBClient implementing the methods used by the pipeline and the transform.
+        Filters support equality, $in (also on array fields), $ne, $exists, $gte and $lte, which is what those callers send.
+    """
+    collections = {}
+
+    def __init__(self, db_name='Workplacerelation_metadata', **kwargs):
+        self._lock = Lock()
+        self._beforeWrite = {}
+
+    def getCollection(self, collectionName):
+        return self.collections.setdefault(collectionName, InMemoryCollection(collectionName))
+
+    def ensureIndexes(self, collectionName):
+        self.getCollection(collectionName)
+
+    def upsertItem(self, collectionName, filterQuery, item):
+        key = tuple(sorted(filterQuery.items()))
+        with self._lock:
+            self.getCollection(collectionName).documents.setdefault(key, {}).update(dict(item))
+
+    def bufferUpsert(self, collectionName, filterQuery, item):
+        self.upsertItem(collectionName, filterQuery, item)
+        return []
+
+    def flush(self, collectionName=None):
+        # Upserts are applied right away, the callables run once per flush as they would once per batch
+        names = [collectionName] if collectionName is not None else list(self._beforeWrite)
+        for name in names:
+            for callback in self._beforeWrite.get(name, ()):
+                callback()
+        return []
+
+    def beforeWrite(self, collectionName, callback):
+        self._beforeWrite.setdefault(collectionName, []).append(callback)
+
+    def findItems(self, collectionName, filterQuery=None, projection=None, batchSize=None):
+        documents = list(self.getCollection(collectionName).documents.values())
+        return [dict(document) for document in documents if self._matches(document, filterQuery or {})]
+
+    def countItems(self, collectionName, filterQuery=None):
+        return len(self.findItems(collectionName, filterQuery))
+
+    def deleteItems(self, collectionName, filterQuery):
+        collection = self.getCollection(collectionName)
+        keys = [key for key, document in collection.documents.items() if self._matches(document, filterQuery)]
+        for key in keys:
+            del collection.documents[key]
+        return len(keys)
+
+    def updateItems(self, collectionName, filterQuery, fields):
+        documents = [document for document in self.getCollection(collectionName).documents.values() if self._matches(document, filterQuery)]
+        for document in documents:
+            document.update(fields)
+        return len(documents)
+
+    def findValidators(self, collectionName):
+        documents = self.findItems(collectionName, {'documentURL': {'$exists': True}})
+        return {document.pop('documentURL'): document for document in documents}
+
+    def findIds(self, collectionName, filterQuery=None):
+        return {document['Id'] for document in self.findItems(collectionName, filterQuery) if 'Id' in document}
+
+    def close(self):
+        pass
+
+    def _matches(self, document, filterQuery):
+        for field, condition in filterQuery.items():
+            value = document.get(field)
+            if not isinstance(condition, dict):
+                if value != condition:
+                    return False
+                continue
+            if '$exists' in condition and (field in document) != condition['$exists']:
+                return False
+            if '$in' in condition:
+                values = value if isinstance(value, list) else [value]
+                if not any(item in condition['$in'] for item in values):
+                    return False
+            if '$ne' in condition and value == condition['$ne']:
+                return False
+            if '$gte' in condition and (value is None or value < condition['$gte']):
+                return False
+            if '$lte' in condition and (value is None or value > condition['$lte']):
+                return False
+        return True
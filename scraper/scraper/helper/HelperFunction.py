@@ -1,7 +1,12 @@
 from scraper.exception.Exception import *
 from scraper.logger.Logger import Logger
 from datetime import datetime, timedelta
+import threading
+import logging
 import math
+import time
+import os
+import re
 
 
 class HelperFunction():
@@ -11,11 +16,33 @@ class HelperFunction():
     - logAction: Uses the logger class to log actions to log file.
     - constructScrapingList: Takes as input start_date, end_date, query, body, and partition 
         to construct the list of URLs to be used tto be web scrape.  
+    - buildDayDensity: Turns result counts observed on previous crawls into expected results per day.
+    - splitScrapingURL: Splits the date window of a search URL in two halves.
     """
+    # Number of results shown on one search page
+    resultsPerPage = 10
+    # Logging levels accepted by logAction
+    logLevels = {
+        'info': logging.INFO,
+        'debug': logging.DEBUG,
+        'critical': logging.CRITICAL,
+        'warning': logging.WARNING,
+        'error': logging.ERROR,
+    }
 
     def __init__(self, logFileFullPath, loggerLevel):
-        # Initailize Looger Class
-        self.logger = Logger(logFileFullPath, 'DEBUG')
+        # Initailize Looger Class, the level, sampling, rate limit and rotation can be set from the environment:
+        # LOG_LEVEL, LOG_SAMPLE_RATE (keep 1 per-item message out of N), LOG_RATE_LIMIT (per-item messages
+        # per second and action), LOG_ROTATE_BYTES and LOG_BACKUP_COUNT
+        # Log files have always been written at DEBUG whatever loggerLevel, LOG_LEVEL is the only way to raise it
+        self.logger = Logger(logFileFullPath, os.getenv('LOG_LEVEL', 'DEBUG').upper(),
+                             rotateBytes=int(os.getenv('LOG_ROTATE_BYTES', 0)), backupCount=int(os.getenv('LOG_BACKUP_COUNT', 5)))
+        self.sampleRate = max(1, int(os.getenv('LOG_SAMPLE_RATE', 1)))
+        self.rateLimit = int(os.getenv('LOG_RATE_LIMIT', 0))
+        # actionName -> [messages seen, current second, messages logged in that second, messages dropped]
+        self.sampledCounters = {}
+        # Per-item messages are logged from the pipeline storage threads and the transform I/O threads
+        self._sampledLock = threading.Lock()
         # Map strings to Ids that are used in the search URL
         self.bodyMap = {
             "Employment Appeals Tribunal": 2,
@@ -24,12 +51,13 @@ class HelperFunction():
             "Workplace Relations Commission": 15376
         }
 
-    def logAction(self, level, actionName=None, state=None, customMessage=None):
+    def logAction(self, level, actionName=None, state=None, customMessage=None, args=(), sampled=False):
         """
         Logs an action to the log file. This encapsulates the concatenation of an
         action, state, and the custom message. The result is in the format of:
         actionName: state if customMessage is not passed.
         Other logs explicitly the custom Message
+        Nothing is formatted when the level is disabled, and the formatting itself happens in the writer thread.
 
         Args:
         ---------------------
@@ -42,36 +70,89 @@ class HelperFunction():
             actionName: The name of the action that is being logged.
             state: The state of the action. This could be a success message, a failure message, or a warning message.
             customMessage: A custom message to be logged. If this argument is not specified, the message will be generated by the function.
+            args: Arguments of %-style placeholders in state (or customMessage), merged only when the message is written.
+            sampled: Per-item message, subject to LOG_SAMPLE_RATE and LOG_RATE_LIMIT per actionName.
 
         Returns:
         ---------------------
             None
         """
-
-        # Get the target function for the logging level.
-        if level == 'info':
-            targetFunction = self.logger.logger.info
-        elif level == 'debug':
-            targetFunction = self.logger.logger.debug
-        elif level == 'critical':
-            targetFunction = self.logger.logger.critical
-        elif level == 'warning':
-            targetFunction = self.logger.logger.warning
-        elif level == 'error':
-            targetFunction = self.logger.logger.error
+        levelNumber = self.logLevels[level]
+        # Fast path: disabled levels cost a dict lookup and a level check
+        if not self.logger.logger.isEnabledFor(levelNumber):
+            return
+        if sampled and not self._keepSampled(actionName or customMessage):
+            return
 
         # Compile the message to be logged.
         if customMessage is not None:
-            compiledMessage = customMessage
+            self.logger.logger.log(levelNumber, customMessage, *args)
+        elif args:
+            self.logger.logger.log(levelNumber, '%s: ' + str(state), actionName, *args)
         else:
-            compiledMessage = actionName + ': ' + str(state)
+            self.logger.logger.log(levelNumber, '%s: %s', actionName, state)
+
+    def _keepSampled(self, key):
+        """
+        Decides if a per-item message is logged: one message out of LOG_SAMPLE_RATE,
+        and at most LOG_RATE_LIMIT messages per second for the same action.
+
+        Args:
+        ---------------------
+            key: The action the message belongs to.
+
+        Returns:
+        ---------------------
+            bool: True when the message is logged
+        """
+        with self._sampledLock:
+            counters = self.sampledCounters.get(key)
+            if counters is None:
+                counters = self.sampledCounters[key] = [0, 0, 0, 0]
+            counters[0] += 1
+            if (counters[0] - 1) % self.sampleRate:
+                counters[3] += 1
+                return False
+            if self.rateLimit:
+                second = int(time.monotonic())
+                if second != counters[1]:
+                    counters[1], counters[2] = second, 0
+                if counters[2] >= self.rateLimit:
+                    counters[3] += 1
+                    return False
+                counters[2] += 1
+            return True
 
-        # Log the message.
-        targetFunction(compiledMessage)
+    def close(self):
+        """
+        Logs how many per-item messages were dropped by sampling or rate limiting,
+        then writes the queued messages and closes the log file.
+        """
+        with self._sampledLock:
+            dropped = [(key, counters) for key, counters in self.sampledCounters.items() if counters[3]]
+        for key, counters in dropped:
+            self.logger.logger.info('%s: %d of %d messages not logged (sampling/rate limit).', key, counters[3], counters[0])
+        self.logger.close()
 
-    def constructScrapingList(self, start_date, end_date, query, body, partition):
+    def mapBodyIds(self, body):
+        """
+        Maps the body keywords to the Ids used in the search URL.
+
+        Args:
+        ---------------------
+            body: Body keywords separated by a comma
+
+        Returns:
+        ---------------------
+            bodyIds: Ids separated by a comma
+        """
+        return ','.join(str(self.bodyMap[key]) for key in body.split(',') if key in self.bodyMap.keys())
+
+    def constructScrapingList(self, start_date, end_date, query, body, partition, density=None, targetPages=5):
         """
         This method will take four input parameters that will help construct URLs to be scraped
+        When density is provided the windows are planned adaptively: neighbouring days are merged into one window
+        until the expected results reach targetPages pages, days without observations use the fixed partition.
         
         Args:
         ---------------------
@@ -85,6 +166,8 @@ class HelperFunction():
                 - Workplace Relations Commission: 15376
                 Multiple Keywords can be provided at a time separated by a comma
             partition: Select partitioning of dates in days, Ex: 1 for 1 day, 7 for a week, 30 for a month
+            density: Expected results per day (see buildDayDensity), fixed partitioning when None
+            targetPages: Number of search pages each window should hold when planning adaptively
         Returns:
         ---------------------
             Urls: list of urls constructed dynamically to be used to scrape data
@@ -96,19 +179,14 @@ class HelperFunction():
         oneDayparition = timedelta(days=1)
         partitionCount = 0
 
-        # Separate provided body sequence
-        input_list = body.split(',')
         self.logAction('info', 'Construct Urls', 'Query: ' + str(query) )
         self.logAction('info', 'Construct Urls', 'Body: ' + str(body) )
         self.logAction('info', 'Construct Urls', 'Start Date: ' + str(start_date) )
         self.logAction('info', 'Construct Urls', 'End Date: ' + str(end_date) )
         self.logAction('info', 'Construct Urls', 'Partition: ' + str(partition) + ' days')
 
-        # Map each item in body to its corresponding ID
-        mapped_values = [str(self.bodyMap[key]) for key in input_list if key in self.bodyMap.keys()]
-
-        # Join Ids into one string
-        bodyIds = ','.join(mapped_values)
+        # Map each item in body to its corresponding ID and join Ids into one string
+        bodyIds = self.mapBodyIds(body)
 
         # transform dates for arithemtic reasons
         try:
@@ -139,8 +217,11 @@ class HelperFunction():
         # While the start date is less than the end date
         while currentStartDate < arithmeticEndDate:
             partitionCount += 1
-            # Get current end date based on start date and parition step (days)
-            currentEndDate = currentStartDate + partitionSteps
+            # Get current end date based on start date and parition step (days), or on the expected results
+            if density is not None:
+                currentEndDate = self._adaptivePartitionEnd(currentStartDate, arithmeticEndDate, partition, density, targetPages * self.resultsPerPage)
+            else:
+                currentEndDate = currentStartDate + partitionSteps
             # If we exceeded the end date provide by user, reset to user end date
             if currentEndDate > arithmeticEndDate:
                 currentEndDate = arithmeticEndDate
@@ -161,6 +242,83 @@ class HelperFunction():
         self.logAction('info', 'Construct Urls', f"Finished, {len(urls)} Urls will be used for scraping")
 
         return urls
-        
-     
-    
\ No newline at end of file
+
+    def _adaptivePartitionEnd(self, startDate, endDate, partition, density, targetResults):
+        """
+        Extends a window day by day while its expected results stay within the target.
+        A day without observation counts as a fixed partition share of the target, so unknown
+        ranges fall back to windows of the provided partition.
+
+        Args:
+        ---------------------
+            startDate: first day of the window
+            endDate: last day that can be scraped
+            partition: fixed partition in days
+            density: date -> expected results
+            targetResults: results a window should hold
+
+        Returns:
+        ---------------------
+            windowEndDate: last day of the window
+        """
+        defaultDensity = targetResults / (partition + 1)
+        expected = density.get(startDate, defaultDensity)
+        windowEndDate = startDate
+        while windowEndDate < endDate:
+            nextDay = windowEndDate + timedelta(days=1)
+            nextExpected = expected + density.get(nextDay, defaultDensity)
+            # Small tolerance so that unknown days add up to exactly one fixed partition
+            if nextExpected > targetResults + 1e-9:
+                break
+            expected = nextExpected
+            windowEndDate = nextDay
+        return windowEndDate
+
+    def buildDayDensity(self, observations):
+        """
+        Spreads the result counts read on the first search page of previous windows over their days.
+        The most recent observation of a day wins.
+
+        Args:
+        ---------------------
+            observations: iterable of dicts with from (datetime), to (datetime), count and observedAt
+
+        Returns:
+        ---------------------
+            density: date -> expected results
+        """
+        density = {}
+        for observation in sorted(observations, key=lambda o: o['observedAt']):
+            fromDate = observation['from'].date()
+            days = (observation['to'].date() - fromDate).days + 1
+            if days <= 0:
+                continue
+            for offset in range(days):
+                density[fromDate + timedelta(days=offset)] = observation['count'] / days
+        return density
+
+    def splitScrapingURL(self, url):
+        """
+        Splits the from/to window of a search URL in two halves.
+
+        Args:
+        ---------------------
+            url: search URL built by constructScrapingList
+
+        Returns:
+        ---------------------
+            urls: the URLs of both halves, empty when the window is a single day
+        """
+        date_format = "%d/%m/%Y"
+        fromDate = datetime.strptime(re.search(r'[?&]from=([^&]+)', url).group(1), date_format).date()
+        toDate = datetime.strptime(re.search(r'[?&]to=([^&]+)', url).group(1), date_format).date()
+        if toDate <= fromDate:
+            return []
+        middleDate = fromDate + timedelta(days=(toDate - fromDate).days // 2)
+        halves = [(fromDate, middleDate), (middleDate + timedelta(days=1), toDate)]
+        urls = []
+        for startDate, endDate in halves:
+            halfURL = re.sub(r'(?<=[?&])from=[^&]+', 'from=' + startDate.strftime(date_format), url)
+            halfURL = re.sub(r'(?<=[?&])to=[^&]+', 'to=' + endDate.strftime(date_format), halfURL)
+            urls.append(halfURL)
+        return urls
@@ -0,0 +1,116 @@
+"""
+    Process-wide storage clients shared by every MinioClient and MongoDBClient of the process (spider, pipeline,
+    middlewares, transform), so that connections are pooled once instead of per instance:
+        - one Minio client per endpoint, on a urllib3 pool sized for the number of threads using it. A user asking
+          for a larger pool gets a new client and pool, the live pool of the previous users is never cleared under them
+        - one MongoClient per host with a configured pool size and timeouts, closed when its last user releases it
+        - bucket existence checked once per bucket
+"""
+from minio import Minio
+from pymongo import MongoClient
+from urllib3.util import Retry, Timeout
+import threading
+import urllib3
+import os
+
+_lock = threading.Lock()
+_minioClients = {}
+_knownBuckets = set()
+# host -> [MongoClient, number of MongoDBClient using it]
+_mongoClients = {}
+
+
+def getMinio(poolSize=None):
+    """
+        Shared Minio client of the configured endpoint (MINIO_HOST, MINIO_ACCESS_KEY, MINIO_SECRET_KEY).
+
+    Args:
+    ---------------------
+        poolSize: number of threads that will use the client at the same time (at least MINIO_POOL_SIZE, default 10).
+            When it is larger than the pool of the shared client, a client on a larger pool replaces it for the next
+            callers, the current users keep theirs
+
+    Returns:
+    ---------------------
+        Minio: the shared client
+    """
+    minio_host = os.getenv('MINIO_HOST', 'localhost')
+    access_key = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+    secret_key = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+    poolSize = max(int(os.getenv('MINIO_POOL_SIZE', 10)), poolSize or 0)
+    key = (minio_host, access_key)
+    with _lock:
+        entry = _minioClients.get(key)
+        # Connections of a pool may be checked out by other threads at any time, a pool is never resized in place
+        if entry is None or poolSize > entry[1].connection_pool_kw['maxsize']:
+            timeout = float(os.getenv('MINIO_TIMEOUT', 300))
+            httpClient = urllib3.PoolManager(
+                timeout=Timeout(connect=min(timeout, 10), read=timeout),
+                maxsize=poolSize,
+                retries=Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            )
+            client = Minio(endpoint=f"{minio_host}:9000", access_key=access_key, secret_key=secret_key, secure=False, http_client=httpClient)
+            entry = _minioClients[key] = (client, httpClient)
+    return entry[0]
+
+
+def ensureBucket(client, bucketName):
+    """
+        Creates the bucket if it does not exist, checked once per process and bucket.
+
+    Args:
+    ---------------------
+        client: the Minio client
+        bucketName: the bucket
+    """
+    if bucketName in _knownBuckets:
+        return
+    if not client.bucket_exists(bucketName):
+        client.make_bucket(bucketName)
+    _knownBuckets.add(bucketName)
+
+
+def acquireMongo():
+    """
+        Shared MongoClient of MONGO_HOST, to be released with releaseMongo.
+        Pool and timeouts: MONGO_MAX_POOL_SIZE (default 32), MONGO_CONNECT_TIMEOUT_MS (5000),
+        MONGO_SERVER_SELECTION_TIMEOUT_MS (10000), MONGO_SOCKET_TIMEOUT_MS (60000).
+
+    Returns:
+    ---------------------
+        MongoClient: the shared client
+    """
+    mongo_host = os.getenv('MONGO_HOST', 'localhost')
+    with _lock:
+        entry = _mongoClients.get(mongo_host)
+        if entry is None:
+            client = MongoClient(
+                f"mongodb://{mongo_host}:27017",
+                maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 32)),
+                connectTimeoutMS=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+                serverSelectionTimeoutMS=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000)),
+                socketTimeoutMS=int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 60000)),
+            )
+            entry = _mongoClients[mongo_host] = [client, 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def releaseMongo(client):
+    """
+        Releases a client returned by acquireMongo, the connections are closed with its last user.
+
+    Args:
+    ---------------------
+        client: the MongoClient
+    """
+    with _lock:
+        for host, entry in list(_mongoClients.items()):
+            if entry[0] is client:
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del _mongoClients[host]
+                    client.close()
+                return
+    # Not a shared client
+    client.close()
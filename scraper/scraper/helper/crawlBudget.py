@@ -0,0 +1,108 @@
+from twisted.internet import defer
+
+
+class CrawlBudget:
+    """
+        Memory budget of a crawl: bytes of content and number of items held by the pipeline.
+        ScraperPipeline takes items in and releases them once stored, BudgetDownloaderMiddleware makes document
+        requests wait while the budget is exhausted, so downloads do not outrun storage.
+        A document request let through reserves one item, counted at the average size of the items taken so far,
+        until its response arrives: released room is handed to as many waiting requests as it can hold, not all of them.
+        Used from the reactor thread only (pipeline Deferreds fire there).
+    """
+
+    def __init__(self, maxBytes=0, maxItems=0):
+        """
+        Args:
+        ---------------------
+            maxBytes: content bytes the pipeline may hold (MAX_INFLIGHT_BYTES), 0 for no limit
+            maxItems: items the pipeline may hold (MAX_PENDING_ITEMS), 0 for no limit
+        """
+        self.maxBytes = maxBytes
+        self.maxItems = maxItems
+        self.inflightBytes = 0
+        self.pendingItems = 0
+        # Document requests let through whose response did not arrive yet
+        self.reservedItems = 0
+        # Items and bytes taken since the start, for the average size of a reservation
+        self.takenItems = 0
+        self.takenBytes = 0
+        self.waiters = []
+
+    @classmethod
+    def fromCrawler(cls, crawler):
+        """
+        Budget of the crawler, shared by the pipeline and the middleware that both ask for it.
+
+        Args:
+        ---------------------
+            crawler: the crawler running the spider
+        """
+        budget = getattr(crawler, 'crawlBudget', None)
+        if budget is None:
+            budget = crawler.crawlBudget = cls(crawler.settings.getint('MAX_INFLIGHT_BYTES', 0), crawler.settings.getint('MAX_PENDING_ITEMS', 0))
+        return budget
+
+    @property
+    def enabled(self):
+        return bool(self.maxBytes or self.maxItems)
+
+    def exhausted(self):
+        """
+        Whether the pipeline holds, or the reserved downloads will bring it, as many bytes or items as allowed.
+        """
+        reservedBytes = self.reservedItems * self.takenBytes / self.takenItems if self.takenItems else 0
+        return (0 < self.maxBytes <= self.inflightBytes + reservedBytes) or (0 < self.maxItems <= self.pendingItems + self.reservedItems)
+
+    def take(self, size):
+        """
+        Counts an item entering the pipeline.
+
+        Args:
+        ---------------------
+            size: bytes of its content
+        """
+        self.inflightBytes += size
+        self.pendingItems += 1
+        self.takenItems += 1
+        self.takenBytes += size
+
+    def release(self, size):
+        """
+        Counts an item leaving the pipeline, and lets waiting requests go as far as the budget allows.
+
+        Args:
+        ---------------------
+            size: bytes of its content
+        """
+        self.inflightBytes -= size
+        self.pendingItems -= 1
+        self._wake()
+
+    def reserve(self):
+        """
+        Deferred firing once the budget has room for one more document download, right away when it has.
+        The download then holds a reservation until settle is called.
+        """
+        # Requests arriving while others wait queue behind them
+        if not self.waiters and not self.exhausted():
+            self.reservedItems += 1
+            return defer.succeed(None)
+        waiter = defer.Deferred()
+        self.waiters.append(waiter)
+        return waiter
+
+    def settle(self):
+        """
+        Ends the reservation of a download whose response arrived (its item is then taken by the pipeline) or failed.
+        """
+        self.reservedItems -= 1
+        self._wake()
+
+    def _wake(self):
+        """
+        Lets the waiting requests go one at a time, each reserving its item, while the budget has room.
+        """
+        while self.waiters and not self.exhausted():
+            self.reservedItems += 1
+            self.waiters.pop(0).callback(None)
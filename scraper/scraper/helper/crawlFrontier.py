@@ -0,0 +1,255 @@
+from scraper.items import ScraperItem
+from scrapy import Request
+from datetime import datetime, timedelta
+import hashlib
+import json
+
+
+class CrawlFrontier:
+    """
+        Persistent request frontier of a crawl, kept in the crawl_frontier collection so that a crawl stopped partway
+        resumes where it stopped when it is started again with the same arguments.
+
+        Documents of a run (runKey hashed from the spider arguments):
+            kind run       -> planned start URLs, startedAt
+            kind request   -> one per request (fingerprint, url, callback, meta, headers, priority, partition),
+                              addedAt when yielded, doneAt once its response was parsed and its items stored,
+                              failedAt and error when it failed (download, HTTP status, callback or pipeline error)
+            kind partition -> completedAt once every request of a partition (start URL) was parsed
+        Requests are recorded by FrontierSpiderMiddleware. Writes are buffered: a crash loses the updates not written
+        yet, at most MONGO_BULK_SIZE of them or the last MONGO_BULK_INTERVAL seconds (the client's flush timer writes
+        a quiet buffer), whose requests are fetched again on resume.
+        A failed request is no longer pending for the run, so a run left with failures only is still completed.
+        A run interrupted before it finished requests its failed requests again on resume.
+        The documents of a run are deleted once it completed, and the ones of runs started more than maxAgeDays ago
+        and never resumed (ex: scheduled crawls, whose windows shift every day) when a crawl starts.
+        The pending and done marks are separate fields ($set of addedAt / doneAt) so the unordered bulk writes can
+        apply them in any order.
+    """
+    collectionName = 'crawl_frontier'
+    # Request meta kept to rebuild a pending request, item is converted back to a ScraperItem.
+    # A conditional request keeps its validators and lets a 304 through, as its If-None-Match/If-Modified-Since headers are kept
+    metaKeys = ('partition_date', 'pageNumber', 'fanOut', 'item', 'validators', 'handle_httpstatus_list')
+
+    def __init__(self, mongoClient, runKey, maxAgeDays=30):
+        """
+        Args:
+        ---------------------
+            mongoClient: MongoDBClient used to read and buffer the frontier
+            runKey: key of the crawl, see runKeyOf
+            maxAgeDays: days after which an unfinished run is abandoned and deleted (FRONTIER_MAX_AGE_DAYS), 0 to keep them
+        """
+        self.mongoClient = mongoClient
+        self.runKey = runKey
+        self.maxAgeDays = maxAgeDays
+        self.mongoClient.ensureIndexes(self.collectionName)
+        # fingerprint -> partition of the requests recorded and not parsed yet
+        self.pending = {}
+        # partition -> number of its requests not parsed yet
+        self.outstanding = {}
+        self.done = set()
+        # fingerprint -> (url, error) of the requests failed during this run
+        self.failed = {}
+        self.completedPartitions = set()
+        # Partitions holding a failed request, never marked completed
+        self.failedPartitions = set()
+        self.resumed = False
+        # Number of buffered updates that could not be written
+        self.writeFailures = 0
+
+    @staticmethod
+    def runKeyOf(spiderName, **arguments):
+        """
+        Key of a crawl, identical for crawls started with the same arguments.
+
+        Args:
+        ---------------------
+            spiderName: name of the spider
+            arguments: the spider arguments defining the crawl
+        """
+        payload = json.dumps({'spider': spiderName, **arguments}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def load(self):
+        """
+        Loads the state of an unfinished previous run with the same key, after deleting the abandoned runs.
+        A previous run marked completed (before runs were deleted on completion) is cleared so that the crawl starts over.
+
+        Returns:
+        ---------------------
+            list: the documents of the pending requests to request again
+        """
+        if self.maxAgeDays:
+            cutoff = datetime.utcnow() - timedelta(days=self.maxAgeDays)
+            abandoned = [run['runKey'] for run in self.mongoClient.findItems(self.collectionName, {'kind': 'run', 'startedAt': {'$lte': cutoff}}, {'_id': 0, 'runKey': 1})]
+            if abandoned:
+                self.mongoClient.deleteItems(self.collectionName, {'runKey': {'$in': abandoned}})
+        run = next(iter(self.mongoClient.findItems(self.collectionName, {'runKey': self.runKey, 'kind': 'run'}, {'_id': 0})), None)
+        if run is None or run.get('completedAt'):
+            self.mongoClient.deleteItems(self.collectionName, {'runKey': self.runKey})
+            return []
+        self.resumed = True
+        pendingDocuments = []
+        for document in self.mongoClient.findItems(self.collectionName, {'runKey': self.runKey, 'kind': {'$in': ['request', 'partition']}}, {'_id': 0}):
+            if document['kind'] == 'partition':
+                if document.get('completedAt'):
+                    self.completedPartitions.add(document['partition'])
+            elif document.get('doneAt'):
+                self.done.add(document['fingerprint'])
+            else:
+                pendingDocuments.append(document)
+        for document in pendingDocuments:
+            self._track(document['fingerprint'], document['partition'])
+        return pendingDocuments
+
+    def plan(self, urls):
+        """
+        Start URLs of the run: the ones planned by the run being resumed, or the given ones for a new run.
+
+        Args:
+        ---------------------
+            urls: start URLs built for this crawl
+        """
+        if self.resumed:
+            run = next(iter(self.mongoClient.findItems(self.collectionName, {'runKey': self.runKey, 'kind': 'run'}, {'_id': 0, 'urls': 1})), {})
+            if run.get('urls'):
+                return run['urls']
+        self.mongoClient.upsertItem(self.collectionName, {'runKey': self.runKey, 'kind': 'run'},
+                                    {'runKey': self.runKey, 'kind': 'run', 'urls': list(urls), 'startedAt': datetime.utcnow()})
+        return urls
+
+    def isKnown(self, fingerprint):
+        """
+        Whether a request was already recorded by this run (pending or parsed).
+
+        Args:
+        ---------------------
+            fingerprint: request fingerprint (hex)
+        """
+        return fingerprint in self.done or fingerprint in self.pending
+
+    def add(self, request, fingerprint, partition):
+        """
+        Records a pending request.
+
+        Args:
+        ---------------------
+            request: the request yielded
+            fingerprint: its fingerprint (hex)
+            partition: the partition (start URL) it belongs to
+        """
+        if self.isKnown(fingerprint):
+            return
+        self._track(fingerprint, partition)
+        meta = {key: request.meta[key] for key in self.metaKeys if key in request.meta}
+        if 'item' in meta:
+            meta['item'] = dict(meta['item'])
+        document = {
+            'runKey': self.runKey,
+            'kind': 'request',
+            'fingerprint': fingerprint,
+            'url': request.url,
+            'callback': request.callback.__name__ if request.callback else 'parse',
+            'meta': meta,
+            'headers': {key.decode(): value[0].decode() for key, value in request.headers.items() if value},
+            'priority': request.priority,
+            'partition': partition,
+            'addedAt': datetime.utcnow(),
+        }
+        self._write({'runKey': self.runKey, 'fingerprint': fingerprint}, document)
+
+    def complete(self, fingerprint):
+        """
+        Marks a request as parsed, and its partition as completed when it was the last one pending.
+
+        Args:
+        ---------------------
+            fingerprint: request fingerprint (hex)
+        """
+        partition = self.pending.pop(fingerprint, None)
+        if partition is None:
+            return
+        self.done.add(fingerprint)
+        self._write({'runKey': self.runKey, 'fingerprint': fingerprint}, {'doneAt': datetime.utcnow()})
+        self._resolve(partition)
+
+    def fail(self, fingerprint, url, error):
+        """
+        Marks a request as failed, it is not pending anymore for this run.
+
+        Args:
+        ---------------------
+            fingerprint: request fingerprint (hex)
+            url: the URL requested, reported on close
+            error: the error message
+        """
+        partition = self.pending.pop(fingerprint, None)
+        if partition is None:
+            return
+        self.failed[fingerprint] = (url, error)
+        self.failedPartitions.add(partition)
+        self._write({'runKey': self.runKey, 'fingerprint': fingerprint}, {'failedAt': datetime.utcnow(), 'error': error})
+        self._resolve(partition)
+
+    def toRequest(self, document, spider):
+        """
+        Rebuilds a pending request recorded by a previous run.
+
+        Args:
+        ---------------------
+            document: the request document
+            spider: the spider holding the callback
+        """
+        meta = dict(document.get('meta', {}))
+        if 'item' in meta:
+            meta['item'] = ScraperItem(**meta['item'])
+        meta['frontierPartition'] = document['partition']
+        return Request(url=document['url'], callback=getattr(spider, document['callback']), meta=meta,
+                       headers=document.get('headers'), priority=document.get('priority', 0))
+
+    def close(self, finished):
+        """
+        Writes the buffered updates, and deletes the documents of the run when it finished with nothing pending
+        (failed requests are not pending), the next crawl with the same arguments starting over.
+
+        Args:
+        ---------------------
+            finished: whether the crawl finished normally
+
+        Returns:
+        ---------------------
+            int: number of frontier updates that could not be written during the run
+        """
+        # Written before a delete, a buffered update would otherwise recreate documents of the completed run
+        self.writeFailures += len(self.mongoClient.flush(self.collectionName))
+        if finished and not self.pending:
+            self.mongoClient.deleteItems(self.collectionName, {'runKey': self.runKey})
+        return self.writeFailures
+
+    def _track(self, fingerprint, partition):
+        """
+        Counts a pending request in its partition.
+        """
+        self.pending[fingerprint] = partition
+        self.outstanding[partition] = self.outstanding.get(partition, 0) + 1
+
+    def _resolve(self, partition):
+        """
+        Counts a request of a partition as parsed or failed, and marks the partition completed when it was the last
+        one pending and none of its requests failed.
+        """
+        self.outstanding[partition] -= 1
+        if self.outstanding[partition] == 0:
+            del self.outstanding[partition]
+            if partition in self.failedPartitions:
+                return
+            self.completedPartitions.add(partition)
+            self._write({'runKey': self.runKey, 'kind': 'partition', 'partition': partition},
+                        {'runKey': self.runKey, 'kind': 'partition', 'partition': partition, 'completedAt': datetime.utcnow()})
+
+    def _write(self, filterQuery, document):
+        """
+        Buffers an update of the frontier.
+        """
+        # A lost update only means the request is fetched again on resume, failures are counted and reported on close
+        self.writeFailures += len(self.mongoClient.bufferUpsert(self.collectionName, filterQuery, document))
@@ -0,0 +1,132 @@
+from scraper.helper.minioClient import MinioClient
+from scrapy.http.headers import Headers
+from scrapy.responsetypes import responsetypes
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
+import pickle
+import time
+
+
+class MinioCacheStorage:
+    """
+        Scrapy HTTP cache storage (HTTPCACHE_STORAGE) keeping the responses in a MinIO bucket instead of the local disk,
+        so that every crawler and machine shares the same cache.
+        Each response is one object {spider}/{fingerprint[:2]}/{fingerprint} holding the pickled response.
+
+        Entries expire per URL class:
+            search pages of recent partitions (from date in the last HTTPCACHE_RECENT_DAYS) -> HTTPCACHE_TTL_SEARCH_RECENT
+            older search pages -> HTTPCACHE_TTL_SEARCH
+            decision pages and attachments -> HTTPCACHE_TTL_DOCUMENT
+        A TTL of 0 never expires. In replay mode (HTTPCACHE_REPLAY) nothing expires, and with HTTPCACHE_IGNORE_MISSING
+        requests missing from the cache are dropped instead of downloaded.
+    """
+
+    def __init__(self, settings):
+        """
+        Args:
+        ---------------------
+            settings: the crawler settings
+        """
+        self.bucketName = settings.get('HTTPCACHE_MINIO_BUCKET', 'httpcache')
+        self.recentDays = settings.getint('HTTPCACHE_RECENT_DAYS', 30)
+        self.ttls = {
+            'searchRecent': settings.getint('HTTPCACHE_TTL_SEARCH_RECENT', 6 * 3600),
+            'search': settings.getint('HTTPCACHE_TTL_SEARCH', 30 * 24 * 3600),
+            'document': settings.getint('HTTPCACHE_TTL_DOCUMENT', 0),
+        }
+        self.replay = settings.getbool('HTTPCACHE_REPLAY', False)
+        self.useGzip = settings.getbool('HTTPCACHE_GZIP', False)
+        self.minioClient = None
+
+    def open_spider(self, spider):
+        """
+        Connects to the cache bucket. (From Docs)
+
+        Args:
+        ---------------------
+            spider: the spider opened
+        """
+        # HTTPCACHE_GZIP compresses the cached responses, decompressed by MinioClient on download
+        self.minioClient = MinioClient(bucketName=self.bucketName, compression='gzip' if self.useGzip else '')
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        spider.logger.debug(f'Using MinIO cache storage in bucket {self.bucketName}')
+
+    def close_spider(self, spider):
+        pass
+
+    def retrieve_response(self, spider, request):
+        """
+        Returns the cached response of the request, or None when it is missing or expired. (From Docs)
+
+        Args:
+        ---------------------
+            spider: the spider running
+            request: the request about to be downloaded
+        """
+        cached = self.minioClient.downloadIfExists(self._objectPath(spider, request))
+        if cached is None:
+            return None
+        rawContent, metadata = cached
+        timestamp = float(metadata.get('cached-at', 0))
+        ttl = self.ttls[self._urlClass(request.url)]
+        if not self.replay and 0 < ttl < time.time() - timestamp:
+            return None
+        data = pickle.loads(rawContent)
+        headers = Headers(data['headers'])
+        responseClass = responsetypes.from_args(headers=headers, url=data['url'], body=data['body'])
+        request.meta['cache_timestamp'] = timestamp
+        return responseClass(url=data['url'], status=data['status'], headers=headers, body=data['body'], request=request)
+
+    def store_response(self, spider, request, response):
+        """
+        Stores the response of the request. (From Docs)
+
+        Args:
+        ---------------------
+            spider: the spider running
+            request: the downloaded request
+            response: its response
+        """
+        data = {
+            'url': response.url,
+            'status': response.status,
+            'headers': dict(response.headers),
+            'body': response.body,
+            'requestUrl': request.url,
+        }
+        rawContent = pickle.dumps(data, protocol=4)
+        metadata = {'cached-at': str(time.time()), 'url-class': self._urlClass(request.url)}
+        self.minioClient.upload(objectPath=self._objectPath(spider, request), raw_content=rawContent, metadata=metadata, compress=True)
+
+    def _objectPath(self, spider, request):
+        """
+        Object path of the request in the cache bucket, from the request fingerprint.
+
+        Args:
+        ---------------------
+            spider: the spider running
+            request: the request
+        """
+        key = self.fingerprinter.fingerprint(request).hex()
+        return f'{spider.name}/{key[:2]}/{key}'
+
+    def _urlClass(self, url):
+        """
+        Class of the URL deciding the TTL of its cached response: searchRecent, search or document.
+
+        Args:
+        ---------------------
+            url: the request URL
+        """
+        parsed = urlparse(url)
+        if '/search/' not in parsed.path:
+            return 'document'
+        params = parse_qs(parsed.query)
+        try:
+            partitionStart = datetime.strptime(params['from'][0], '%d/%m/%Y')
+        except (KeyError, IndexError, ValueError):
+            # No readable window, treated as recent so it is refreshed
+            return 'searchRecent'
+        if partitionStart >= datetime.now() - timedelta(days=self.recentDays):
+            return 'searchRecent'
+        return 'search'
@@ -1,32 +1,70 @@
-from minio import Minio
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+from scraper.exception.Exception import InvalidOperation
+from scraper.helper import clientFactory
 from io import BytesIO
+import gzip
 import os
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _zstdCompress(rawContent):
+    return zstandard.ZstdCompressor(level=3).compress(rawContent)
+
+
+def _zstdDecompress(rawContent):
+    return zstandard.ZstdDecompressor().decompress(rawContent)
+
+
+def _gzipCompress(rawContent):
+    # mtime=0 keeps the compressed bytes identical for identical content
+    return gzip.compress(rawContent, compresslevel=6, mtime=0)
+
+
+# codec name -> (compress, decompress), the name is stored in the codec metadata of compressed objects
+codecs = {
+    'gzip': (_gzipCompress, gzip.decompress),
+    'zstd': (_zstdCompress, _zstdDecompress),
+}
+
 class MinioClient:
     """
         MinIO will be used as the object storage location. 
         This class will help connect to it and upload files.
+        Uploads asked to be compressed are stored with the codec of MINIO_COMPRESSION (gzip or zstd, none by default),
+        with the codec and the original size in the object metadata. Downloads decompress them transparently.
 
     """
 
-    def __init__(self, bucketName='landing'):
+    def __init__(self, bucketName='landing', compression=None, poolSize=None):
         """
             Connect to MinIO service running in Docker or locally.
             The below details in connection are the same as the one defined in docker-compose.yaml
-            
+
+        Args:
+        ---------------------
+            bucketName: bucket the objects are stored in
+            compression: codec of the compressed uploads, MINIO_COMPRESSION when None (empty: no compression)
+            poolSize: number of threads using the client at the same time (sizes the shared connection pool)
         """
-        minio_host = os.getenv('MINIO_HOST', 'localhost')
-        access_key = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
-        secret_key = os.getenv("MINIO_SECRET_KEY", "minioadmin")
-        self.client = Minio(endpoint=f"{minio_host}:9000", access_key= access_key, secret_key= secret_key, secure=False)
+        # Every instance of the process shares one client and connection pool (see clientFactory)
+        self.client = clientFactory.getMinio(poolSize)
         # Landing is the location of file we create in.
         self.bucket_name = bucketName
+        self.compression = (os.getenv('MINIO_COMPRESSION', '') if compression is None else compression).strip().lower() or None
+        if self.compression is not None and self.compression not in codecs:
+            raise InvalidOperation(f'Unknown MINIO_COMPRESSION {self.compression}, expected one of {", ".join(codecs)}')
+        if self.compression == 'zstd' and zstandard is None:
+            raise InvalidOperation('MINIO_COMPRESSION=zstd requires the zstandard package')
     
-        # Create bucket if it does not exist
-        if not self.client.bucket_exists(self.bucket_name):
-            self.client.make_bucket(self.bucket_name)
+        # Create bucket if it does not exist (checked once per process)
+        clientFactory.ensureBucket(self.client, self.bucket_name)
 
-    def upload(self, objectPath, raw_content):
+    def upload(self, objectPath, raw_content, metadata=None, compress=False):
         """
             This method uploads files to minio  
 
@@ -34,22 +72,68 @@ class MinioClient:
         ---------------------
             objectPath: path of the file to be uploaded to bucket
             raw_content: raw file bytes
+            metadata: user metadata stored with the object (dict of str)
+            compress: compress the content with the configured codec (ignored when compression is off)
 
         Returns:
         ---------------------
             Path stored in MinIO (bucket/objectPath)
         """
+        if compress and self.compression is not None:
+            metadata = dict(metadata or {}, codec=self.compression, **{'original-size': str(len(raw_content))})
+            raw_content = codecs[self.compression][0](raw_content)
         # treansform raw binary content into a file like object 
+        # (BytesIO shares the buffer of a bytes object instead of copying it)
         data = BytesIO(raw_content)
 
-        self.client.put_object(bucket_name=self.bucket_name, object_name=objectPath, data=data, length=len(raw_content), content_type="application/octet-stream")
+        self.client.put_object(bucket_name=self.bucket_name, object_name=objectPath, data=data, length=len(raw_content),
+                               content_type="application/octet-stream", metadata=metadata)
 
         # This is what you store in MongoDB as filePath
         return f"{self.bucket_name}/{objectPath}"
     
+    def uploadStream(self, objectPath, stream, length, partSize=16 * 1024 * 1024):
+        """
+            This method uploads a file like object to minio without reading it in memory,
+            objects larger than partSize are sent as a multipart upload
+
+        Args:
+        ---------------------
+            objectPath: path of the file to be uploaded to bucket
+            stream: file like object positioned at the start of the content
+            length: size of the content in bytes
+            partSize: size of each part of the multipart upload in bytes (at least 5 MiB)
+
+        Returns:
+        ---------------------
+            Path stored in MinIO (bucket/objectPath)
+        """
+        self.client.put_object(bucket_name=self.bucket_name, object_name=objectPath, data=stream, length=length,
+                               part_size=partSize, content_type="application/octet-stream")
+
+        return f"{self.bucket_name}/{objectPath}"
+
+    def copyFrom(self, sourceBucket, sourceObjectPath, objectPath):
+        """
+            This method copies an object from another bucket server side, the content never leaves MinIO
+
+        Args:
+        ---------------------
+            sourceBucket: bucket of the object to copy
+            sourceObjectPath: path of the object to copy in its bucket
+            objectPath: path of the copy in this bucket
+
+        Returns:
+        ---------------------
+            Path stored in MinIO (bucket/objectPath)
+        """
+        self.client.copy_object(bucket_name=self.bucket_name, object_name=objectPath, source=CopySource(sourceBucket, sourceObjectPath))
+
+        return f"{self.bucket_name}/{objectPath}"
+
     def download(self, objectPath):
         """
-            This method downloads files from minio  
+            This method downloads files from minio, decompressing the compressed ones
 
         Args:
         ---------------------
@@ -61,7 +145,64 @@ class MinioClient:
         """
         response = self.client.get_object(bucket_name=self.bucket_name, object_name=objectPath)
 
-        rawContent = response.read()
-        response.close()
-        response.release_conn()
+        try:
+            rawContent = self._decode(response.read(), self._userMetadata(response))
+        finally:
+            response.close()
+            response.release_conn()
         return rawContent
+
+    def downloadIfExists(self, objectPath):
+        """
+            This method downloads a file that may not exist, with the user metadata it was uploaded with,
+            decompressing it when it was compressed
+
+        Args:
+        ---------------------
+            objectPath: path of the file to be downloaded from bucket
+
+        Returns:
+        ---------------------
+            (rawContent, metadata): raw file bytes and user metadata (lower case keys without the x-amz-meta- prefix),
+            or None when the object does not exist
+        """
+        try:
+            response = self.client.get_object(bucket_name=self.bucket_name, object_name=objectPath)
+        except S3Error as e:
+            if e.code == 'NoSuchKey':
+                return None
+            raise
+        try:
+            metadata = self._userMetadata(response)
+            rawContent = self._decode(response.read(), metadata)
+        finally:
+            response.close()
+            response.release_conn()
+        return rawContent, metadata
+
+    def _userMetadata(self, response):
+        """
+            User metadata of a downloaded object: lower case keys without the x-amz-meta- prefix
+
+        Args:
+        ---------------------
+            response: the get_object response
+        """
+        return {key.lower()[len('x-amz-meta-'):]: value for key, value in response.headers.items()
+                if key.lower().startswith('x-amz-meta-')}
+
+    def _decode(self, rawContent, metadata):
+        """
+            Decompresses the content of an object uploaded compressed, other objects are returned as is
+
+        Args:
+        ---------------------
+            rawContent: the stored bytes
+            metadata: the user metadata of the object
+        """
+        codec = metadata.get('codec')
+        if codec is None:
+            return rawContent
+        if codec not in codecs or (codec == 'zstd' and zstandard is None):
+            raise InvalidOperation(f'Can not decompress object stored with codec {codec}')
+        return codecs[codec][1](rawContent)
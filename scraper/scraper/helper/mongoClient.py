@@ -1,23 +1,62 @@
-from pymongo import MongoClient
+from pymongo import UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
+from scraper.helper import clientFactory
+import threading
+import time
 import os
 
 class MongoDBClient:
     """
         Mongo will be used as the metadata storage location. 
         This class will help connect to it, upsert metadata, and select data.
+        Upserts can either be sent one by one (upsertItem) or buffered per collection (bufferUpsert)
+        and sent as unordered bulk_write batches once the batch size or the flush interval is reached.
+        The flush interval is enforced by a daemon timer thread, so a buffer that goes quiet is still written on time.
 
     """
-    def __init__(self, db_name='Workplacerelation_metadata'):
+    # Indexes managed per collection, created by ensureIndexes
+    indexes = {
+        'lnd_documents_metadata': [[('Id', ASCENDING)], [('decisionDate', ASCENDING)]],
+        'stg_documents_metadata': [[('Id', ASCENDING)], [('decisionDate', ASCENDING)], [('duplicateCluster', ASCENDING)]],
+        'transform_retry': [[('Id', ASCENDING)]],
+        'crawl_frontier': [[('runKey', ASCENDING), ('fingerprint', ASCENDING)], [('runKey', ASCENDING), ('kind', ASCENDING)]],
+        'near_duplicates': [[('Id', ASCENDING)], [('bandKeys', ASCENDING)], [('cluster', ASCENDING)]],
+        'document_validators': [[('Id', ASCENDING), ('documentURL', ASCENDING)]],
+    }
+
+    def __init__(self, db_name='Workplacerelation_metadata', batchSize=None, flushInterval=None):
         """
             Connect to MongoDB service running in Docker.
             The below details in connection are the same as the one defined in docker-compose.yaml
+
+        Args:
+            db_name: The name of the database to use.
+            batchSize: Number of buffered upserts that triggers a bulk write (MONGO_BULK_SIZE, default 500).
+            flushInterval: Seconds after which buffered upserts are written even if the batch is not full
+                (MONGO_BULK_INTERVAL, default 5).
         """
         # The below was added to allow the dubugging of the scrapy module from the terminal
         # and at the same time run it from docker. 
         # The scraper will become enviornment aware
-        mongo_host = os.getenv('MONGO_HOST', 'localhost')
-        self.client = MongoClient(f"mongodb://{mongo_host}:27017")
+        # Every instance of the process shares one MongoClient and its connection pool (see clientFactory)
+        self.client = clientFactory.acquireMongo()
         self.db = self.client[db_name]
+        # Buffered upserts per collection: collectionName -> list of (filterQuery, UpdateOne)
+        self.batchSize = int(batchSize or os.getenv('MONGO_BULK_SIZE', 500))
+        self.flushInterval = float(flushInterval or os.getenv('MONGO_BULK_INTERVAL', 5))
+        self._buffers = {}
+        self._bufferStart = {}
+        # Items can be buffered from several pipeline threads at once
+        self._bufferLock = threading.Lock()
+        # Failures of the batches written by the timer, returned by the next bufferUpsert or flush of their collection
+        self._timerFailures = {}
+        # Callables run before every bulk write of a collection (see beforeWrite)
+        self._beforeWrite = {}
+        # Started with the first buffered upsert, stopped by close
+        self._timer = None
+        self._timerStop = threading.Event()
+        # Held by the timer while it writes a batch, so that flush returns the failures of that batch too
+        self._timerBusy = threading.Lock()
 
     def getCollection(self, collectionName):
         """
@@ -50,19 +89,222 @@ class MongoDBClient:
         # Upsert metadata to make sure than when scraping there are no duplicate values in the database
         collection.update_one(filterQuery, {'$set': dict(item)}, upsert=True)
 
-    def findItems(self, collectionName):
+    def bufferUpsert(self, collectionName, filterQuery, item):
+        """
+        Buffers an upsert for the specified collection. The buffer of the collection is written
+        as one unordered bulk_write when it holds batchSize operations, or by the timer thread once
+        flushInterval seconds passed since its first operation.
+
+        Args:
+            collectionName: The name of the collection to upsert the item into.
+            filterQuery: The filter query to find the item to upsert.
+            item: The item to upsert.
+
+        Returns:
+            list: The failures of the batch written by this call and of the batches of the collection
+                written by the timer since the previous call, if any (see flush).
+        """
+        operation = UpdateOne(filterQuery, {'$set': dict(item)}, upsert=True)
+        with self._bufferLock:
+            if self._timer is None:
+                self._startTimer()
+            failures = self._timerFailures.pop(collectionName, [])
+            buffer = self._buffers.setdefault(collectionName, [])
+            if not buffer:
+                self._bufferStart[collectionName] = time.monotonic()
+            buffer.append((filterQuery, operation))
+            if len(buffer) < self.batchSize:
+                return failures
+            batch = self._buffers.pop(collectionName)
+        return failures + self._writeBatch(collectionName, batch)
+
+    def flush(self, collectionName=None):
+        """
+        Writes whatever is left in the buffers.
+
+        Args:
+            collectionName: Only flush the buffer of this collection, all buffers are flushed when None.
+
+        Returns:
+            list: One dict per failed upsert with the keys Id (taken from the filter query) and error.
+        """
+        with self._timerBusy, self._bufferLock:
+            names = [collectionName] if collectionName is not None else list(set(self._buffers) | set(self._timerFailures))
+            batches = [(name, self._buffers.pop(name)) for name in names if self._buffers.get(name)]
+            failures = [failure for name in names for failure in self._timerFailures.pop(name, [])]
+        for name, batch in batches:
+            failures.extend(self._writeBatch(name, batch))
+        return failures
+
+    def beforeWrite(self, collectionName, callback):
+        """
+        Registers a callable run before every bulk write of the buffer of a collection, ex: to write the buffer
+        of another client first when the writes of this collection must never land before it.
+
+        Args:
+            collectionName: The name of the collection whose writes wait for the callable.
+            callback: Callable without arguments, run on the thread writing the batch (possibly the timer).
+
+        Returns:
+            None
+        """
+        self._beforeWrite.setdefault(collectionName, []).append(callback)
+
+    def _startTimer(self):
+        """
+        Starts the daemon thread writing the buffers whose flushInterval expired. Called with the buffer lock held.
+        """
+        self._timer = threading.Thread(target=self._flushExpired, name='MongoDBClientFlush', daemon=True)
+        self._timer.start()
+
+    def _flushExpired(self):
+        """
+        Timer thread: every fraction of flushInterval, writes the buffers whose first operation is older than
+        flushInterval and keeps their failures for the next bufferUpsert or flush of their collection.
+        """
+        while not self._timerStop.wait(max(min(self.flushInterval / 4, 1.0), 0.05)):
+            with self._timerBusy:
+                now = time.monotonic()
+                with self._bufferLock:
+                    expired = [name for name, buffer in self._buffers.items()
+                               if buffer and now - self._bufferStart[name] >= self.flushInterval]
+                    batches = [(name, self._buffers.pop(name)) for name in expired]
+                for name, batch in batches:
+                    failures = self._writeBatch(name, batch)
+                    if failures:
+                        with self._bufferLock:
+                            self._timerFailures.setdefault(name, []).extend(failures)
+
+    def _writeBatch(self, collectionName, batch):
         """
-        Finds items in the specified collection within the given date range.
+        Sends a batch of buffered upserts as one unordered bulk_write.
+        Unordered so that a single failing document does not stop the rest of the batch.
+
+        Args:
+            collectionName: The name of the collection the batch belongs to.
+            batch: list of (filterQuery, UpdateOne)
+
+        Returns:
+            list: One dict per failed upsert with the keys Id and error.
+        """
+        for callback in self._beforeWrite.get(collectionName, ()):
+            callback()
+        collection = self.getCollection(collectionName)
+        try:
+            collection.bulk_write([operation for _, operation in batch], ordered=False)
+        except BulkWriteError as e:
+            # writeErrors hold the index of the failing operation within the batch
+            return [
+                {'Id': batch[error['index']][0].get('Id'), 'error': error.get('errmsg')}
+                for error in e.details.get('writeErrors', [])
+            ]
+        except PyMongoError as e:
+            # Nothing can be said about individual documents, the whole batch is reported
+            return [{'Id': filterQuery.get('Id'), 'error': str(e)} for filterQuery, _ in batch]
+        return []
+
+    def updateItems(self, collectionName, filterQuery, fields):
+        """
+        Sets fields on every item matching the filter in the specified collection.
+
+        Args:
+            collectionName: The name of the collection to update.
+            filterQuery: The filter query the items have to match.
+            fields: The fields to set.
+
+        Returns:
+            int: The number of items modified.
+        """
+        return self.getCollection(collectionName).update_many(filterQuery, {'$set': dict(fields)}).modified_count
+
+    def ensureIndexes(self, collectionName):
+        """
+        Creates the indexes managed for the collection (no-op when they already exist).
+
+        Args:
+            collectionName: The name of the collection to index.
+
+        Returns:
+            None
+        """
+        collection = self.getCollection(collectionName)
+        for keys in self.indexes.get(collectionName, []):
+            collection.create_index(keys)
+
+    def findItems(self, collectionName, filterQuery=None, projection=None, batchSize=None):
+        """
+        Finds items in the specified collection matching the filter.
+        A cursor is returned so that items are streamed from the server in batches instead of loaded at once.
 
         Args:
             collectionName: The name of the collection to find items in.
-            start_date: The start date of the date range.
-            end_date: The end date of the date range.
+            filterQuery: The filter query the items have to match, ex: a decisionDate range. All items when None.
+            projection: The fields to include or exclude, all fields when None.
+            batchSize: Number of items fetched from the server per round trip, server default when None.
+        Returns:
+            Cursor: A cursor over the items found.
+        """
+        collection = self.getCollection(collectionName)
+        cursor = collection.find(filterQuery or {}, projection)
+        if batchSize:
+            cursor = cursor.batch_size(batchSize)
+        return cursor
+
+    def countItems(self, collectionName, filterQuery=None):
+        """
+        Counts the items in the specified collection matching the filter.
+
+        Args:
+            collectionName: The name of the collection to count items in.
+            filterQuery: The filter query the items have to match, all items when None.
+        Returns:
+            int: The number of items.
+        """
+        return self.getCollection(collectionName).count_documents(filterQuery or {})
+
+    def deleteItems(self, collectionName, filterQuery):
+        """
+        Deletes the items matching the filter from the specified collection.
+
+        Args:
+            collectionName: The name of the collection to delete items from.
+            filterQuery: The filter query the items have to match.
+
+        Returns:
+            int: The number of items deleted.
+        """
+        return self.getCollection(collectionName).delete_many(filterQuery).deleted_count
+
+    def findValidators(self, collectionName):
+        """
+        Retrieves the HTTP validators stored for each fetched document URL, used to send conditional requests.
+
+        Args:
+            collectionName: The name of the collection holding the validators.
+
+        Returns:
+            dict: documentURL -> {'etag', 'lastModified', 'contentLength', 'fileHash'}
+        """
+        collection = self.getCollection(collectionName)
+        projection = {'_id': 0, 'documentURL': 1, 'etag': 1, 'lastModified': 1, 'contentLength': 1, 'fileHash': 1}
+        validators = {}
+        for document in collection.find({'documentURL': {'$exists': True}}, projection):
+            validators[document.pop('documentURL')] = document
+        return validators
+
+    def findIds(self, collectionName, filterQuery=None):
+        """
+        Retrieves the Ids of the documents matching the filter, without loading the documents themselves.
+
+        Args:
+            collectionName: The name of the collection to find Ids in.
+            filterQuery: The filter query the documents have to match, all documents when None.
+
         Returns:
-            list: A list of items found in the collection within the date range.
+            set: The Ids found.
         """
         collection = self.getCollection(collectionName)
-        return list(collection.find())
+        return {document['Id'] for document in collection.find(filterQuery or {}, {'_id': 0, 'Id': 1}) if 'Id' in document}
 
     def get_database(self, db_name):
         """
@@ -78,6 +320,11 @@ class MongoDBClient:
     
     def close(self):
         """
-        Closes the MongoDB client connection.
+        Stops the flush timer and releases the shared MongoDB client, its connections are closed with its last user.
+        Buffered upserts have to be flushed before, their failures would be lost otherwise.
         """
-        self.client.close()
\ No newline at end of file
+        self._timerStop.set()
+        if self._timer is not None and self._timer is not threading.current_thread():
+            # A batch being written by the timer is finished before the client is released
+            self._timer.join()
+        clientFactory.releaseMongo(self.client)
\ No newline at end of file
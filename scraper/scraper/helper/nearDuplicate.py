@@ -0,0 +1,227 @@
+"""
+    Near-duplicate detection of the cleaned documents with MinHash signatures and locality sensitive hashing (LSH):
+        - the text is split into word shingles (NEARDUP_SHINGLE words), hashed to 32 bits
+        - the signature is the minimum of NEARDUP_BANDS * NEARDUP_ROWS random hash functions over the shingles,
+          computed on NumPy arrays (one row per hash function, one column per shingle)
+        - the signature is cut into NEARDUP_BANDS bands of NEARDUP_ROWS values, each band hashed to a bucket key.
+          Two documents are candidates when they share a bucket, and duplicates when the share of equal signature
+          values (the estimated Jaccard similarity of their shingles) is at least NEARDUP_THRESHOLD.
+    A lookup reads the documents of the buckets of one signature through the bandKeys index, never the whole archive.
+"""
+from scraper.search.InvertedIndex import tokenize
+import numpy as np
+import threading
+import hashlib
+import zlib
+import os
+
+# Hash functions are drawn from a fixed seed, signatures of different runs have to be comparable
+seed = 20250101
+chunkSize = 2048
+
+
+def hashFunctions(count):
+    """
+        Coefficients (a, b) of the multiply-shift hash functions ((a * x + b) mod 2**64) >> 32, a odd: no modulo
+        other than the uint64 wrap around, several times faster than (a * x + b) mod prime on NumPy arrays.
+
+    Args:
+    ---------------------
+        count: number of hash functions
+
+    Returns:
+    ---------------------
+        tuple: arrays a and b of shape (count, 1)
+    """
+    generator = np.random.default_rng(seed)
+    a = generator.integers(0, 2 ** 63, size=(count, 1), dtype=np.uint64) << np.uint64(1) | np.uint64(1)
+    b = generator.integers(0, 2 ** 63, size=(count, 1), dtype=np.uint64)
+    return a, b
+
+
+def shingleHashes(text, shingleSize=5):
+    """
+        32 bit hashes of the distinct word shingles of a text.
+
+    Args:
+    ---------------------
+        text: the cleaned text
+        shingleSize: words per shingle
+
+    Returns:
+    ---------------------
+        ndarray: uint64 array of the hashes, empty when the text has no word
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    # Each distinct word is hashed once
+    words, inverse = np.unique(np.array(tokens), return_inverse=True)
+    tokenHashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words), dtype=np.uint64, count=len(words))[inverse]
+    width = min(shingleSize, len(tokens))
+    count = len(tokens) - width + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    # Polynomial rolling hash of the shingle words, wrapping around 2**64
+    with np.errstate(over='ignore'):
+        for offset in range(width):
+            hashes = hashes * np.uint64(1000003) ^ tokenHashes[offset:offset + count]
+    hashes = (hashes ^ (hashes >> np.uint64(32))) & np.uint64(0xFFFFFFFF)
+    return np.unique(hashes)
+
+
+def minhashSignature(text, numPerm=128, shingleSize=5):
+    """
+        MinHash signature of a text. Module level so that it can run in the transform process pool.
+
+    Args:
+    ---------------------
+        text: the cleaned text
+        numPerm: number of hash functions (NEARDUP_BANDS * NEARDUP_ROWS)
+        shingleSize: words per shingle
+
+    Returns:
+    ---------------------
+        ndarray: uint32 signature of numPerm values, None when the text has no word
+    """
+    shingles = shingleHashes(text, shingleSize)
+    if not len(shingles):
+        return None
+    a, b = hashFunctions(numPerm)
+    signature = np.full(numPerm, 0xFFFFFFFF, dtype=np.uint64)
+    # Shingles are hashed by chunks to bound the (numPerm, chunkSize) matrix of long decisions
+    with np.errstate(over='ignore'):
+        for start in range(0, len(shingles), chunkSize):
+            values = (a * shingles[start:start + chunkSize] + b) >> np.uint64(32)
+            np.minimum(signature, values.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+        LSH band index of the document signatures, kept in the near_duplicates collection:
+            {Id, signature (bytes), bandKeys, cluster}
+        Every document belongs to a cluster, named after its first document: a document without duplicates is a
+        cluster of its own. A document matching documents of several clusters merges them into the smallest one,
+        the other clusters are renamed in near_duplicates and stg_documents_metadata (duplicateCluster) by close.
+        Documents of the current run are also kept in memory, so that duplicates processed at the same time by
+        different threads find each other before their buffered writes reach MongoDB.
+    """
+    collectionName = 'near_duplicates'
+
+    def __init__(self, mongoClient):
+        """
+        Args:
+        ---------------------
+            mongoClient: MongoDBClient holding the band index
+        """
+        self.mongoClient = mongoClient
+        self.bands = int(os.getenv('NEARDUP_BANDS', 16))
+        self.rows = int(os.getenv('NEARDUP_ROWS', 8))
+        self.numPerm = self.bands * self.rows
+        self.shingleSize = int(os.getenv('NEARDUP_SHINGLE', 5))
+        self.threshold = float(os.getenv('NEARDUP_THRESHOLD', 0.8))
+        self.mongoClient.ensureIndexes(self.collectionName)
+        # Documents of this run: Id -> signature, bandKey -> Ids
+        self.signatures = {}
+        self.buckets = {}
+        # Cluster merges of this run (union-find parent of each merged cluster)
+        self.parents = {}
+        self._lock = threading.Lock()
+
+    def signature(self, text):
+        """
+        MinHash signature of a text with the configured parameters, see minhashSignature.
+        """
+        return minhashSignature(text, self.numPerm, self.shingleSize)
+
+    def bandKeys(self, signature):
+        """
+        Bucket keys of a signature, one per band, prefixed by the band layout so that signatures of other layouts
+        never match.
+
+        Args:
+        ---------------------
+            signature: uint32 signature
+        """
+        return [f'{self.bands}x{self.rows}:{band}:{hashlib.blake2b(values.tobytes(), digest_size=8).hexdigest()}'
+                for band, values in enumerate(signature.reshape(self.bands, self.rows))]
+
+    def assign(self, Id, signature):
+        """
+        Finds the near-duplicates of a document and assigns it a cluster.
+
+        Args:
+        ---------------------
+            Id: the document Id
+            signature: its signature (see signature), None for a document without text
+
+        Returns:
+        ---------------------
+            fields: dict of duplicateCluster, duplicateOf (Id of the most similar duplicate or None) and duplicateSimilarity
+            failures: the failures of the buffered write of the signature (see MongoDBClient.bufferUpsert)
+        """
+        if signature is None:
+            return {'duplicateCluster': Id, 'duplicateOf': None, 'duplicateSimilarity': 0.0}, []
+        keys = self.bandKeys(signature)
+        # Candidates of the previous runs, read outside the lock
+        stored = self.mongoClient.findItems(self.collectionName, {'bandKeys': {'$in': keys}, 'Id': {'$ne': Id}},
+                                            {'_id': 0, 'Id': 1, 'signature': 1, 'cluster': 1})
+        stored = [document for document in stored if len(document['signature']) == signature.nbytes]
+        with self._lock:
+            # Documents processed again in this run are compared with their new version
+            candidates = {document['Id']: self.signatures.get(document['Id']) or (np.frombuffer(document['signature'], dtype=np.uint32), document['cluster'])
+                          for document in stored}
+            for key in keys:
+                for other in self.buckets.get(key, ()):
+                    if other != Id:
+                        candidates[other] = self.signatures[other]
+            matches = {}
+            if candidates:
+                ids = list(candidates)
+                similarities = (np.stack([candidates[other][0] for other in ids]) == signature).mean(axis=1)
+                matches = {other: float(similarity) for other, similarity in zip(ids, similarities) if similarity >= self.threshold}
+            clusters = {self._find(candidates[other][1]) for other in matches}
+            cluster = min(clusters) if clusters else Id
+            for other in clusters - {cluster}:
+                self.parents[other] = cluster
+            self.signatures[Id] = (signature, cluster)
+            for key in keys:
+                self.buckets.setdefault(key, set()).add(Id)
+        document = {'Id': Id, 'signature': signature.tobytes(), 'bandKeys': keys, 'cluster': cluster}
+        failures = self.mongoClient.bufferUpsert(self.collectionName, {'Id': Id}, document)
+        duplicateOf = max(matches, key=matches.get) if matches else None
+        fields = {
+            'duplicateCluster': cluster,
+            'duplicateOf': duplicateOf,
+            'duplicateSimilarity': round(matches[duplicateOf], 4) if matches else 0.0,
+        }
+        return fields, failures
+
+    def _find(self, cluster):
+        """
+        Cluster a cluster was merged into, following the merges of this run.
+        """
+        while cluster in self.parents:
+            cluster = self.parents[cluster]
+        return cluster
+
+    def close(self, stagingCollection='stg_documents_metadata'):
+        """
+        Writes the buffered signatures and renames the clusters merged during the run. Has to run once the staging
+        metadata buffered with the old cluster names was written.
+
+        Args:
+        ---------------------
+            stagingCollection: the collection holding duplicateCluster
+
+        Returns:
+        ---------------------
+            list: the failures of the buffered writes (see MongoDBClient.flush)
+        """
+        failures = self.mongoClient.flush(self.collectionName)
+        for cluster in list(self.parents):
+            target = self._find(cluster)
+            self.mongoClient.updateItems(self.collectionName, {'cluster': cluster}, {'cluster': target})
+            self.mongoClient.updateItems(stagingCollection, {'duplicateCluster': cluster}, {'duplicateCluster': target})
+        self.parents = {}
+        return failures
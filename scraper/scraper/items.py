@@ -19,6 +19,8 @@ class ScraperItem(scrapy.Item):
     description = scrapy.Field()
     date = scrapy.Field()
     partition_date = scrapy.Field()
+    # date parsed as a BSON date, used to query date ranges
+    decisionDate = scrapy.Field()
 
     # Added for clarity
     sourceURL = scrapy.Field()
@@ -27,8 +29,17 @@ class ScraperItem(scrapy.Item):
     filePath = scrapy.Field()
     fileHash = scrapy.Field()
 
+    # HTTP validators of the document response, used for conditional requests on the next crawl
+    etag = scrapy.Field()
+    lastModified = scrapy.Field()
+    contentLength = scrapy.Field()
+
     # To pass file contact (binary to the pipeline) - Will be dropped
     rawContent = scrapy.Field()
     # To pass body to MinIO - Will be dropped
     body = scrapy.Field()
+    # Hash stored by the previous crawl, to skip unchanged content in the pipeline - Will be dropped
+    storedFileHash = scrapy.Field()
+    # Set by ScraperPipeline on the items stored in landing when StagingPipeline stages them in the same pass - Will be dropped
+    pendingStaging = scrapy.Field()
 
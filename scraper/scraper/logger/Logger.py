@@ -1,9 +1,24 @@
 import logging
+import logging.handlers
+import queue
 from pathlib import Path
 cleaners = {}
+# Background writers per log file, shared by the Logger instances writing to the same file
+listeners = {}
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves the formatting of records to the writer thread.
+    The default QueueHandler merges the message and its arguments in the calling thread.
+    """
+
+    def prepare(self, record):
+        return record
 
 class Logger:
     """This class implements a logger that can be used to log messages to a file.
+    Records are put on a queue and written to the file by a background thread, so the calling thread
+    never waits on file I/O. Messages are formatted by the writer thread from their arguments.
 
     Attributes:
         filename (str): The name of the file to log to.
@@ -18,12 +33,14 @@ class Logger:
         close(): Close the log file.
     """
 
-    def __init__(self, filename, level='INFO'):
+    def __init__(self, filename, level='INFO', rotateBytes=0, backupCount=5):
         """Initialize the logger.
 
         Args:
             filename (str): The name of the file to log to.
             level (str): The logging level. Valid levels are `DEBUG`, `INFO`, `WARNING`, `ERROR`, and `CRITICAL`.
+            rotateBytes (int): Rotate the file once it reaches this size, never rotated when 0.
+            backupCount (int): Number of rotated files kept.
         """
         log_file_path = Path(filename)
         log_file_path.parent.mkdir(parents=True, exist_ok=True)
@@ -33,57 +50,71 @@ class Logger:
         self.logger.propagate = False
 
         if not self.logger.handlers:
-            handler = logging.FileHandler(log_file_path, encoding="utf-8")
+            if rotateBytes:
+                handler = logging.handlers.RotatingFileHandler(log_file_path, maxBytes=rotateBytes, backupCount=backupCount, encoding="utf-8")
+            else:
+                handler = logging.FileHandler(log_file_path, encoding="utf-8")
             formatter = logging.Formatter(
                 "%(asctime)s | %(levelname)s | %(message)s"
             )
             handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
+            # The logger only enqueues records, the listener thread formats and writes them
+            recordQueue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(recordQueue, handler)
+            listener.start()
+            listeners[str(log_file_path)] = listener
+            self.logger.addHandler(DeferredQueueHandler(recordQueue))
 
         # Log that the logger has been initialized.
         self.logger.info('Log Initiated')
 
-    def info(self, message):
+    def info(self, message, *args):
         """Log a message at the `INFO` level.
 
         Args:
-            message (str): The message to log.
+            message (str): The message to log, formatted with args by the writer thread.
         """
-        logging.info(message)
+        self.logger.info(message, *args)
 
-    def debug(self, message):
+    def debug(self, message, *args):
         """Log a message at the `DEBUG` level.
 
         Args:
-            message (str): The message to log.
+            message (str): The message to log, formatted with args by the writer thread.
         """
-        logging.debug(message)
+        self.logger.debug(message, *args)
 
-    def error(self, message):
+    def error(self, message, *args):
         """Log a message at the `ERROR` level.
 
         Args:
-            message (str): The message to log.
+            message (str): The message to log, formatted with args by the writer thread.
         """
-        logging.error(message)
+        self.logger.error(message, *args)
 
-    def critical(self, message):
+    def critical(self, message, *args):
         """Log a message at the `CRITICAL` level.
 
         Args:
-            message (str): The message to log.
+            message (str): The message to log, formatted with args by the writer thread.
         """
-        logging.critical(message)
+        self.logger.critical(message, *args)
 
-    def warning(self, message):
+    def warning(self, message, *args):
         """Log a message at the `WARNING` level.
 
         Args:
-            message (str): The message to log.
+            message (str): The message to log, formatted with args by the writer thread.
         """
-        logging.warning(message)
+        self.logger.warning(message, *args)
 
     def close(self):
-        """Close the log file.
+        """Write the queued records and close the log file.
         """
-        logging.shutdown()
\ No newline at end of file
+        listener = listeners.pop(self.logger.name, None)
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
\ No newline at end of file
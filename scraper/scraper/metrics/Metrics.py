@@ -0,0 +1,321 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from scrapy import signals
+import threading
+import random
+import json
+import time
+
+
+class Histogram:
+    """This class keeps the latencies observed for one stage.
+
+    Attributes:
+        bounds (list): Upper bounds in seconds of the cumulative buckets exposed to Prometheus.
+        reservoirSize (int): Number of latencies sampled to compute the percentiles.
+    """
+    bounds = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+    reservoirSize = 10000
+
+    def __init__(self):
+        self.bucketCounts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.bytes = 0
+        # Uniform sample of the latencies (reservoir sampling), bounded whatever the number of observations
+        self.reservoir = []
+
+    def observe(self, seconds, size=0):
+        """Add one latency.
+
+        Args:
+            seconds (float): The latency.
+            size (int): The bytes moved by the operation.
+        """
+        index = 0
+        while index < len(self.bounds) and seconds > self.bounds[index]:
+            index += 1
+        self.bucketCounts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.bytes += size
+        if len(self.reservoir) < self.reservoirSize:
+            self.reservoir.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < self.reservoirSize:
+                self.reservoir[slot] = seconds
+
+    def percentile(self, fraction):
+        """Latency below which the given fraction of the sampled latencies fall.
+
+        Args:
+            fraction (float): Between 0 and 1, ex: 0.95.
+        """
+        if not self.reservoir:
+            return None
+        ordered = sorted(self.reservoir)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Metrics:
+    """This class collects latency histograms per stage and event counters for a crawl or a transform run.
+
+    Stages: fetch.search, fetch.document, parse.search, parse.document, hash, minio.upload, minio.download,
+    minio.copy, clean, mongo.upsert. Counters: items, errors.<stage>, ...
+    Observations are mirrored to the Scrapy stats collector when one is attached, can be exposed in the
+    Prometheus text format on a local HTTP port, and are summarized as JSON at the end of the run.
+
+    Methods:
+        observe(stage, seconds, size): Add a latency to a stage.
+        timer(stage): Context manager observing the time spent in its block.
+        increment(name, value): Increment a counter.
+        startServer(port): Expose /metrics on a local port.
+        summary(): Throughput, bytes, percentiles and errors of the run.
+        writeSummary(path): Write the summary as JSON.
+        close(): Stop the HTTP server.
+    """
+
+    def __init__(self, runName, stats=None):
+        """Initialize the metrics.
+
+        Args:
+            runName (str): Name of the run, ex: Scraping or Transforming.
+            stats: Scrapy stats collector the observations are mirrored to.
+        """
+        self.runName = runName
+        self.stats = stats
+        self.histograms = {}
+        self.counters = {}
+        self.startedAt = time.time()
+        self.server = None
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, size=0):
+        """Add a latency to a stage.
+
+        Args:
+            stage (str): The stage name.
+            seconds (float): The latency.
+            size (int): The bytes moved.
+        """
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds, size)
+            # StatsCollector.inc_value is a read then a write, the storage threads would lose updates without the lock.
+            # Only Metrics writes the metrics/ keys, so this lock is enough for them
+            if self.stats is not None:
+                self.stats.inc_value(f'metrics/{stage}/count')
+                self.stats.inc_value(f'metrics/{stage}/seconds', seconds)
+                if size:
+                    self.stats.inc_value(f'metrics/{stage}/bytes', size)
+
+    @contextmanager
+    def timer(self, stage, size=0):
+        """Observe the time spent in the block, an exception in the block counts as an error of the stage.
+
+        Args:
+            stage (str): The stage name.
+            size (int): The bytes moved.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(f'errors.{stage}')
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, size)
+
+    def increment(self, name, value=1):
+        """Increment a counter.
+
+        Args:
+            name (str): The counter name.
+            value (int): The increment.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            if self.stats is not None:
+                self.stats.inc_value(f'metrics/{name}', value)
+
+    def summary(self):
+        """Throughput, bytes moved, p50/p95/p99 per stage and error counts of the run.
+
+        Returns:
+            dict: The summary.
+        """
+        elapsed = time.time() - self.startedAt
+        with self._lock:
+            stages = {
+                stage: {
+                    'count': histogram.count,
+                    'totalSeconds': histogram.sum,
+                    'bytes': histogram.bytes,
+                    'p50': histogram.percentile(0.50),
+                    'p95': histogram.percentile(0.95),
+                    'p99': histogram.percentile(0.99),
+                }
+                for stage, histogram in self.histograms.items()
+            }
+            counters = dict(self.counters)
+        items = counters.get('items', 0)
+        return {
+            'run': self.runName,
+            'startedAt': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.startedAt)),
+            'elapsedSeconds': elapsed,
+            'items': items,
+            'itemsPerSec': items / elapsed if elapsed else None,
+            'bytesMoved': sum(stage['bytes'] for stage in stages.values()),
+            'stages': stages,
+            'errors': {name: value for name, value in counters.items() if name.startswith('errors.')},
+            'counters': counters,
+        }
+
+    def writeSummary(self, path):
+        """Write the summary as JSON.
+
+        Args:
+            path (str): The file to write.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.summary(), indent=2))
+
+    def prometheusText(self):
+        """Render the histograms and counters in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition.
+        """
+        lines = ['# TYPE scraper_stage_seconds histogram']
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.bounds + ['+Inf'], histogram.bucketCounts):
+                    cumulative += count
+                    lines.append(f'scraper_stage_seconds_bucket{{run="{self.runName}",stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'scraper_stage_seconds_sum{{run="{self.runName}",stage="{stage}"}} {histogram.sum}')
+                lines.append(f'scraper_stage_seconds_count{{run="{self.runName}",stage="{stage}"}} {histogram.count}')
+            lines.append('# TYPE scraper_stage_bytes_total counter')
+            for stage, histogram in sorted(self.histograms.items()):
+                lines.append(f'scraper_stage_bytes_total{{run="{self.runName}",stage="{stage}"}} {histogram.bytes}')
+            lines.append('# TYPE scraper_events_total counter')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'scraper_events_total{{run="{self.runName}",name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def startServer(self, port, host='127.0.0.1'):
+        """Expose the metrics on http://host:port/metrics from a background thread.
+
+        Args:
+            port (int): The port to listen on.
+            host (str): The interface to listen on, local only by default.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheusText().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='MetricsServer', daemon=True).start()
+
+    def close(self):
+        """Stop the HTTP server.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def timedCallback(stage):
+    """Decorator observing the time a spider callback spends producing its results.
+    The callback is a generator: only the time spent inside it is counted, not the time its consumer
+    spends on each yielded request or item.
+
+    Args:
+        stage (str): The stage name.
+    """
+    def decorator(callback):
+        @wraps(callback)
+        def wrapper(spider, *args, **kwargs):
+            generator = callback(spider, *args, **kwargs)
+            metrics = getattr(spider, 'metrics', None)
+            if metrics is None:
+                yield from generator
+                return
+            elapsed = 0.0
+            while True:
+                start = time.perf_counter()
+                try:
+                    value = next(generator)
+                except StopIteration:
+                    metrics.observe(stage, elapsed + time.perf_counter() - start)
+                    return
+                except Exception:
+                    metrics.increment(f'errors.{stage}')
+                    raise
+                elapsed += time.perf_counter() - start
+                yield value
+        return wrapper
+    return decorator
+
+
+class MetricsExtension:
+    """Scrapy extension attaching the stats collector to the spider metrics, observing the fetch latency
+    of every response, exposing the metrics on METRICS_PORT and writing the JSON summary when the spider closes.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.port = crawler.settings.getint('METRICS_PORT', 0)
+        self.host = crawler.settings.get('METRICS_HOST', '127.0.0.1')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def spider_opened(self, spider):
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            return
+        metrics.stats = self.crawler.stats
+        if self.port:
+            metrics.startServer(self.port, self.host)
+
+    def response_received(self, response, request, spider):
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            return
+        stage = 'fetch.search' if '/search/' in response.url else 'fetch.document'
+        metrics.observe(stage, request.meta.get('download_latency', 0.0), len(response.body))
+        if response.status >= 400:
+            metrics.increment(f'errors.{stage}')
+
+    def spider_closed(self, spider, reason):
+        metrics = getattr(spider, 'metrics', None)
+        if metrics is None:
+            return
+        metrics.writeSummary(Path('Log') / f"Metrics_{metrics.runName}_{time.strftime('%Y%m%d%H%M%S')}.json")
+        metrics.close()
@@ -0,0 +1,180 @@
+from scraper.exception.Exception import InvalidOperation
+from functools import wraps
+from pathlib import Path
+from datetime import datetime
+import tracemalloc
+import threading
+import cProfile
+import pstats
+import io
+
+
+class Profiler:
+    """This class profiles a sample of the calls of the wrapped functions, with cProfile (cpu) or tracemalloc (mem).
+
+    Only one call is profiled at a time: cProfile can only be active once per process, and a call starting while
+    another one is profiled runs unprofiled. Nothing is wrapped when profiling is off (see createProfiler).
+    Outputs, written to the Log directory on close:
+        cpu: Profile_<run>_<timestamp>_<stage>.pstats per stage, and Profile_<run>_<timestamp>.txt with the top functions
+        mem: Memory_<run>_<timestamp>.txt with the top allocations and the peak memory of the sampled calls per stage
+
+    Methods:
+        wrap(stage, function): Profile a sample of the calls of a function.
+        wrapGenerator(stage, function): Same for a generator function (spider callbacks), profiling each step.
+        close(): Stop profiling and write the outputs.
+    """
+    modes = ('cpu', 'mem')
+    # Number of lines in the text reports
+    topCount = 40
+
+    def __init__(self, mode, runName, sampleRate=10, outputDir='Log'):
+        """Initialize the profiler.
+
+        Args:
+            mode (str): cpu or mem.
+            runName (str): Name of the run, ex: Scraping or Transforming.
+            sampleRate (int): Profile one call out of sampleRate per stage.
+            outputDir (str): Directory the outputs are written to.
+        """
+        if mode not in self.modes:
+            raise InvalidOperation(f'Unknown SCRAPER_PROFILE {mode}, expected one of {", ".join(self.modes)}')
+        self.mode = mode
+        self.runName = runName
+        self.sampleRate = max(1, sampleRate)
+        self.outputDir = Path(outputDir)
+        self.calls = {}
+        self.profiles = {}
+        self.peaks = {}
+        self._lock = threading.Lock()
+        self._countLock = threading.Lock()
+        if mode == 'mem' and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+
+    def _sampled(self, stage):
+        """Whether this call of the stage is profiled.
+
+        Args:
+            stage (str): The stage name.
+        """
+        with self._countLock:
+            count = self.calls.get(stage, 0)
+            self.calls[stage] = count + 1
+        return count % self.sampleRate == 0
+
+    def _run(self, stage, function, *args, **kwargs):
+        """Run a function under the profiler, or unprofiled when another call is being profiled.
+
+        Args:
+            stage (str): The stage name.
+            function: The function to run.
+        """
+        if not self._lock.acquire(blocking=False):
+            return function(*args, **kwargs)
+        try:
+            if self.mode == 'cpu':
+                profile = self.profiles.get(stage)
+                if profile is None:
+                    profile = self.profiles[stage] = cProfile.Profile()
+                return profile.runcall(function, *args, **kwargs)
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                return function(*args, **kwargs)
+            finally:
+                peak = tracemalloc.get_traced_memory()[1] - before
+                self.peaks[stage] = max(self.peaks.get(stage, 0), peak)
+        finally:
+            self._lock.release()
+
+    def wrap(self, stage, function):
+        """Profile a sample of the calls of a function.
+
+        Args:
+            stage (str): The stage name.
+            function: The function, usually a bound method.
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not self._sampled(stage):
+                return function(*args, **kwargs)
+            return self._run(stage, function, *args, **kwargs)
+        return wrapper
+
+    def wrapGenerator(self, stage, function):
+        """Profile a sample of the calls of a generator function, each step being profiled separately
+        so that the consumer of the generator is not profiled with it.
+
+        Args:
+            stage (str): The stage name.
+            function: The generator function, usually a bound method.
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            generator = function(*args, **kwargs)
+            if not self._sampled(stage):
+                yield from generator
+                return
+            while True:
+                try:
+                    value = self._run(stage, next, generator)
+                except StopIteration:
+                    return
+                yield value
+        return wrapper
+
+    def close(self):
+        """Stop profiling and write the outputs to the Log directory.
+
+        Returns:
+            list: The paths written.
+        """
+        self.outputDir.mkdir(parents=True, exist_ok=True)
+        prefix = f"{self.runName}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        written = []
+        if self.mode == 'cpu':
+            if not self.profiles:
+                return written
+            report = io.StringIO()
+            for stage, profile in sorted(self.profiles.items()):
+                path = self.outputDir / f'Profile_{prefix}_{stage}.pstats'
+                profile.dump_stats(path)
+                written.append(path)
+                report.write(f'==== {stage} ({self.calls.get(stage, 0)} calls, 1 out of {self.sampleRate} profiled)\n')
+                pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(self.topCount)
+            path = self.outputDir / f'Profile_{prefix}.txt'
+            path.write_text(report.getvalue())
+            written.append(path)
+            return written
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ])
+        tracemalloc.stop()
+        lines = [f'==== Peak memory of the sampled calls (1 out of {self.sampleRate})']
+        for stage, peak in sorted(self.peaks.items()):
+            lines.append(f'{stage}: {peak / 1024:.1f} KiB over {self.calls.get(stage, 0)} calls')
+        lines.append(f'==== Top {self.topCount} allocations still held at the end of the run')
+        for statistic in snapshot.statistics('lineno')[:self.topCount]:
+            lines.append(str(statistic))
+        path = self.outputDir / f'Memory_{prefix}.txt'
+        path.write_text('\n'.join(lines) + '\n')
+        written.append(path)
+        return written
+
+
+def createProfiler(mode, runName, sampleRate=10):
+    """Create the profiler of a run.
+
+    Args:
+        mode (str): cpu, mem, or empty to disable profiling.
+        runName (str): Name of the run, ex: Scraping or Transforming.
+        sampleRate (int): Profile one call out of sampleRate per stage.
+
+    Returns:
+        Profiler, or None when profiling is disabled so nothing gets wrapped.
+    """
+    mode = (mode or '').strip().lower()
+    if mode in ('', '0', 'off', 'none'):
+        return None
+    return Profiler(mode, runName, sampleRate=int(sampleRate or 10))
@@ -3,7 +3,12 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+from scrapy import signals, Request
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from scraper.helper.crawlFrontier import CrawlFrontier
+from scraper.helper.crawlBudget import CrawlBudget
+from scraper.helper.mongoClient import MongoDBClient
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
@@ -98,3 +103,217 @@ class ScraperDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class FrontierSpiderMiddleware:
+    """
+        Records every request of the crawl in the persistent CrawlFrontier (FRONTIER_ENABLED) and resumes an
+        unfinished crawl started with the same arguments: start requests already parsed are skipped,
+        completed partitions are never requested again, and the pending requests are requested again.
+        A request is done once its output was recorded and every item it yielded went through the pipelines
+        (item_scraped), and the landing metadata buffered by ScraperPipeline is written before any frontier write.
+        A request fails through the errback set on the recorded requests (download errors, retries given up, HTTP
+        errors of HttpErrorMiddleware), spider_error (callback exception) or item_error, so the run still completes.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.frontier = None
+        self.pendingDocuments = []
+        # fingerprint -> items of its response still in the pipelines, plus one while its output is iterated
+        self.held = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('FRONTIER_ENABLED'):
+            raise NotConfigured
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(s.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(s.item_error, signal=signals.item_error)
+        crawler.signals.connect(s.spider_error, signal=signals.spider_error)
+        return s
+
+    def spider_opened(self, spider):
+        arguments = {name: getattr(spider, name, None) for name in ('start_date', 'end_date', 'query', 'body', 'partition', 'incremental')}
+        self.frontier = CrawlFrontier(MongoDBClient(), CrawlFrontier.runKeyOf(spider.name, **arguments),
+                                      maxAgeDays=self.crawler.settings.getint('FRONTIER_MAX_AGE_DAYS', 30))
+        self.pendingDocuments = self.frontier.load()
+        # The spider plans its start URLs through the frontier so a resumed crawl uses the windows of the first run
+        spider.frontier = self.frontier
+        # Pipelines are opened before spider_opened is sent
+        pipeline = getattr(self.crawler, 'scraperPipeline', None)
+        if pipeline is not None:
+            self.frontier.mongoClient.beforeWrite(CrawlFrontier.collectionName, pipeline.flushMetadata)
+        if self.frontier.resumed:
+            spider.logger.info(f'Resuming crawl {self.frontier.runKey}: {len(self.pendingDocuments)} pending requests, '
+                               f'{len(self.frontier.completedPartitions)} completed partitions.')
+
+    async def process_start(self, start):
+        # Start requests open a partition each, the ones already recorded are either parsed or pending below
+        async for item_or_request in start:
+            if isinstance(item_or_request, Request):
+                fingerprint = self._fingerprint(item_or_request)
+                if self.frontier.isKnown(fingerprint):
+                    continue
+                item_or_request.meta['frontierPartition'] = fingerprint
+                item_or_request.meta['frontierFingerprint'] = fingerprint
+                self._setErrback(item_or_request)
+                self.frontier.add(item_or_request, fingerprint, fingerprint)
+            yield item_or_request
+        for document in self.pendingDocuments:
+            request = self.frontier.toRequest(document, self.crawler.spider)
+            request.meta['frontierFingerprint'] = document['fingerprint']
+            self._setErrback(request)
+            yield request
+        self.pendingDocuments = []
+
+    def process_spider_output(self, response, result, spider):
+        # Requests inherit the partition of the page they were found on, the page is done once its output is
+        # recorded and its items are stored. Fingerprint of the request as recorded, a redirected request has another one
+        partition = response.meta.get('frontierPartition')
+        recorded = response.meta.get('frontierFingerprint')
+        if recorded is not None:
+            self._hold(recorded)
+        for i in result:
+            if isinstance(i, Request):
+                if partition is not None:
+                    fingerprint = self._fingerprint(i)
+                    i.meta['frontierPartition'] = partition
+                    i.meta['frontierFingerprint'] = fingerprint
+                    self._setErrback(i)
+                    self.frontier.add(i, fingerprint, partition)
+            elif recorded is not None:
+                # Counted before it is yielded, a synchronous pipeline stores it before the loop goes on
+                self._hold(recorded)
+            yield i
+        if recorded is not None:
+            self._release(recorded)
+
+    def item_scraped(self, response):
+        self._release(self._recorded(response))
+
+    def item_dropped(self, response):
+        # Dropped on purpose by a pipeline, the request does not have to be fetched again
+        self._release(self._recorded(response))
+
+    def item_error(self, response, failure):
+        # The item was not stored, its request failed
+        self._fail(self._recorded(response), response, failure)
+
+    def spider_error(self, failure, response):
+        # The callback raised, items it yielded before are still released as they are stored
+        self._fail(self._recorded(response), response, failure)
+
+    def requestFailed(self, failure):
+        """
+        Errback of the recorded requests: download errors, retries given up and responses HttpErrorMiddleware
+        filters out (404, 5xx...).
+        """
+        request = failure.request
+        self._fail(request.meta.get('frontierFingerprint'), request, failure)
+        # Returned so that Scrapy handles and logs the error as it does for a request without errback
+        return failure
+
+    def _setErrback(self, request):
+        if request.errback is None:
+            request.errback = self.requestFailed
+
+    def _fail(self, fingerprint, source, failure):
+        """
+        Records the failure of a request in the frontier.
+
+        Args:
+        ---------------------
+            fingerprint: fingerprint of the request as recorded, None for a request not recorded
+            source: the request or response (URL reported on close)
+            failure: the Twisted Failure
+        """
+        if fingerprint is None:
+            return
+        self.held.pop(fingerprint, None)
+        self.frontier.fail(fingerprint, source.url, failure.getErrorMessage())
+
+    def _recorded(self, response):
+        # Fingerprint recorded for the request of a response, None for an item or error without response
+        meta = getattr(response, 'meta', None)
+        return meta.get('frontierFingerprint') if meta is not None else None
+
+    def _hold(self, fingerprint):
+        self.held[fingerprint] = self.held.get(fingerprint, 0) + 1
+
+    def _release(self, fingerprint):
+        """
+        Releases the output or an item of a response, the request is done once nothing of it is held anymore.
+        """
+        if fingerprint not in self.held:
+            return
+        self.held[fingerprint] -= 1
+        if self.held[fingerprint] == 0:
+            del self.held[fingerprint]
+            self.frontier.complete(fingerprint)
+
+    def spider_closed(self, spider, reason):
+        if self.frontier is None:
+            return
+        if self.frontier.failed:
+            failed = list(self.frontier.failed.values())
+            spider.logger.warning(f'{len(failed)} requests failed: ' + ', '.join(f'{url} ({error})' for url, error in failed[:20])
+                                  + (', ...' if len(failed) > 20 else ''))
+        failures = self.frontier.close(finished=reason == 'finished')
+        if failures:
+            spider.logger.warning(f'{failures} frontier updates could not be written, their requests will be fetched again on resume.')
+        self.frontier.mongoClient.close()
+
+    def _fingerprint(self, request):
+        return self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+
+class BudgetDownloaderMiddleware:
+    """
+        Holds document requests (the ones carrying an item) before their download while the pipeline holds
+        MAX_INFLIGHT_BYTES of content or MAX_PENDING_ITEMS items. The held requests count as active downloads,
+        so the engine also stops taking new requests from the scheduler until the pipeline drains.
+        Each document request let through reserves its item in the budget until its response (or failure) comes back.
+    """
+    # Set on a request holding a reservation, carried by its redirects and retries which keep it
+    reservationKey = 'budgetReserved'
+
+    def __init__(self, crawler, budget):
+        self.crawler = crawler
+        self.budget = budget
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        budget = CrawlBudget.fromCrawler(crawler)
+        if not budget.enabled or not crawler.settings.getbool('PIPELINE_ASYNC_ENABLED'):
+            # Without the asynchronous pipeline items are stored before the next response is handled
+            raise NotConfigured
+        return cls(crawler, budget)
+
+    async def process_request(self, request, spider):
+        if request.meta.get('item') is None or request.meta.get(self.reservationKey):
+            return None
+        reservation = self.budget.reserve()
+        if not reservation.called:
+            metrics = getattr(spider, 'metrics', None)
+            if metrics is not None:
+                metrics.increment('budget.waits')
+            # The asyncio reactor can only await Futures, a bare Deferred fails the request
+            await maybe_deferred_to_future(reservation)
+        request.meta[self.reservationKey] = True
+        return None
+
+    def process_response(self, request, response, spider):
+        self._settle(request)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self._settle(request)
+        return None
+
+    def _settle(self, request):
+        if request.meta.pop(self.reservationKey, False):
+            self.budget.settle()
@@ -2,6 +2,15 @@ from datetime import datetime
 import hashlib
 from scraper.helper.minioClient import MinioClient
 from scraper.helper.mongoClient import MongoDBClient
+from scraper.helper.crawlBudget import CrawlBudget
+from scraper.helper.nearDuplicate import NearDuplicateIndex
+from scraper.metrics.Metrics import Metrics
+from scraper.search.InvertedIndex import IndexWriter
+from scraper.transformation.transform import cleanAndHash, extractPDFText, stagingMetadata, htmlCleaners, PdfReader
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+import tempfile
 import os, io
 
 # Define your item pipelines here
@@ -23,7 +32,57 @@ class ScraperPipeline:
             Computing required data (ex: hash)
             Uploading to MinIO
             inserting metadata to MongoDB
+        When PIPELINE_ASYNC_ENABLED is set, hashing, uploading and upserting run on a bounded thread pool
+        and process_item returns a Deferred, so the reactor keeps downloading while items are stored.
     """
+    # Size of the chunks hashed and written when spooling a large document
+    chunkSize = 1024 * 1024
+
+    def __init__(self, asyncEnabled=False, maxInflight=8, storageThreads=4, spoolThreshold=8 * 1024 * 1024, partSize=16 * 1024 * 1024):
+        """
+        Args:
+        ---------------------
+            asyncEnabled: run the storage work of each item off the reactor thread
+            maxInflight: maximum number of items being stored at the same time (including queued ones)
+            storageThreads: number of threads used to store items
+            spoolThreshold: documents larger than this (bytes) are spooled to a temporary file and uploaded in parts
+            partSize: size of the parts of a multipart upload (bytes, at least 5 MiB)
+        """
+        self.asyncEnabled = asyncEnabled
+        self.maxInflight = max(1, maxInflight)
+        self.storageThreads = max(1, storageThreads)
+        self.threadPool = None
+        self.inflight = None
+        self.spoolThreshold = spoolThreshold
+        self.partSize = max(5 * 1024 * 1024, partSize)
+        # Crawl memory budget the items held by the pipeline are counted in (set by from_crawler)
+        self.budget = None
+        # Keep the HTML on the stored items for StagingPipeline (FUSED_STAGING_ENABLED, set by from_crawler)
+        self.fusedStaging = False
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the pipeline from the crawler settings. (From Docs)
+
+        Args:
+        ---------------------
+            crawler: the crawler running the spider
+        """
+        settings = crawler.settings
+        pipeline = cls(
+            asyncEnabled=settings.getbool('PIPELINE_ASYNC_ENABLED', False),
+            maxInflight=settings.getint('PIPELINE_MAX_INFLIGHT', 8),
+            storageThreads=settings.getint('PIPELINE_STORAGE_THREADS', 4),
+            spoolThreshold=settings.getint('STREAM_SPOOL_THRESHOLD', 8 * 1024 * 1024),
+            partSize=settings.getint('STREAM_PART_SIZE', 16 * 1024 * 1024),
+        )
+        pipeline.budget = CrawlBudget.fromCrawler(crawler)
+        pipeline.fusedStaging = settings.getbool('FUSED_STAGING_ENABLED', False)
+        # FrontierSpiderMiddleware writes the landing metadata before marking requests done
+        crawler.scraperPipeline = pipeline
+        return pipeline
+
     def open_spider(self, spider):
         """
         This method is called when the spider is opened. (From Docs)
@@ -35,13 +94,29 @@ class ScraperPipeline:
         """
         # Initiate MinIO Client
         # access key and secret key defined in the docker-compose.yaml
-        self.lnd_minio_client = MinioClient(bucketName='landing')
+        # The connection pool is sized for the storage threads uploading at the same time
+        self.lnd_minio_client = MinioClient(bucketName='landing', poolSize=self.storageThreads if self.asyncEnabled else None)
         # Initialize Mongo Client to handle MongoDB operations
         # Database name found in class
         self.mongo_client = MongoDBClient()
         # Get both landing and staging collections
         self.lnd_collection = self.mongo_client.getCollection('lnd_documents_metadata')
+        self.mongo_client.ensureIndexes(self.lnd_collection.name)
+        self.mongo_client.ensureIndexes('document_validators')
         self.lnd_bucket = 'landing'
+        self.spider = spider
+        # Stage latencies are added to the spider metrics, a standalone spider without them gets its own
+        self.metrics = getattr(spider, 'metrics', None) or Metrics('Scraping')
+        # Profile a sample of the stored items when the spider is profiled (SCRAPER_PROFILE)
+        profiler = getattr(spider, 'profiler', None)
+        if profiler is not None:
+            self._storeItem = profiler.wrap('pipeline.storeItem', self._storeItem)
+
+        if self.asyncEnabled:
+            # Bounded pool of storage threads, the semaphore limits the number of items waiting on it
+            self.threadPool = ThreadPool(minthreads=1, maxthreads=self.storageThreads, name='ScraperPipeline')
+            self.threadPool.start()
+            self.inflight = defer.DeferredSemaphore(self.maxInflight)
 
 
     def close_spider(self, spider):
@@ -52,6 +127,14 @@ class ScraperPipeline:
         ---------------------
             spider: the spider opened to extract data
         """
+        # Scrapy only closes the spider once every item Deferred has fired, so the pool is idle here
+        if self.threadPool is not None:
+            self.threadPool.stop()
+            self.threadPool = None
+        # Write the metadata still buffered for the last bulk write
+        with self.metrics.timer('mongo.upsert'):
+            failures = self.mongo_client.flush()
+        self._reportFailures(failures)
         self.mongo_client.close()
 
     def process_item(self, item, spider):
@@ -69,25 +152,393 @@ class ScraperPipeline:
             item: the scraped item
             spider: the spider currently open
         Return:
+        ---------------------
+            item: the scraped item, or a Deferred firing with it when the pipeline runs asynchronously
+        """
+        if not self.asyncEnabled:
+            return self._storeItem(item)
+        # Items queued or being stored hold their content until stored, document downloads wait while the budget is used up
+        size = len(item.get('rawContent') or b'')
+        if self.budget is not None:
+            self.budget.take(size)
+        deferred = self.inflight.run(threads.deferToThreadPool, reactor, self.threadPool, self._storeItem, item)
+        if self.budget is not None:
+            deferred.addBoth(self._releaseBudget, size)
+        return deferred
+
+    def _releaseBudget(self, result, size):
+        """
+        Gives the content of a stored (or failed) item back to the crawl budget.
+
+        Args:
+        ---------------------
+            result: the item, or the failure, passed on unchanged
+            size: bytes of the item content
+        """
+        self.budget.release(size)
+        return result
+
+    def _storeItem(self, item):
+        """
+        Hashes the item content, uploads it to MinIO and upserts its metadata to MongoDB.
+        Runs on the reactor thread in synchronous mode and on a storage thread otherwise.
+
+        Args:
+        ---------------------
+            item: the scraped item
+        Return:
         ---------------------
             item: the scraped item
         """
-        raw_content = item['rawContent']
-        # Generate a SHA-256 cryptographic hash and returns hexadecimal string
-        fileHash = hashlib.sha256(raw_content).hexdigest()
+        raw_content = item.pop('rawContent', None)
+        spool = None
+        contentLength = len(raw_content)
+        with self.metrics.timer('hash', contentLength):
+            if contentLength > self.spoolThreshold:
+                # Large documents are hashed while spooled to a temporary file, and the in-memory body is released
+                # before the (multipart) upload instead of being held through it
+                spool, fileHash = self._spool(raw_content)
+                raw_content = None
+            else:
+                # Generate a SHA-256 cryptographic hash and returns hexadecimal string
+                fileHash = hashlib.sha256(raw_content).hexdigest()
         item['fileHash'] = fileHash
         extension = item['fileType']
         # Object Path directs to the location in MinIO
         objectPath = f"{item['body']}_{item['partition_date']}/{item['Id']}.{extension}"
-        # upload file to bucket
-        self.lnd_minio_client.upload(objectPath=objectPath, raw_content=raw_content)
         # Construct MinIO filePath
         item['filePath'] = f"{self.lnd_bucket}/{objectPath}"
+        # Store the decision date as a BSON date so date ranges can be queried on the server
+        item['decisionDate'] = self._parseDate(item.get('date'))
         # Remove items not needed to be inserted in MongoDB in the returned items (metadata)
-        item.pop('rawContent', None)
         item.pop('body', None)
 
+        try:
+            # Content identical to the previous crawl (server ignored the conditional request) is not stored again
+            if item.pop('storedFileHash', None) == fileHash:
+                self.metrics.increment('items.unchanged')
+                self._storeValidators(item)
+                return item
+
+            # upload file to bucket
+            with self.metrics.timer('minio.upload', contentLength):
+                if spool is not None:
+                    self.lnd_minio_client.uploadStream(objectPath=objectPath, stream=spool, length=contentLength, partSize=self.partSize)
+                else:
+                    # HTML is stored compressed when MINIO_COMPRESSION is set, fileHash stays the hash of the page itself
+                    self.lnd_minio_client.upload(objectPath=objectPath, raw_content=raw_content, compress=extension == 'html')
+        finally:
+            if spool is not None:
+                spool.close()
+
         # Upsert metadata to make sure than when scraping there are no duplicate values in the database
-        self.mongo_client.upsertItem(self.lnd_collection.name, {'Id': item['Id']}, item)
+        # Upserts are buffered and written in bulk, failures are reported per Id once their batch is written
+        with self.metrics.timer('mongo.upsert'):
+            failures = self.mongo_client.bufferUpsert(self.lnd_collection.name, {'Id': item['Id']}, item)
+        self._reportFailures(failures)
+        self._storeValidators(item)
+        self.metrics.increment('items')
+
+        if self.fusedStaging:
+            # Staged by StagingPipeline from the content in memory, spooled documents are read back from landing
+            item['pendingStaging'] = True
+            if raw_content is not None and extension == 'html':
+                item['rawContent'] = raw_content
+        return item
+
+    def _storeValidators(self, item):
+        """
+        Buffers the HTTP validators and hash of the fetched document for the conditional requests of the next crawl.
+        They are kept per Id and URL: a page and its attachments share their Id, each has its own validators.
+
+        Args:
+        ---------------------
+            item: the stored item
+        """
+        filterQuery = {'Id': item['Id'], 'documentURL': item['documentURL']}
+        validators = dict(filterQuery, **{key: item.get(key) for key in ('etag', 'lastModified', 'contentLength', 'fileHash')})
+        with self.metrics.timer('mongo.upsert'):
+            failures = self.mongo_client.bufferUpsert('document_validators', filterQuery, validators)
+        self._reportFailures(failures)
+
+    def flushMetadata(self):
+        """
+        Writes the buffered landing metadata. Run by the frontier client before each of its bulk writes, so that a
+        request is never recorded as done while the metadata of its item could still be lost.
+        """
+        with self.metrics.timer('mongo.upsert'):
+            failures = self.mongo_client.flush(self.lnd_collection.name)
+        self._reportFailures(failures)
+
+    def _parseDate(self, date):
+        """
+        Parses the dd/mm/YYYY date shown on the search page.
+
+        Args:
+        ---------------------
+            date: the date string of the item
+        Return:
+        ---------------------
+            datetime, or None when the date is missing or malformed
+        """
+        try:
+            return datetime.strptime(date.strip(), '%d/%m/%Y')
+        except (AttributeError, ValueError):
+            return None
+
+    def _spool(self, raw_content):
+        """
+        Copies a document to a temporary file chunk by chunk, hashing each chunk on the way.
+        Chunks are memoryview slices so no extra copy of the body is made in memory.
+
+        Args:
+        ---------------------
+            raw_content: the document bytes
+        Return:
+        ---------------------
+            spool, fileHash: the temporary file rewound to its start, and the SHA-256 of the content
+        """
+        hasher = hashlib.sha256()
+        spool = tempfile.TemporaryFile()
+        view = memoryview(raw_content)
+        for start in range(0, len(view), self.chunkSize):
+            chunk = view[start:start + self.chunkSize]
+            hasher.update(chunk)
+            spool.write(chunk)
+        view.release()
+        spool.seek(0)
+        return spool, hasher.hexdigest()
+
+    def _reportFailures(self, failures):
+        """
+        Logs the Ids whose metadata could not be written by a bulk write.
+
+        Args:
+        ---------------------
+            failures: list of dicts with the keys Id and error as returned by MongoDBClient
+        """
+        if not failures:
+            return
+        self.metrics.increment('errors.mongo.upsert', len(failures))
+        helperClass = getattr(self.spider, 'helperClass', None)
+        for failure in failures:
+            message = f"Upsert failed for item ID {failure['Id']}: {failure['error']}"
+            if helperClass is not None:
+                helperClass.logAction('error', 'Metadata Bulk Write', message)
+            else:
+                self.spider.logger.error(message)
+
+
+class StagingPipeline:
+    """
+        Optional stage after ScraperPipeline (FUSED_STAGING_ENABLED) producing the staging layer during the crawl,
+        from the content still in memory instead of a Transform pass downloading every landing object again:
+            HTML -> cleaned, hashed and uploaded to the staging bucket, added to the full-text index and near-duplicate clusters
+            PDF -> copied server side from landing, its text (pypdf) added to the near-duplicate clusters
+            other files -> copied server side from landing with the landing hash carried forward
+        The staging metadata is buffered in the same pass as the landing metadata, with the landing hash and transform
+        version it was built from, so the batch Transform (kept for backfills) skips the staged records.
+        Files are stored under from_<start_date>_to_<end_date> of the crawl, as the Transform of the same window would.
+    """
+
+    def __init__(self, asyncEnabled=False, maxInflight=8, storageThreads=4, htmlCleaner='bs4'):
+        """
+        Args:
+        ---------------------
+            asyncEnabled: stage the items off the reactor thread
+            maxInflight: maximum number of items being staged at the same time (including queued ones)
+            storageThreads: number of threads used to stage items
+            htmlCleaner: HTML cleaner engine, bs4 or lxml
+        """
+        self.asyncEnabled = asyncEnabled
+        self.maxInflight = max(1, maxInflight)
+        self.storageThreads = max(1, storageThreads)
+        self.htmlCleaner = htmlCleaner if htmlCleaner in htmlCleaners else 'bs4'
+        self.threadPool = None
+        self.inflight = None
+        self.budget = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """
+        Creates the pipeline from the crawler settings, disabled unless FUSED_STAGING_ENABLED. (From Docs)
 
+        Args:
+        ---------------------
+            crawler: the crawler running the spider
+        """
+        settings = crawler.settings
+        if not settings.getbool('FUSED_STAGING_ENABLED'):
+            raise NotConfigured
+        pipeline = cls(
+            asyncEnabled=settings.getbool('PIPELINE_ASYNC_ENABLED', False),
+            maxInflight=settings.getint('PIPELINE_MAX_INFLIGHT', 8),
+            storageThreads=settings.getint('PIPELINE_STORAGE_THREADS', 4),
+            htmlCleaner=settings.get('FUSED_STAGING_HTML_CLEANER', 'bs4'),
+        )
+        pipeline.budget = CrawlBudget.fromCrawler(crawler)
+        return pipeline
+
+    def open_spider(self, spider):
+        """
+        Opens the staging bucket, the MongoDB connection, the full-text index and the near-duplicate index. (From Docs)
+
+        Args:
+        ---------------------
+            spider: the spider opened to extract data
+        """
+        self.lnd_minio_client = MinioClient(bucketName='landing', poolSize=self.storageThreads if self.asyncEnabled else None)
+        self.stg_minio_client = MinioClient(bucketName='staging', poolSize=self.storageThreads if self.asyncEnabled else None)
+        self.mongo_client = MongoDBClient()
+        self.mongo_client.ensureIndexes('stg_documents_metadata')
+        self.spider = spider
+        self.metrics = getattr(spider, 'metrics', None) or Metrics('Scraping')
+        # Same folder as the Transform of the crawl window
+        window = [datetime.strptime(date.strip(), '%d/%m/%Y').strftime('%Y%m%d') for date in (spider.start_date, spider.end_date)]
+        self.stgFolder = f'from_{window[0]}_to_{window[1]}'
+        indexDir = os.getenv('INDEX_DIR', 'Index')
+        self.index = IndexWriter.shared(indexDir) if indexDir else None
+        if self.index is not None:
+            # Staged records are skipped by the Transform, they have to be indexed before their metadata is written
+            self.mongo_client.beforeWrite('stg_documents_metadata', self.index.flush)
+        nearDuplicatesEnabled = os.getenv('NEARDUP_ENABLED', '1').lower() in ('1', 'true', 'yes')
+        self.nearDuplicates = NearDuplicateIndex(self.mongo_client) if nearDuplicatesEnabled else None
+        if self.asyncEnabled:
+            self.threadPool = ThreadPool(minthreads=1, maxthreads=self.storageThreads, name='StagingPipeline')
+            self.threadPool.start()
+            self.inflight = defer.DeferredSemaphore(self.maxInflight)
+
+    def close_spider(self, spider):
+        """
+        Writes the buffered staging metadata, commits the index and closes the connection. (From Docs)
+
+        Args:
+        ---------------------
+            spider: the spider opened to extract data
+        """
+        if self.threadPool is not None:
+            self.threadPool.stop()
+            self.threadPool = None
+        with self.metrics.timer('staging.upsert'):
+            failures = self.mongo_client.flush('stg_documents_metadata')
+        self._reportFailures(failures)
+        if self.index is not None:
+            self.index.commit()
+        # Clusters merged during the crawl are renamed once the staging metadata holding their old names was written
+        if self.nearDuplicates is not None:
+            self._reportFailures(self.nearDuplicates.close())
+        self.mongo_client.close()
+
+    def process_item(self, item, spider):
+        """
+        Stages the items stored in landing by ScraperPipeline, other items pass unchanged. (From Docs)
+
+        Args:
+        ---------------------
+            item: the item returned by ScraperPipeline
+            spider: the spider currently open
+        Return:
+        ---------------------
+            item: the item without its content, or a Deferred firing with it when the pipeline runs asynchronously
+        """
+        if not item.get('pendingStaging'):
+            item.pop('rawContent', None)
+            return item
+        if not self.asyncEnabled:
+            return self._stageItem(item)
+        size = len(item.get('rawContent') or b'')
+        if self.budget is not None:
+            self.budget.take(size)
+        deferred = self.inflight.run(threads.deferToThreadPool, reactor, self.threadPool, self._stageItem, item)
+        if self.budget is not None:
+            deferred.addBoth(self._releaseBudget, size)
+        return deferred
+
+    def _releaseBudget(self, result, size):
+        """
+        Gives the content of a staged (or failed) item back to the crawl budget.
+        """
+        self.budget.release(size)
+        return result
+
+    def _stageItem(self, item):
+        """
+        Builds the staging file and metadata of an item, as Transform.processRecord does from landing.
+
+        Args:
+        ---------------------
+            item: the item stored in landing
+        Return:
+        ---------------------
+            item: the item, its landing metadata unchanged
+        """
+        rawContent = item.pop('rawContent', None)
+        item.pop('pendingStaging', None)
+        Id = item['Id']
+        extension = item['fileType'].lower()
+        lndObjectPath = item['filePath'].replace('landing/', '', 1)
+        stgObjectPath = f"{self.stgFolder}/{Id}.{extension}"
+        # Landing only fields are not carried to staging
+        record = {key: value for key, value in item.items() if key not in ('etag', 'lastModified', 'contentLength')}
+        metrics = self.metrics
+        if extension in ('html', 'htm'):
+            if rawContent is None:
+                with metrics.timer('minio.download'):
+                    rawContent = self.lnd_minio_client.download(objectPath=lndObjectPath)
+            with metrics.timer('clean', len(rawContent)):
+                rawContent, fileHash = cleanAndHash(rawContent, self.htmlCleaner)
+            text = rawContent.decode('utf-8', 'replace')
+            if self.index is not None:
+                with metrics.timer('index', len(rawContent)):
+                    self.index.add(Id, text)
+            if self.nearDuplicates is not None:
+                with metrics.timer('minhash', len(rawContent)):
+                    signature = self.nearDuplicates.signature(text)
+                with metrics.timer('lsh'):
+                    fields, failures = self.nearDuplicates.assign(Id, signature)
+                self._reportFailures(failures)
+                record.update(fields)
+            with metrics.timer('staging.upload', len(rawContent)):
+                stgFilePath = self.stg_minio_client.upload(stgObjectPath, rawContent, compress=True)
+        else:
+            if extension == 'pdf' and self.nearDuplicates is not None and PdfReader is not None:
+                # Signed from its text so that a decision published both as a page and as a PDF shares a cluster
+                if rawContent is None:
+                    with metrics.timer('minio.download'):
+                        rawContent = self.lnd_minio_client.download(objectPath=lndObjectPath)
+                with metrics.timer('pdf.extract', len(rawContent)):
+                    text = extractPDFText(rawContent)
+                with metrics.timer('minhash', len(rawContent)):
+                    signature = self.nearDuplicates.signature(text)
+                with metrics.timer('lsh'):
+                    fields, failures = self.nearDuplicates.assign(Id, signature)
+                self._reportFailures(failures)
+                record.update(fields)
+            with metrics.timer('minio.copy'):
+                stgFilePath = self.stg_minio_client.copyFrom(self.lnd_minio_client.bucket_name, lndObjectPath, stgObjectPath)
+            fileHash = item['fileHash']
+        stagingMetadata(record, stgFilePath, fileHash)
+        with metrics.timer('staging.upsert'):
+            failures = self.mongo_client.bufferUpsert('stg_documents_metadata', {'Id': Id}, record)
+        self._reportFailures(failures)
+        metrics.increment('items.staged')
         return item
+
+    def _reportFailures(self, failures):
+        """
+        Logs the Ids whose staging metadata or signature could not be written by a bulk write.
+
+        Args:
+        ---------------------
+            failures: list of dicts with the keys Id and error as returned by MongoDBClient
+        """
+        if not failures:
+            return
+        self.metrics.increment('errors.staging.upsert', len(failures))
+        helperClass = getattr(self.spider, 'helperClass', None)
+        for failure in failures:
+            message = f"Staging upsert failed for item ID {failure['Id']}: {failure['error']}"
+            if helperClass is not None:
+                helperClass.logAction('error', 'Staging Bulk Write', message)
+            else:
+                self.spider.logger.error(message)
@@ -0,0 +1,114 @@
+from scraper.exception.Exception import InvalidOperation
+from datetime import timedelta
+
+
+class CronSchedule:
+    """
+        Cron-like cadence of a scheduled job: five fields "minute hour day-of-month month day-of-week".
+        Each field is *, a value, a range a-b, a step */n or a-b/n, or a comma separated list of those.
+        Day of week: 0 or 7 is Sunday. As in cron, when both days are restricted a day matching either is due.
+        Ex: "0 2 * * *" every day at 02:00, "30 */6 * * 1-5" every 6 hours at half past on week days.
+    """
+    # (lowest, highest) value of each field
+    bounds = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        """
+        Args:
+        ---------------------
+            expression: the five cron fields separated by spaces
+        """
+        fields = expression.split()
+        if len(fields) != 5:
+            raise InvalidOperation(f'Cron expression {expression} needs 5 fields: minute hour day-of-month month day-of-week')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parseField(field, low, high) for field, (low, high) in zip(fields, self.bounds)
+        )
+        # 7 is Sunday like 0, datetime.weekday() is 0 on Monday
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.anyDay = fields[2] == '*'
+        self.anyWeekday = fields[4] == '*'
+
+    def _parseField(self, field, low, high):
+        """
+        Values allowed by one field.
+
+        Args:
+        ---------------------
+            field: the field text
+            low: lowest value of the field
+            high: highest value of the field
+
+        Returns:
+        ---------------------
+            set: the values
+        """
+        values = set()
+        for part in field.split(','):
+            rangePart, _, step = part.partition('/')
+            try:
+                step = int(step) if step else 1
+                if rangePart == '*':
+                    start, end = low, high
+                elif '-' in rangePart:
+                    start, end = (int(value) for value in rangePart.split('-', 1))
+                else:
+                    start = end = int(rangePart)
+            except ValueError:
+                raise InvalidOperation(f'Invalid cron field {field} in {self.expression}')
+            if step <= 0 or start < low or end > high or start > end:
+                raise InvalidOperation(f'Cron field {field} out of range {low}-{high} in {self.expression}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, moment):
+        """
+        Whether the job is due at the minute of a datetime.
+
+        Args:
+        ---------------------
+            moment: the datetime
+        """
+        return (moment.minute in self.minutes and moment.hour in self.hours and moment.month in self.months
+                and self._dayMatches(moment))
+
+    def nextAfter(self, moment):
+        """
+        Next minute after a datetime at which the job is due.
+
+        Args:
+        ---------------------
+            moment: the datetime
+
+        Returns:
+        ---------------------
+            datetime: the next due minute, None when none is found in the next 4 years (ex: 31st of February)
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=4 * 366)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                # First minute of the next month
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._dayMatches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            if candidate.minute in self.minutes:
+                return candidate
+            candidate += timedelta(minutes=1)
+        return None
+
+    def _dayMatches(self, moment):
+        """
+        Whether the job is due on the day of a datetime, at any time.
+        """
+        dayMatches = moment.day in self.days
+        weekdayMatches = moment.weekday() in self.weekdays
+        if self.anyDay or self.anyWeekday:
+            return dayMatches and weekdayMatches
+        return dayMatches or weekdayMatches
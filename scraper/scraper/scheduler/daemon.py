@@ -0,0 +1,338 @@
+"""
+    Resident scheduler running the crawls and the transforms on cron-like cadences from one process, instead of a cold
+    docker compose run per run: Scrapy, the MongoDB and MinIO connection pools, the transform worker processes and
+    the known Ids of incremental crawls stay loaded between runs.
+
+    Jobs are read from a JSON file (SCHEDULER_CONFIG, default schedule.json):
+        {"jobs": [
+            {"name": "labour-court", "kind": "crawl", "cron": "0 2 * * *", "lookbackDays": 14, "transform": true,
+             "arguments": {"query": "labour", "body": "Labour Court", "partition": 7, "incremental": 1}},
+            {"name": "weekly-transform", "kind": "transform", "cron": "0 5 * * 0", "lookbackDays": 90}
+        ]}
+    A job covers the lookbackDays days up to the day it runs. With "transform": true a crawl is followed by a
+    transform of the decision dates of the items it stored. A job still running when it is due again is skipped,
+    crawls run one at a time and so do transforms.
+
+    Usage, from the scrapy project directory:
+        python -m scraper.scheduler.daemon [--config schedule.json]
+"""
+from scraper.scheduler.cron import CronSchedule
+from scraper.spiders.WorkplaceRelationSpider import WorkplaceRelationSpider
+from scraper.transformation.transform import Transform, createWorkerPool
+from scraper.helper.HelperFunction import HelperFunction
+from scraper.helper.mongoClient import MongoDBClient
+from scraper.exception.Exception import InvalidOperation
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from scrapy.utils.log import configure_logging
+from scrapy import signals
+from twisted.internet import defer, threads
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import json
+import os
+
+
+class ScheduledJob:
+    """
+        One job of the schedule: a crawl or a transform of the last lookbackDays days.
+    """
+    kinds = ('crawl', 'transform')
+
+    def __init__(self, definition):
+        """
+        Args:
+        ---------------------
+            definition: the job as read from the schedule file
+        """
+        self.name = definition['name']
+        self.kind = definition.get('kind', 'crawl')
+        if self.kind not in self.kinds:
+            raise InvalidOperation(f'Unknown kind {self.kind} of job {self.name}, expected one of {", ".join(self.kinds)}')
+        self.schedule = CronSchedule(definition['cron'])
+        self.lookbackDays = int(definition.get('lookbackDays', 7))
+        self.arguments = dict(definition.get('arguments', {}))
+        self.chainTransform = bool(definition.get('transform', False))
+
+    def window(self, now):
+        """
+        First and last day covered by a run starting at a datetime.
+
+        Args:
+        ---------------------
+            now: start of the run
+        """
+        endDate = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return endDate - timedelta(days=self.lookbackDays), endDate
+
+
+def loadJobs(path):
+    """
+        Reads the jobs of a schedule file.
+
+    Args:
+    ---------------------
+        path: the JSON file
+
+    Returns:
+    ---------------------
+        list: the ScheduledJob
+    """
+    definitions = json.loads(Path(path).read_text()).get('jobs', [])
+    jobs = [ScheduledJob(definition) for definition in definitions]
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise InvalidOperation(f'Job names of {path} have to be unique')
+    return jobs
+
+
+def transformWindows(dates):
+    """
+        Smallest set of day windows holding the given decision dates, consecutive days sharing a window.
+
+    Args:
+    ---------------------
+        dates: the decision dates (datetime at midnight)
+
+    Returns:
+    ---------------------
+        list: (first day, last day) per window
+    """
+    windows = []
+    for day in sorted(dates):
+        if windows and day - windows[-1][1] <= timedelta(days=1):
+            windows[-1][1] = day
+        else:
+            windows.append([day, day])
+    return [tuple(window) for window in windows]
+
+
+class Scheduler:
+    """
+        Runs the jobs when they are due on the Twisted reactor: crawls through one CrawlerRunner, transforms on a
+        reactor thread. Checked once per minute, minutes missed while the reactor was busy are caught up.
+
+        Kept warm between runs:
+            - the shared MongoClient (a MongoDBClient is held so its pool is never released) and Minio client (clientFactory)
+            - the transform worker processes (TRANSFORM_WORKERS), recreated if one of them died
+            - the known Ids of incremental crawls per body, reloaded every SCHEDULER_IDS_REFRESH_HOURS (default 24)
+    """
+
+    def __init__(self, jobs, settings, runner=None):
+        """
+        Args:
+        ---------------------
+            jobs: the ScheduledJob to run
+            settings: the Scrapy project settings
+            runner: CrawlerRunner running the crawls, created from the settings when None
+        """
+        self.jobs = jobs
+        self.runner = runner or CrawlerRunner(settings)
+        logFileName = Path('Log') / ('Scheduler_' + datetime.now().strftime('%Y%m%d%H%M%S') + '_Log.txt')
+        self.helperClass = HelperFunction(logFileFullPath=logFileName, loggerLevel='INFO')
+        self.mongoClient = MongoDBClient()
+        self.workers = max(1, int(os.getenv('TRANSFORM_WORKERS') or os.cpu_count() or 1))
+        self.cpuPool = None
+        # body -> (known Ids, loadedAt)
+        self.knownIds = {}
+        self.idsRefresh = timedelta(hours=float(os.getenv('SCHEDULER_IDS_REFRESH_HOURS', 24)))
+        self.running = set()
+        self.crawlLock = defer.DeferredLock()
+        self.transformLock = defer.DeferredLock()
+        self.lastTick = None
+        self.call = None
+        self.helperClass.logAction('info', 'Scheduler Initiation', f'{len(jobs)} jobs: ' + ', '.join(f'{job.name} ({job.schedule.expression})' for job in jobs))
+
+    def start(self):
+        """
+        Starts checking the jobs, the first check being at the next minute.
+        """
+        self.lastTick = datetime.now().replace(second=0, microsecond=0)
+        for job in self.jobs:
+            self.helperClass.logAction('info', 'Schedule', f'Next run of {job.name}: {job.schedule.nextAfter(self.lastTick)}')
+        self._scheduleTick()
+
+    def _scheduleTick(self):
+        # Imported once installed by main
+        from twisted.internet import reactor
+        delay = 60 - datetime.now().second + 0.5
+        self.call = reactor.callLater(delay, self._tick)
+
+    def _tick(self):
+        """
+        Triggers the jobs due at every minute since the previous check.
+        """
+        now = datetime.now().replace(second=0, microsecond=0)
+        minute = self.lastTick + timedelta(minutes=1)
+        while minute <= now:
+            for job in self.jobs:
+                if job.schedule.matches(minute):
+                    self.trigger(job, minute)
+            minute += timedelta(minutes=1)
+        self.lastTick = now
+        self._scheduleTick()
+
+    def trigger(self, job, now):
+        """
+        Runs a job, unless its previous run is still going.
+
+        Args:
+        ---------------------
+            job: the ScheduledJob
+            now: the minute it is due
+
+        Returns:
+        ---------------------
+            Deferred: fired once the run (and its chained transforms) finished, None when skipped
+        """
+        if job.name in self.running:
+            self.helperClass.logAction('warning', 'Job Skipped', f'{job.name} is due while its previous run is still going.')
+            return None
+        self.running.add(job.name)
+        self.helperClass.logAction('info', 'Job Started', f'{job.name} due at {now}.')
+        if job.kind == 'crawl':
+            deferred = self.runCrawl(job, now)
+        else:
+            startDate, endDate = job.window(now)
+            deferred = self.runTransform(startDate, endDate, job.name)
+
+        def finished(result):
+            self.running.discard(job.name)
+            self.helperClass.logAction('info', 'Job Finished', f'{job.name}.')
+            return result
+
+        def failed(failure):
+            self.running.discard(job.name)
+            self.helperClass.logAction('error', 'Job Failed', f'{job.name}: {failure.getErrorMessage()}')
+
+        return deferred.addCallbacks(finished, failed)
+
+    def runCrawl(self, job, now):
+        """
+        Crawls the window of a job, then transforms the decision dates of the items it stored when the job chains a
+        transform.
+
+        Args:
+        ---------------------
+            job: the ScheduledJob
+            now: the minute it is due
+        """
+        @defer.inlineCallbacks
+        def crawl():
+            startDate, endDate = job.window(now)
+            arguments = dict(job.arguments, start_date=startDate.strftime('%d/%m/%Y'), end_date=endDate.strftime('%d/%m/%Y'))
+            incremental = str(arguments.get('incremental')).lower() in ('1', 'true', 'yes')
+            if incremental:
+                arguments['knownIds'] = self._knownIds(arguments['body'])
+            decisionDates = set()
+            storedIds = []
+
+            def itemScraped(item, response, spider):
+                storedIds.append(item.get('Id'))
+                if item.get('decisionDate'):
+                    decisionDates.add(item['decisionDate'])
+
+            yield self.crawlLock.acquire()
+            try:
+                crawler = self.runner.create_crawler(WorkplaceRelationSpider)
+                crawler.signals.connect(itemScraped, signal=signals.item_scraped, weak=False)
+                yield self.runner.crawl(crawler, **arguments)
+            finally:
+                self.crawlLock.release()
+            self.helperClass.logAction('info', 'Crawl Finished', f'{job.name}: {len(storedIds)} items stored over {len(decisionDates)} decision dates.')
+            if incremental:
+                # The spider loaded the Ids itself when none were cached, they are kept for the next crawls
+                crawler.spider.knownIds.update(storedIds)
+                if arguments['knownIds'] is None:
+                    self.knownIds[arguments['body']] = (crawler.spider.knownIds, datetime.now())
+            if job.chainTransform:
+                for startDate, endDate in transformWindows(decisionDates):
+                    yield self.runTransform(startDate, endDate, job.name)
+
+        return crawl()
+
+    def _knownIds(self, body):
+        """
+        Known Ids cached for a body, None when they have to be loaded again by the spider.
+
+        Args:
+        ---------------------
+            body: the body argument of the crawl
+        """
+        cached = self.knownIds.get(body)
+        if cached is None or datetime.now() - cached[1] > self.idsRefresh:
+            return None
+        return cached[0]
+
+    def runTransform(self, startDate, endDate, reason):
+        """
+        Transforms a window of decision dates on a reactor thread, one transform at a time.
+
+        Args:
+        ---------------------
+            startDate: first day of the window
+            endDate: last day of the window
+            reason: name of the job the transform runs for
+        """
+        self.helperClass.logAction('info', 'Transform Queued', f'{reason}: {startDate:%Y-%m-%d} to {endDate:%Y-%m-%d}.')
+
+        def transform(_):
+            deferred = threads.deferToThread(self._transform, startDate.strftime('%Y-%m-%d'), endDate.strftime('%Y-%m-%d'))
+            return deferred.addBoth(release)
+
+        def release(result):
+            self.transformLock.release()
+            return result
+
+        return self.transformLock.acquire().addCallback(transform)
+
+    def _transform(self, startDate, endDate):
+        """
+        Runs one transform on the warm worker processes, recreated when one of them died.
+        """
+        if self.cpuPool is None:
+            self.cpuPool = createWorkerPool(self.workers)
+        transformer = Transform(start_date=startDate, end_date=endDate, cpuPool=self.cpuPool)
+        try:
+            transformer.run()
+        except BrokenProcessPool:
+            self.cpuPool = None
+            raise
+        finally:
+            transformer.close()
+
+    def stop(self):
+        """
+        Stops checking the jobs and releases the warm workers and connections.
+        """
+        if self.call is not None and self.call.active():
+            self.call.cancel()
+        if self.cpuPool is not None:
+            self.cpuPool.shutdown(cancel_futures=True)
+        self.mongoClient.close()
+        self.helperClass.logAction('info', 'Scheduler Stopped', 'Done.')
+        self.helperClass.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident scheduler of the crawls and transforms.')
+    parser.add_argument('--config', default=os.getenv('SCHEDULER_CONFIG', 'schedule.json'), help='JSON file of the jobs (SCHEDULER_CONFIG)')
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    # The reactor has to be installed before anything imports it
+    install_reactor(settings.get('TWISTED_REACTOR') or 'twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+    configure_logging(settings)
+    from twisted.internet import reactor
+
+    scheduler = Scheduler(loadJobs(args.config), settings)
+    reactor.addSystemEventTrigger('before', 'shutdown', scheduler.stop)
+    reactor.callWhenRunning(scheduler.start)
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
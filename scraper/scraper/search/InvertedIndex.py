@@ -0,0 +1,443 @@
+"""
+    On-disk inverted index of the cleaned staging documents: term -> Ids of the documents holding it, with positions.
+
+    The index is a directory of immutable segments listed by manifest.json. Each segment holds:
+        ids.json      -> Id of each document number of the segment
+        terms.bin     -> the terms, UTF-8, sorted by bytes
+        terms.idx     -> one fixed size record per term (termRecord): term location, document frequency,
+                         location of its documents block and of its positions block
+        docs.bin      -> per term: varint (document number delta, term frequency) per document
+        positions.bin -> per term and document: varint position deltas
+    A document indexed again is written to a new segment: the newest segment holding an Id has its live version, readers
+    mask the older ones from the ids.json of the segments. The manifest only lists the segments, its size and the cost
+    of a segment write do not grow with the number of indexed documents.
+    Segments are merged into one when there are more than maxSegments. Readers memory-map the files and only
+    decode the blocks of the terms of a query, positions only for phrases.
+    Writers of several processes (crawler, transform, scheduler sharing one directory) take an exclusive lock on
+    write.lock and re-read the manifest before each segment write or merge, so none overwrites the segments of another.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+import struct
+import shutil
+import mmap
+import json
+import os
+import re
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks outside POSIX: one writing process per directory
+    fcntl = None
+
+tokenPattern = re.compile(r'\w+')
+# termOffset, termLength, docFreq, docsOffset, docsLength, positionsOffset, positionsLength
+termRecord = struct.Struct('<QIIQIQI')
+
+
+def tokenize(text):
+    """
+        Lower case word tokens of a text, the same for documents and queries.
+
+    Args:
+    ---------------------
+        text: the text
+
+    Returns:
+    ---------------------
+        list: the tokens in order
+    """
+    return tokenPattern.findall(text.lower())
+
+
+def encodeVarints(values, out):
+    """
+        Appends unsigned LEB128 varints to a bytearray.
+
+    Args:
+    ---------------------
+        values: the non negative integers
+        out: the bytearray
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decodeVarints(data):
+    """
+        Decodes a block of unsigned LEB128 varints.
+
+    Args:
+    ---------------------
+        data: the bytes of the block
+
+    Returns:
+    ---------------------
+        list: the integers
+    """
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+        else:
+            values.append(value | (byte << shift))
+            value = 0
+            shift = 0
+    return values
+
+
+def _readManifest(directory):
+    path = Path(directory) / 'manifest.json'
+    if not path.exists():
+        return {'nextSegment': 1, 'segments': []}
+    manifest = json.loads(path.read_text())
+    # Manifests of earlier versions also listed every document location, the segments now hold them
+    return {'nextSegment': manifest['nextSegment'], 'segments': manifest['segments']}
+
+
+def _writeManifest(directory, manifest):
+    # Written aside then renamed, readers always see a complete manifest
+    path = Path(directory) / 'manifest.json'
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(manifest))
+    os.replace(temporary, path)
+
+
+class IndexWriter:
+    """This class adds documents to the index, thread safe.
+
+    Documents are buffered and written as a new segment every segmentSize documents and on commit.
+    Writers of the same process share one writer through IndexWriter.shared, writers of different processes
+    serialize their segment writes and merges on the write.lock file of the directory.
+
+    Methods:
+        shared(directory): The writer of a directory shared by the whole process.
+        add(Id, text): Index the text of a document, replacing its previous version.
+        flush(): Write the buffered documents as a segment.
+        commit(): Write the buffered documents and merge the segments when there are too many.
+    """
+    _writers = {}
+    _writersLock = threading.Lock()
+
+    def __init__(self, directory, segmentSize=1000, maxSegments=10):
+        """Open or create the index.
+
+        Args:
+            directory (str): The index directory.
+            segmentSize (int): Number of buffered documents written as one segment.
+            maxSegments (int): Number of segments above which they are merged into one.
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segmentSize = segmentSize
+        self.maxSegments = maxSegments
+        self.manifest = _readManifest(self.directory)
+        self.lockPath = self.directory / 'write.lock'
+        # Id -> tokens of the documents not written yet
+        self.buffer = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, directory):
+        """The writer of a directory shared by the whole process (transform, fused staging pipeline, scheduler).
+
+        Args:
+            directory (str): The index directory.
+        """
+        key = Path(directory).resolve()
+        with cls._writersLock:
+            writer = cls._writers.get(key)
+            if writer is None:
+                writer = cls._writers[key] = cls(directory)
+            return writer
+
+    def add(self, Id, text):
+        """Index the text of a document, replacing its previous version.
+
+        Args:
+            Id (str): The document Id.
+            text (str): The cleaned text.
+        """
+        tokens = tokenize(text)
+        with self._lock:
+            self.buffer[Id] = tokens
+            if len(self.buffer) >= self.segmentSize:
+                self._flush()
+
+    def flush(self):
+        """Write the buffered documents as a segment, without merging (cheap enough to run before every
+        bulk write of the staging metadata).
+        """
+        with self._lock:
+            self._flush()
+
+    def commit(self):
+        """Write the buffered documents and merge the segments when there are more than maxSegments.
+        """
+        with self._lock:
+            self._flush()
+            if len(self.manifest['segments']) > self.maxSegments:
+                with self._directoryLock():
+                    # Another process may have merged meanwhile
+                    if len(self.manifest['segments']) > self.maxSegments:
+                        self._merge()
+
+    @contextmanager
+    def _directoryLock(self):
+        """Exclusive lock of the directory across processes, with the manifest as last written by any of them.
+        """
+        with open(self.lockPath, 'a') as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                self.manifest = _readManifest(self.directory)
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        documents = list(self.buffer.items())
+        self.buffer = {}
+        with self._directoryLock():
+            name = self._writeSegment(documents)
+            self.manifest['segments'].append(name)
+            _writeManifest(self.directory, self.manifest)
+
+    def _writeSegment(self, documents):
+        """Write a segment from (Id, tokens) pairs.
+
+        Args:
+            documents (list): The documents, their position in the list is their document number.
+
+        Returns:
+            str: The segment name.
+        """
+        postings = {}
+        for docNum, (_, tokens) in enumerate(documents):
+            termPositions = {}
+            for position, term in enumerate(tokens):
+                termPositions.setdefault(term, []).append(position)
+            for term, positions in termPositions.items():
+                postings.setdefault(term, []).append((docNum, positions))
+        return self._writePostings([Id for Id, _ in documents], postings)
+
+    def _writePostings(self, ids, postings):
+        """Write a segment from its Ids and its postings (term -> [(docNum, positions)] in docNum order).
+
+        Returns:
+            str: The segment name.
+        """
+        name = f"seg_{self.manifest['nextSegment']:06d}"
+        self.manifest['nextSegment'] += 1
+        path = self.directory / name
+        # A segment left by a run stopped before its manifest was written is overwritten
+        path.mkdir(exist_ok=True)
+        terms, index, docs, positionsBlock = bytearray(), bytearray(), bytearray(), bytearray()
+        for term, entries in sorted(((term.encode('utf-8'), entries) for term, entries in postings.items()), key=lambda pair: pair[0]):
+            termOffset, docsOffset, positionsOffset = len(terms), len(docs), len(positionsBlock)
+            terms += term
+            previous = 0
+            for docNum, positions in entries:
+                encodeVarints((docNum - previous, len(positions)), docs)
+                previous = docNum
+                encodeVarints([position - before for position, before in zip(positions, [0] + positions[:-1])], positionsBlock)
+            index += termRecord.pack(termOffset, len(term), len(entries), docsOffset, len(docs) - docsOffset,
+                                     positionsOffset, len(positionsBlock) - positionsOffset)
+        (path / 'terms.bin').write_bytes(terms)
+        (path / 'terms.idx').write_bytes(index)
+        (path / 'docs.bin').write_bytes(docs)
+        (path / 'positions.bin').write_bytes(positionsBlock)
+        (path / 'ids.json').write_text(json.dumps(ids))
+        return name
+
+    def _merge(self):
+        """Rewrite the live documents of every segment as one segment.
+        """
+        reader = IndexReader(self.directory)
+        ids = []
+        postings = {}
+        for segment in reader.segments:
+            # Live documents of the segment renumbered in the merged segment
+            renumber = {}
+            for docNum, Id in enumerate(segment.ids):
+                if docNum not in segment.deleted:
+                    renumber[docNum] = len(ids)
+                    ids.append(Id)
+            for position in range(segment.termCount):
+                term, record = segment.termAt(position)
+                for docNum, positions in segment.positions(record).items():
+                    if docNum in renumber:
+                        postings.setdefault(term, []).append((renumber[docNum], positions))
+        reader.close()
+        old = list(self.manifest['segments'])
+        name = self._writePostings(ids, postings)
+        self.manifest['segments'] = [name]
+        _writeManifest(self.directory, self.manifest)
+        for segmentName in old:
+            shutil.rmtree(self.directory / segmentName, ignore_errors=True)
+
+
+class Segment:
+    """This class reads one segment through memory maps.
+    """
+
+    def __init__(self, path):
+        self.ids = json.loads((path / 'ids.json').read_text())
+        # Document numbers indexed again in a newer segment, set by IndexReader
+        self.deleted = set()
+        self._files = []
+        self.terms = self._map(path / 'terms.bin')
+        self.index = self._map(path / 'terms.idx')
+        self.docs = self._map(path / 'docs.bin')
+        self.positionsBlock = self._map(path / 'positions.bin')
+        self.termCount = len(self.index) // termRecord.size
+
+    def _map(self, path):
+        if path.stat().st_size == 0:
+            return b''
+        handle = open(path, 'rb')
+        self._files.append(handle)
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def termAt(self, position):
+        record = termRecord.unpack_from(self.index, position * termRecord.size)
+        return self.terms[record[0]:record[0] + record[1]].decode('utf-8'), record
+
+    def lookup(self, term):
+        """Binary search of a term in the segment dictionary.
+
+        Returns:
+            tuple: The term record, None when the segment does not hold the term.
+        """
+        key = term.encode('utf-8')
+        low, high = 0, self.termCount
+        while low < high:
+            middle = (low + high) // 2
+            record = termRecord.unpack_from(self.index, middle * termRecord.size)
+            current = self.terms[record[0]:record[0] + record[1]]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return record
+        return None
+
+    def documents(self, record):
+        """Document numbers and term frequencies of a term record.
+        """
+        values = decodeVarints(self.docs[record[3]:record[3] + record[4]])
+        docNums, frequencies = [], []
+        docNum = 0
+        for index in range(0, len(values), 2):
+            docNum += values[index]
+            docNums.append(docNum)
+            frequencies.append(values[index + 1])
+        return docNums, frequencies
+
+    def positions(self, record):
+        """Positions of a term record per document number.
+        """
+        docNums, frequencies = self.documents(record)
+        values = decodeVarints(self.positionsBlock[record[5]:record[5] + record[6]])
+        result = {}
+        start = 0
+        for docNum, frequency in zip(docNums, frequencies):
+            position = 0
+            positions = []
+            for delta in values[start:start + frequency]:
+                position += delta
+                positions.append(position)
+            result[docNum] = positions
+            start += frequency
+        return result
+
+    def close(self):
+        for mapped in (self.terms, self.index, self.docs, self.positionsBlock):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for handle in self._files:
+            handle.close()
+
+
+class IndexReader:
+    """This class answers term and phrase lookups over the segments listed by the manifest when it was opened.
+
+    Methods:
+        allIds(): Ids of every indexed document.
+        termIds(term): Ids of the documents holding a term.
+        phraseIds(terms): Ids of the documents holding the terms next to each other.
+        close(): Release the memory maps.
+    """
+
+    def __init__(self, directory):
+        """Open the index.
+
+        Args:
+            directory (str): The index directory.
+        """
+        self.directory = Path(directory)
+        manifest = _readManifest(self.directory)
+        self.segments = [Segment(self.directory / name) for name in manifest['segments']]
+        # The newest segment holding an Id has the live version of the document
+        newer = set()
+        for segment in reversed(self.segments):
+            segment.deleted = {docNum for docNum, Id in enumerate(segment.ids) if Id in newer}
+            newer.update(segment.ids)
+
+    def allIds(self):
+        return {Id for segment in self.segments for docNum, Id in enumerate(segment.ids) if docNum not in segment.deleted}
+
+    def termIds(self, term):
+        result = set()
+        for segment in self.segments:
+            record = segment.lookup(term)
+            if record is None:
+                continue
+            docNums, _ = segment.documents(record)
+            result.update(segment.ids[docNum] for docNum in docNums if docNum not in segment.deleted)
+        return result
+
+    def phraseIds(self, terms):
+        if len(terms) == 1:
+            return self.termIds(terms[0])
+        result = set()
+        for segment in self.segments:
+            records = [segment.lookup(term) for term in terms]
+            if any(record is None for record in records):
+                continue
+            # Rarest term first, its documents bound the candidates
+            candidates = None
+            for record in sorted(records, key=lambda record: record[2]):
+                docNums = set(segment.documents(record)[0])
+                candidates = docNums if candidates is None else candidates & docNums
+                if not candidates:
+                    break
+            candidates = {docNum for docNum in candidates if docNum not in segment.deleted}
+            if not candidates:
+                continue
+            positions = [segment.positions(record) for record in records]
+            for docNum in candidates:
+                starts = set(positions[0][docNum])
+                for offset, termPositions in enumerate(positions[1:], start=1):
+                    starts &= {position - offset for position in termPositions[docNum]}
+                    if not starts:
+                        break
+                if starts:
+                    result.add(segment.ids[docNum])
+        return result
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,168 @@
+"""
+    Boolean and phrase queries over the inverted index:
+        labour court                       -> both terms (AND is implied)
+        labour OR employment               -> either term
+        "unfair dismissal" AND NOT redundancy
+        (pay OR wages) AND "labour court"
+    Terms are tokenized like the documents: a term holding several tokens (ADJ-00012345) is a phrase.
+
+    Usage:
+        python -m scraper.search.query '"unfair dismissal" AND NOT redundancy' [--index Index] [--limit 20]
+"""
+from scraper.search.InvertedIndex import IndexReader, tokenize
+from scraper.exception.Exception import InvalidOperation
+import argparse
+import time
+import os
+import re
+
+queryPattern = re.compile(r'"([^"]*)"|(\()|(\))|([^\s()"]+)')
+
+
+def _tokens(query):
+    """Split a query into ('phrase', text), ('(', None), (')', None), ('AND'|'OR'|'NOT', None) and ('term', text).
+    """
+    tokens = []
+    for phrase, opening, closing, word in queryPattern.findall(query):
+        if opening:
+            tokens.append(('(', None))
+        elif closing:
+            tokens.append((')', None))
+        elif word in ('AND', 'OR', 'NOT'):
+            tokens.append((word, None))
+        elif word:
+            tokens.append(('term', word))
+        else:
+            tokens.append(('phrase', phrase))
+    return tokens
+
+
+def parseQuery(query):
+    """Parse a query into a tree of ('terms', [tokens]), ('and', left, right), ('or', left, right) and ('not', node).
+
+    Args:
+        query (str): The query.
+
+    Returns:
+        tuple: The tree, None for an empty query.
+    """
+    tokens = _tokens(query)
+    position = 0
+
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+
+    def expression():
+        nonlocal position
+        node = conjunction()
+        while peek() == 'OR':
+            position += 1
+            node = ('or', node, conjunction())
+        return node
+
+    def conjunction():
+        nonlocal position
+        node = negation()
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                position += 1
+            node = ('and', node, negation())
+        return node
+
+    def negation():
+        nonlocal position
+        if peek() == 'NOT':
+            position += 1
+            return ('not', negation())
+        return primary()
+
+    def primary():
+        nonlocal position
+        kind = peek()
+        if kind == '(':
+            position += 1
+            node = expression()
+            if peek() != ')':
+                raise InvalidOperation(f'Missing closing parenthesis in query: {query}')
+            position += 1
+            return node
+        if kind in ('term', 'phrase'):
+            text = tokens[position][1]
+            position += 1
+            return ('terms', tokenize(text))
+        raise InvalidOperation(f'Unexpected {kind or "end"} in query: {query}')
+
+    if not tokens:
+        return None
+    node = expression()
+    if position != len(tokens):
+        raise InvalidOperation(f'Unexpected {peek()} in query: {query}')
+    return node
+
+
+def evaluate(node, reader):
+    """Ids of the documents matching a query tree.
+
+    Args:
+        node (tuple): The tree returned by parseQuery.
+        reader (IndexReader): The open index.
+
+    Returns:
+        set: The matching Ids.
+    """
+    if node is None:
+        return set()
+    kind = node[0]
+    if kind == 'terms':
+        # A term without any word token (punctuation) matches every document
+        return reader.phraseIds(node[1]) if node[1] else reader.allIds()
+    if kind == 'or':
+        return evaluate(node[1], reader) | evaluate(node[2], reader)
+    if kind == 'and':
+        # a AND NOT b is a difference, not an intersection with the complement of b
+        if node[2][0] == 'not':
+            return evaluate(node[1], reader) - evaluate(node[2][1], reader)
+        if node[1][0] == 'not':
+            return evaluate(node[2], reader) - evaluate(node[1][1], reader)
+        left = evaluate(node[1], reader)
+        return left & evaluate(node[2], reader) if left else left
+    return reader.allIds() - evaluate(node[1], reader)
+
+
+def search(query, directory=None):
+    """Ids of the documents matching a query.
+
+    Args:
+        query (str): The query.
+        directory (str): The index directory, INDEX_DIR (default Index) when None.
+
+    Returns:
+        set: The matching Ids.
+    """
+    reader = IndexReader(directory or os.getenv('INDEX_DIR') or 'Index')
+    try:
+        return evaluate(parseQuery(query), reader)
+    finally:
+        reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the decisions indexed by the transform.')
+    parser.add_argument('query', help='boolean query, ex: "unfair dismissal" AND NOT redundancy')
+    parser.add_argument('--index', default=os.getenv('INDEX_DIR') or 'Index', help='index directory (INDEX_DIR)')
+    parser.add_argument('--limit', type=int, default=20, help='number of Ids printed')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reader = IndexReader(args.index)
+    opened = time.perf_counter()
+    ids = evaluate(parseQuery(args.query), reader)
+    elapsed = time.perf_counter() - opened
+    reader.close()
+    print(f'{len(ids)} documents ({elapsed * 1000:.1f} ms, index opened in {(opened - start) * 1000:.1f} ms)')
+    for Id in sorted(ids)[:args.limit]:
+        print(Id)
+
+
+if __name__ == '__main__':
+    main()
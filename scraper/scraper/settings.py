@@ -7,6 +7,8 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = "scraper"
 
 SPIDER_MODULES = ["scraper.spiders"]
@@ -22,10 +24,33 @@ USER_AGENT = "workplacerelations-scraper/1.0"
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
+# Send If-None-Match/If-Modified-Since for documents scraped by previous crawls and skip unchanged ones
+CONDITIONAL_REQUESTS_ENABLED = True
+
+# Plan the date windows from the result counts cached by previous crawls (partition_density collection)
+# and split windows holding more than ADAPTIVE_TARGET_PAGES search pages
+ADAPTIVE_PARTITIONING_ENABLED = True
+ADAPTIVE_TARGET_PAGES = 5
+
+# Read the result count on the first page of each partition and request all its other pages at once
+# instead of following pageNumber one page after the other (pages are still chained when the count can not be read
+# and in incremental crawls)
+SEARCH_FANOUT_ENABLED = True
+# Requests downloaded in parallel from the site when fan-out is on, one at a time otherwise: with a single
+# request per domain the fanned out pages would still be fetched one after the other
+SEARCH_FANOUT_CONCURRENCY = 4
+
 # Concurrency and throttling settings
 #CONCURRENT_REQUESTS = 16
-CONCURRENT_REQUESTS_PER_DOMAIN = 1
-DOWNLOAD_DELAY = 1
+CONCURRENT_REQUESTS_PER_DOMAIN = SEARCH_FANOUT_CONCURRENCY if SEARCH_FANOUT_ENABLED else 1
+# Minimum delay between two request starts to the site, AutoThrottle raises it with the server latency.
+# It applies whatever the concurrency, so it is divided by it for the parallel requests not to be spaced out again
+DOWNLOAD_DELAY = 1 / CONCURRENT_REQUESTS_PER_DOMAIN
+
+# Profile one call out of SCRAPER_PROFILE_SAMPLE of the spider callbacks and of the pipeline storage:
+# cpu (cProfile, pstats files in Log/) or mem (tracemalloc, top allocations in Log/), empty disables profiling
+SCRAPER_PROFILE = os.getenv("SCRAPER_PROFILE", "")
+SCRAPER_PROFILE_SAMPLE = int(os.getenv("SCRAPER_PROFILE_SAMPLE", 10))
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -44,24 +69,65 @@ DOWNLOAD_DELAY = 1
 #SPIDER_MIDDLEWARES = {
 #    "scraper.middlewares.ScraperSpiderMiddleware": 543,
 #}
+# Record the requests of each crawl in the crawl_frontier collection, a crawl restarted with the same arguments
+# resumes where it stopped and never requests a completed partition again
+FRONTIER_ENABLED = True
+# Unfinished crawls not resumed within this many days are deleted from crawl_frontier (0 keeps them)
+FRONTIER_MAX_AGE_DAYS = 30
+SPIDER_MIDDLEWARES = {
+    "scraper.middlewares.FrontierSpiderMiddleware": 543,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #DOWNLOADER_MIDDLEWARES = {
 #    "scraper.middlewares.ScraperDownloaderMiddleware": 543,
 #}
+# Crawl memory budget: document requests wait before their download while the items held by the pipeline
+# add up to MAX_INFLIGHT_BYTES of content or MAX_PENDING_ITEMS items (0 disables a limit)
+MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+MAX_PENDING_ITEMS = 32
+DOWNLOADER_MIDDLEWARES = {
+    "scraper.middlewares.BudgetDownloaderMiddleware": 543,
+}
+# Priority of decision pages and attachments over search pages (0 and below), so that the documents found
+# on a search page are downloaded before new search pages are requested
+DOCUMENT_REQUEST_PRIORITY = 100
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    "scrapy.extensions.telnet.TelnetConsole": None,
 #}
+# Per-stage latency histograms and counters, mirrored to the Scrapy stats and summarized in Log/Metrics_Scraping_<timestamp>.json
+EXTENSIONS = {
+    "scraper.metrics.Metrics.MetricsExtension": 500,
+}
+# Port of the Prometheus text endpoint (http://127.0.0.1:<port>/metrics) served during the crawl, 0 disables it
+METRICS_PORT = 0
+# Interface of the endpoint, 0.0.0.0 to reach it from outside a container
+METRICS_HOST = "127.0.0.1"
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
     "scraper.pipelines.ScraperPipeline": 300,
+    "scraper.pipelines.StagingPipeline": 400,
 }
+# Store items (hash, MinIO upload, MongoDB upsert) on a thread pool so downloading continues meanwhile
+PIPELINE_ASYNC_ENABLED = True
+# Maximum number of items being stored at the same time, further items wait for a free slot
+PIPELINE_MAX_INFLIGHT = 8
+# Number of threads used to store items
+PIPELINE_STORAGE_THREADS = 4
+# Documents larger than this are spooled to a temporary file while hashed and uploaded to MinIO in parts
+STREAM_SPOOL_THRESHOLD = 8 * 1024 * 1024
+STREAM_PART_SIZE = 16 * 1024 * 1024
+# Produce the staging layer in the crawl (StagingPipeline) from the content still in memory, the batch transform
+# then skips the staged records. Off by default, the transform produces the staging layer
+FUSED_STAGING_ENABLED = os.getenv("FUSED_STAGING_ENABLED", "0").lower() in ("1", "true", "yes")
+# HTML cleaner engine of the fused staging, bs4 or lxml (as TRANSFORM_HTML_CLEANER)
+FUSED_STAGING_HTML_CLEANER = os.getenv("TRANSFORM_HTML_CLEANER", "bs4")
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -78,7 +144,8 @@ ITEM_PIPELINES = {
 AUTOTHROTTLE_ENABLED = True
 AUTOTHROTTLE_START_DELAY = 2
 AUTOTHROTTLE_MAX_DELAY = 10
-AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+# As many requests in flight on average as allowed per domain, AutoThrottle keeps the delay near latency / concurrency
+AUTOTHROTTLE_TARGET_CONCURRENCY = float(CONCURRENT_REQUESTS_PER_DOMAIN)
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
@@ -87,6 +154,21 @@ AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
 #HTTPCACHE_DIR = "httpcache"
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+# Responses are cached in the MinIO bucket HTTPCACHE_MINIO_BUCKET, keyed by request fingerprint (HTTPCACHE_ENABLED=1 to enable)
+# HTTPCACHE_REPLAY=1 re-runs a crawl from the cache only: nothing expires and requests missing from the cache are dropped
+HTTPCACHE_REPLAY = os.getenv("HTTPCACHE_REPLAY", "0").lower() in ("1", "true", "yes")
+HTTPCACHE_ENABLED = HTTPCACHE_REPLAY or os.getenv("HTTPCACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+HTTPCACHE_IGNORE_MISSING = HTTPCACHE_REPLAY
+HTTPCACHE_STORAGE = "scraper.helper.minioCacheStorage.MinioCacheStorage"
+HTTPCACHE_MINIO_BUCKET = "httpcache"
+# 304 answers to conditional requests are not cached, the cached 200 response stays the reference
+HTTPCACHE_IGNORE_HTTP_CODES = [304, 500, 502, 503, 504]
+# TTL in seconds per URL class, 0 never expires: search pages whose window starts in the last HTTPCACHE_RECENT_DAYS days,
+# older search pages, and decision pages / attachments
+HTTPCACHE_RECENT_DAYS = 30
+HTTPCACHE_TTL_SEARCH_RECENT = 6 * 3600
+HTTPCACHE_TTL_SEARCH = 30 * 24 * 3600
+HTTPCACHE_TTL_DOCUMENT = 0
 
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
@@ -1,9 +1,14 @@
 import scrapy as sp
 from pathlib import Path
 from scraper.helper.HelperFunction import HelperFunction
+from scraper.helper.mongoClient import MongoDBClient
 from datetime import datetime
 from urllib.parse import urlparse, parse_qs, urljoin
 from scraper.items import ScraperItem
+from scraper.metrics.Metrics import Metrics, timedCallback
+from scraper.metrics.Profiler import createProfiler
+import re
+import math
 
 class WorkplaceRelationSpider(sp.Spider):
     """
@@ -16,7 +21,7 @@ class WorkplaceRelationSpider(sp.Spider):
     name = 'documents'
     allowed_domains = ['www.workplacerelations.ie', 'workplacerelations.ie']
 
-    def __init__(self, start_date, end_date, query, body, partition,*args, **kwargs):
+    def __init__(self, start_date, end_date, query, body, partition, incremental=None, knownIds=None, *args, **kwargs):
         """
             Overriding the initialization of Spider to include additional parameters needed to construct the urls
             in the helper class.
@@ -32,24 +37,71 @@ class WorkplaceRelationSpider(sp.Spider):
                     - Workplace Relations Commission: 15376
                     Multiple Keywords can be provided at a time separated by a comma
                 partition: Select partitioning of dates in days, Ex: 1 for 1 day, 7 for a week, 30 for a month
+                incremental: When 1, documents whose Id is already in lnd_documents_metadata are not requested
+                    and a partition stops paginating at the first page holding only known Ids
+                knownIds: Set of known Ids kept by the caller (scheduler) across crawls, loaded from MongoDB when None
             Returns:
             ---------------------
                 None
         """
         super().__init__(*args, **kwargs)
         self.body = body
+        self.start_date = start_date
+        self.end_date = end_date
+        self.query = query
+        self.partition = partition
         now = datetime.now()
         # Format the datetime object into the specified string format
         logFileName = 'Scraping_' + now.strftime('%Y%m%d%H%M%S') + '_Log.txt'
         # Construct Log File Name Timestamp For different Runs Monitoring
         logFileName = Path('Log') / logFileName
         # Initialize helper class that will help construct urls based on inputs provided
-        self.helperClass = HelperFunction(logFileFullPath = logFileName, loggerLevel='DEBUG')
+        self.helperClass = HelperFunction(logFileFullPath = logFileName, loggerLevel='INFO')
+        # Per-stage latencies and counters of the crawl, attached to the Scrapy stats by MetricsExtension
+        self.metrics = Metrics('Scraping')
+        # Set from SCRAPER_PROFILE in from_crawler, None leaves the callbacks unwrapped
+        self.profiler = None
+        # Persistent request frontier, set by FrontierSpiderMiddleware when FRONTIER_ENABLED
+        self.frontier = None
         # hold urls to be called by scraper
         self.urls = self.helperClass.constructScrapingList(start_date=start_date, end_date=end_date, query=query, body=self.body, partition=partition)
+        # documentURL -> validators stored by previous crawls, loaded in start_requests when conditional requests are enabled
+        self.validators = {}
+        self.mongoClient = None
+        # Ids already scraped for the requested bodies, loaded in start_requests in incremental mode
+        self.incremental = str(incremental).lower() in ('1', 'true', 'yes')
+        self.knownIds = knownIds if knownIds is not None else set()
+        self.knownIdsLoaded = knownIds is not None
+        # Adaptive partitioning, enabled in start_requests from ADAPTIVE_PARTITIONING_ENABLED
+        self.adaptive = False
+        self.targetPages = None
+        self.bodyIds = self.helperClass.mapBodyIds(self.body)
+        # Request every page of a partition from its first page, enabled in start_requests from SEARCH_FANOUT_ENABLED
+        self.fanOut = False
+        # Priority of document requests over search pages, set in start_requests from DOCUMENT_REQUEST_PRIORITY
+        self.documentPriority = 0
         self.helperClass.logAction('info', 'Spider Initiation', 'Done.')
         
     
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """
+            Creates the spider from the crawler. (From Docs)
+            When SCRAPER_PROFILE is set, the callbacks are replaced by profiled ones on the instance.
+
+            Args:
+            ---------------------
+                crawler: the crawler running the spider
+        """
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.profiler = createProfiler(crawler.settings.get('SCRAPER_PROFILE'), 'Scraping', crawler.settings.getint('SCRAPER_PROFILE_SAMPLE', 10))
+        if spider.profiler is not None:
+            spider.parse = spider.profiler.wrapGenerator('parse.search', spider.parse)
+            spider.parse_html = spider.profiler.wrapGenerator('parse.html', spider.parse_html)
+            spider.parse_binary = spider.profiler.wrapGenerator('parse.binary', spider.parse_binary)
+            spider.helperClass.logAction('info', 'Profiling', f'{spider.profiler.mode} profiling of 1 call out of {spider.profiler.sampleRate}.')
+        return spider
+
     def start_requests(self):
         """
             Starts the process of yielding requests. 
@@ -62,13 +114,32 @@ class WorkplaceRelationSpider(sp.Spider):
                 None
         """
         i = 0
+        # A replay re-parses every cached page, unchanged documents are not skipped
+        if self.settings.getbool('CONDITIONAL_REQUESTS_ENABLED') and not self.settings.getbool('HTTPCACHE_REPLAY'):
+            self.mongoClient = self.mongoClient or MongoDBClient()
+            self.validators = self.mongoClient.findValidators('document_validators')
+            self.helperClass.logAction('info', 'Conditional Requests', f'Validators loaded for {len(self.validators)} documents.')
+        if self.incremental and not self.knownIdsLoaded:
+            self.mongoClient = self.mongoClient or MongoDBClient()
+            self.knownIds = self._loadKnownIds()
+            self.helperClass.logAction('info', 'Incremental Crawl', f'{len(self.knownIds)} known Ids loaded.')
+        # Incremental crawls keep chaining pages, so that a page holding only known Ids stops the partition
+        self.fanOut = self.settings.getbool('SEARCH_FANOUT_ENABLED') and not self.incremental
+        # Documents go before search pages, so a partition is drained before new pages add to the queue
+        self.documentPriority = self.settings.getint('DOCUMENT_REQUEST_PRIORITY', 0)
+        if self.settings.getbool('ADAPTIVE_PARTITIONING_ENABLED'):
+            self._planAdaptivePartitions()
+        # A resumed crawl requests the windows planned by the crawl it resumes
+        if self.frontier is not None:
+            self.urls = self.frontier.plan(self.urls)
         # For each url constructed in helper class constructScrapingList yiel request
         self.helperClass.logAction('info', 'Start requests', 'Traversing through requests started.')
         for url in self.urls:
             i += 1
-            self.helperClass.logAction('info', 'Initaite reqeusts', 'Request ' + str(i) + ': ' + str(url))
+            self.helperClass.logAction('info', 'Initaite reqeusts', 'Request %s: %s', args=(i, url), sampled=True)
             yield sp.Request(url=url, callback=self.parse, meta={'partition_date': self._extract_partition(url)})
 
+    @timedCallback('parse.search')
     def parse(self, response):
         """
             Parses the response retrievd from each url. 
@@ -86,13 +157,26 @@ class WorkplaceRelationSpider(sp.Spider):
         # For every item found in the response page
         # path to items: <div> -> <ul> -> <li class="each-item>
         # Css can find class directly with no need to move through paths
-        self.helperClass.logAction('info', 'Parse Response', 'parsing responses started, items extraction in progress.')
+        self.helperClass.logAction('info', 'Parse Response', 'parsing responses started, items extraction in progress.', sampled=True)
+        # The first page of a window tells how many results it holds, windows above the target are split in two
+        if self.adaptive and 'pageNumber' not in response.meta:
+            halves = self._splitDenseWindow(response)
+            if halves:
+                for url in halves:
+                    yield sp.Request(url=url, callback=self.parse, meta={'partition_date': self._extract_partition(url)})
+                return
         listOfItems = response.css('li.each-item')
+        knownCount = 0
         for row in listOfItems:
+            Id = row.css('span.refNO::text').get()
+            # In incremental mode documents scraped by a previous crawl are not requested again
+            if Id in self.knownIds:
+                knownCount += 1
+                continue
             # Initialize item
             item = ScraperItem()
             # Populate item
-            item['Id'] = row.css('span.refNO::text').get()
+            item['Id'] = Id
             item['title'] = row.css('h2.title a::text').get()
             item['description'] = row.css('p.description::text').get()
             item['date'] = row.css('span.date::text').get()
@@ -102,35 +186,222 @@ class WorkplaceRelationSpider(sp.Spider):
             item['documentURL'] = documentURL
             item['body'] = self.body.replace(',', '-')
             
+            # Send a conditional request when the document was already scraped
+            meta, headers = self._conditionalRequest(item)
+            
             # Decision step to perform requirements as provided in assesment
             # If pdf, doc, docx then call parse_binary
             if documentURL.endswith(('.pdf', '.doc', '.docx')):
-                yield response.follow(documentURL,callback=self.parse_binary,meta={'item': item})
+                yield response.follow(documentURL,callback=self.parse_binary,meta=meta,headers=headers,priority=self.documentPriority)
             # else parse_html
             else:
-                yield response.follow(documentURL,callback=self.parse_html,meta={'item': item})
+                yield response.follow(documentURL,callback=self.parse_html,meta=meta,headers=headers,priority=self.documentPriority)
         # The below logic is for pagination
+        # The first page tells how many pages the partition holds, all of them are then requested at once
+        pageCount = self._pageCount(response) if self.fanOut and 'pageNumber' not in response.meta else None
+        # Results are sorted newest first, a page holding only known Ids means the rest of the partition is known
+        if listOfItems and knownCount == len(listOfItems):
+            self.helperClass.logAction('info', 'Pagination', f"Page holds only known Ids, stopping partition {response.meta['partition_date']}.")
+        # Pages requested by the fan-out of the first page do not request further pages
+        elif response.meta.get('fanOut'):
+            pass
+        elif listOfItems and pageCount:
+            self.helperClass.logAction('info', 'Pagination', 'Requesting pages 2 to %s of partition %s', args=(pageCount, response.meta['partition_date']), sampled=True)
+            for pageNumber in range(2, pageCount + 1):
+                # Earlier pages first, and after the documents already queued (priority 0)
+                yield response.follow(self._pageURL(response.url, pageNumber), callback=self.parse, priority=-pageNumber,
+                                      meta={'partition_date': response.meta['partition_date'], 'pageNumber': pageNumber, 'fanOut': True})
         # If items exist on this page, try next page
-        if listOfItems and len(listOfItems) > 0:
+        elif listOfItems and len(listOfItems) > 0:
             current_page = response.meta.get('pageNumber', 1)
             # After receiving the items of first page, increment page number by 1
             next_page = current_page + 1
-
-            # If pageNumber in request then remove pageNumber to add new one
-            if 'pageNumber=' in response.url:
-                base_url = response.url.split('&pageNumber=')[0]
-            # If pageNumber not in request then first call the no action
-            else:
-                base_url = response.url
             # Get url of next page
-            next_page_url = f"{base_url}&pageNumber={next_page}"
+            next_page_url = self._pageURL(response.url, next_page)
 
-            self.helperClass.logAction('info', 'Pagination', f'Following pageNumber={next_page}'
-            )
+            self.helperClass.logAction('info', 'Pagination', 'Following pageNumber=%s', args=(next_page,), sampled=True)
             
             yield response.follow(next_page_url,callback=self.parse,meta={'partition_date': response.meta['partition_date'],'pageNumber': next_page})
 
-        self.helperClass.logAction('info', 'Parse Response', 'Parsing responses finished, items extraction is finalized.')
+        self.helperClass.logAction('info', 'Parse Response', 'Parsing responses finished, items extraction is finalized.', sampled=True)
+
+    def _planAdaptivePartitions(self):
+        """
+            Re-plans the scraping windows from the result densities learned by previous crawls
+            of the same query and bodies (partition_density collection).
+
+            Returns:
+            ---------------------
+                None
+        """
+        self.adaptive = True
+        self.targetPages = self.settings.getint('ADAPTIVE_TARGET_PAGES', 5)
+        self.mongoClient = self.mongoClient or MongoDBClient()
+        observations = self.mongoClient.getCollection('partition_density').find({'query': self.query, 'body': self.bodyIds})
+        density = self.helperClass.buildDayDensity(observations)
+        if not density:
+            self.helperClass.logAction('info', 'Adaptive Partitioning', 'No density cached yet, using the fixed partition.')
+            return
+        self.urls = self.helperClass.constructScrapingList(start_date=self.start_date, end_date=self.end_date, query=self.query, body=self.body,
+                                                           partition=self.partition, density=density, targetPages=self.targetPages)
+        self.helperClass.logAction('info', 'Adaptive Partitioning', f'{len(self.urls)} windows planned from {len(density)} days of cached density.')
+
+    def _splitDenseWindow(self, response):
+        """
+            Reads the result count of the first page of a window, caches it as density for the next crawls,
+            and splits the window when it holds more than the target number of pages.
+
+            Args:
+            ---------------------
+                response: first search page of a window
+
+            Returns:
+            ---------------------
+                urls: URLs of both halves of the window, empty when the window is kept
+        """
+        resultCount = self._extract_result_count(response)
+        if resultCount is None:
+            return []
+        params = parse_qs(urlparse(response.url).query)
+        filterQuery = {
+            'query': self.query,
+            'body': self.bodyIds,
+            'from': datetime.strptime(params['from'][0], '%d/%m/%Y'),
+            'to': datetime.strptime(params['to'][0], '%d/%m/%Y'),
+        }
+        observation = dict(filterQuery, count=resultCount, observedAt=datetime.utcnow())
+        for failure in self.mongoClient.bufferUpsert('partition_density', filterQuery, observation):
+            self.helperClass.logAction('error', 'Adaptive Partitioning', f"Density could not be cached: {failure['error']}")
+
+        if math.ceil(resultCount / self.helperClass.resultsPerPage) <= self.targetPages:
+            return []
+        halves = self.helperClass.splitScrapingURL(response.url)
+        if halves:
+            self.helperClass.logAction('info', 'Adaptive Partitioning', f'{resultCount} results in {response.url}, window split in two.')
+        return halves
+
+    def _pageCount(self, response):
+        """
+            Number of result pages of a partition, read from the result count of its first page.
+
+            Args:
+            ---------------------
+                response: first search page of a partition
+
+            Returns:
+            ---------------------
+                pageCount: number of pages, None when the result count can not be read (pages are then chained)
+        """
+        resultCount = self._extract_result_count(response)
+        if resultCount is None:
+            return None
+        return math.ceil(resultCount / self.helperClass.resultsPerPage)
+
+    def _pageURL(self, url, pageNumber):
+        """
+            URL of a result page of the partition of a search URL.
+
+            Args:
+            ---------------------
+                url: any search URL of the partition
+                pageNumber: the page wanted
+
+            Returns:
+            ---------------------
+                url: the search URL with its pageNumber
+        """
+        # If pageNumber in request then remove pageNumber to add new one
+        base_url = url.split('&pageNumber=')[0]
+        return f"{base_url}&pageNumber={pageNumber}"
+
+    @staticmethod
+    def _extract_result_count(response):
+        """
+            Extracts the total number of results from a search page ("Shows 1 to 10 of 18 results").
+
+            Args:
+            ---------------------
+                response: search page response
+
+            Returns:
+            ---------------------
+                resultCount: number of results, None when it can not be read
+        """
+        text = ' '.join(response.css('div.searchhead::text').getall())
+        match = re.search(r'of\s+(\d+)\s+results', text)
+        return int(match.group(1)) if match else None
+
+    def _loadKnownIds(self):
+        """
+            Loads the Ids already scraped for the requested bodies. The body is only kept in the landing file path
+            (landing/<bodies>_<partition_date>/<Id>.<extension>), so documents are matched on it.
+
+            Returns:
+            ---------------------
+                knownIds: set of Ids
+        """
+        bodies = '|'.join(re.escape(body.strip()) for body in self.body.split(','))
+        filterQuery = {'filePath': {'$regex': f'^landing/[^/]*({bodies})[^/]*_'}}
+        return self.mongoClient.findIds('lnd_documents_metadata', filterQuery)
+
+    def _conditionalRequest(self, item):
+        """
+            Builds the meta and headers of a document request. When validators were stored for the document
+            by a previous crawl, If-None-Match/If-Modified-Since are sent and a 304 is let through to the callback.
+
+            Args:
+            ---------------------
+                item: the item of the document to request
+
+            Returns:
+            ---------------------
+                meta, headers: the request meta and headers
+        """
+        meta = {'item': item}
+        headers = {}
+        validators = self.validators.get(item['documentURL'])
+        if not validators:
+            return meta, headers
+        meta['validators'] = validators
+        meta['handle_httpstatus_list'] = [304]
+        item['storedFileHash'] = validators.get('fileHash')
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('lastModified'):
+            headers['If-Modified-Since'] = validators['lastModified']
+        return meta, headers
+
+    def _isUnchanged(self, response):
+        """
+            Checks if the document of a conditional request did not change since the previous crawl,
+            either because the server answered 304 or because it returned the same validators.
+            The validators of the response are set on the item.
+
+            Args:
+            ---------------------
+                response: the document response
+
+            Returns:
+            ---------------------
+                bool: True when the document can be skipped
+        """
+        item = response.meta['item']
+        if response.status == 304:
+            return True
+        etag = response.headers.get('ETag')
+        lastModified = response.headers.get('Last-Modified')
+        contentLength = response.headers.get('Content-Length')
+        item['etag'] = etag.decode() if etag else None
+        item['lastModified'] = lastModified.decode() if lastModified else None
+        item['contentLength'] = contentLength.decode() if contentLength else None
+
+        validators = response.meta.get('validators')
+        if not validators:
+            return False
+        if item['etag'] and item['etag'] == validators.get('etag'):
+            return True
+        return bool(item['lastModified']) and item['lastModified'] == validators.get('lastModified') \
+            and item['contentLength'] == validators.get('contentLength')
 
     def _extract_partition(self, url):
         """
@@ -148,10 +419,11 @@ class WorkplaceRelationSpider(sp.Spider):
         parsed = urlparse(url)
         params = parse_qs(parsed.query)
         paritionDate = params['from'][0].replace('/', '-')
-        self.helperClass.logAction('info', 'Parition Date', 'Parition Date Extracted: ' + str(paritionDate))
+        self.helperClass.logAction('info', 'Parition Date', 'Parition Date Extracted: %s', args=(paritionDate,), sampled=True)
         # take the "from" date as the partition identifier
         return paritionDate
     
+    @timedCallback('parse.document')
     def parse_html(self, response):
         """
             This method will help in the decision step of the main parse function in spider class,
@@ -165,18 +437,31 @@ class WorkplaceRelationSpider(sp.Spider):
             ---------------------
                 item: returns the items with additional info provided inside
         """
-        self.helperClass.logAction('info', 'Parse HTML File', 'HTML File Detected.')
         item = response.meta['item']
+        if self._isUnchanged(response):
+            self.helperClass.logAction('info', 'Parse HTML File', 'HTML File Unchanged, skipping item ID %s.', args=(item['Id'],), sampled=True)
+            return
+        self.helperClass.logAction('info', 'Parse HTML File', 'HTML File Detected.', sampled=True)
+        # Attachments are built from the fields of the page before it is yielded: a storage thread of the pipeline
+        # changes the yielded item while this generator keeps running
+        attachmentFields = item.copy()
+        attachmentFields.pop('storedFileHash', None)
         item['fileType'] = 'html'
-        item['rawContent'] = response.text.encode()
+        # A UTF-8 body is passed as is, decoding and re-encoding it would only copy it twice
+        item['rawContent'] = response.body if response.encoding == 'utf-8' else response.text.encode()
         yield item
 
         links = response.css('a::attr(href)').getall()
 
         for href in links:
             if href.lower().endswith(('.pdf', '.doc', '.docx')):
-                yield response.follow(href, callback=self.parse_binary, meta={'item': item.copy()})
+                # An attachment keeps the Id of its page, its validators are stored under its own URL
+                attachment = attachmentFields.copy()
+                attachment['documentURL'] = response.urljoin(href)
+                meta, headers = self._conditionalRequest(attachment)
+                yield response.follow(href, callback=self.parse_binary, meta=meta, headers=headers, priority=self.documentPriority)
     
+    @timedCallback('parse.document')
     def parse_binary(self, response):
         """
             This method will help in the decision step of the main parse function in spider class,
@@ -190,8 +475,31 @@ class WorkplaceRelationSpider(sp.Spider):
             ---------------------
                 item: returns the items with additional info provided inside
         """
-        self.helperClass.logAction('info', 'Parse PDF, Docx, Doc File', 'PDF, Doc, or Docx File Detected.')
         item = response.meta['item']
+        if self._isUnchanged(response):
+            self.helperClass.logAction('info', 'Parse PDF, Docx, Doc File', 'File Unchanged, skipping item ID %s.', args=(item['Id'],), sampled=True)
+            return
+        self.helperClass.logAction('info', 'Parse PDF, Docx, Doc File', 'PDF, Doc, or Docx File Detected.', sampled=True)
         item['fileType'] = response.url.split('.')[-1].lower()
         item['rawContent'] = response.body
-        yield item    
\ No newline at end of file
+        yield item
+
+    def closed(self, reason):
+        """
+            Called when the spider closes. (From Docs)
+            Closes the MongoDB connection used to read the stored documents metadata.
+
+            Args:
+            ---------------------
+                reason: the reason the spider was closed
+        """
+        if self.mongoClient is not None:
+            # Write the densities still buffered before closing
+            for failure in self.mongoClient.flush():
+                self.helperClass.logAction('error', 'Spider Closed', f"Buffered write failed: {failure['error']}")
+            self.mongoClient.close()
+        if self.profiler is not None:
+            for path in self.profiler.close():
+                self.helperClass.logAction('info', 'Profiling', f'Profile written to {path}')
+        self.helperClass.logAction('info', 'Spider Closed', str(reason))
+        self.helperClass.close()
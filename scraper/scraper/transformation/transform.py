@@ -1,13 +1,191 @@
 from scraper.helper.minioClient import MinioClient
 from scraper.helper.mongoClient import MongoDBClient
 from scraper.helper.HelperFunction import HelperFunction
+from scraper.metrics.Metrics import Metrics
+from scraper.metrics.Profiler import createProfiler
+from scraper.search.InvertedIndex import IndexWriter
+from scraper.helper.nearDuplicate import NearDuplicateIndex, minhashSignature
 from scraper.exception.Exception import *
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
 from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import threading
 import hashlib
+import io
 import os
 
+try:
+    from pypdf import PdfReader
+except ImportError:
+    # No PDF text extraction without pypdf: PDF records are copied without a near-duplicate cluster
+    PdfReader = None
+
+
+def cleanHTML(rawContent):
+    """
+        Cleans HTML content by removing tags and extracting text.
+        Module level so that it can run in the worker processes of the transform.
+
+    Args:
+    ---------------------
+        rawContent: Raw HTML content in bytes.
+
+    Returns:
+    ---------------------
+        cleanedContent: Cleaned text content in bytes.
+    """
+    soup = BeautifulSoup(rawContent, 'lxml')
+    main = soup.find('main') or soup.find('div', {'class': 'main-content'}) or soup.body
+    text = main.get_text(' ', strip=True) if main else soup.get_text(' ', strip=True)
+
+    return text.encode('utf-8')
+
+
+def cleanHTMLLxml(rawContent):
+    """
+        Cleans HTML content like cleanHTML, walking the lxml tree directly instead of building a BeautifulSoup tree.
+        Produces the same text: stripped strings of main, div.main-content or body joined by a space,
+        without the content of comments, processing instructions, script, style and template elements.
+
+    Args:
+    ---------------------
+        rawContent: Raw HTML content in bytes.
+
+    Returns:
+    ---------------------
+        cleanedContent: Cleaned text content in bytes.
+    """
+    if not rawContent.strip():
+        return b''
+    try:
+        # Landing pages are stored as UTF-8, parsing text avoids libxml2 guessing the encoding
+        content = rawContent.decode('utf-8')
+    except UnicodeDecodeError:
+        content = rawContent
+    # lxml refuses text carrying an XML encoding declaration, such documents are parsed from bytes
+    if isinstance(content, str) and content.lstrip().startswith('<?xml'):
+        content = rawContent
+    try:
+        document = lxml.html.document_fromstring(content)
+    except etree.ParserError:
+        return b''
+    found = document.xpath('(//main)[1]') \
+        or document.xpath("(//div[contains(concat(' ', normalize-space(@class), ' '), ' main-content ')])[1]") \
+        or document.xpath('body')
+    root = found[0] if found else document
+
+    # Iterative depth first walk: text of an element, its children, then its tail
+    strings = []
+    stack = [(root, False)]
+    while stack:
+        element, visited = stack.pop()
+        if visited:
+            if element is not root and element.tail:
+                text = element.tail.strip()
+                if text:
+                    strings.append(text)
+            continue
+        stack.append((element, True))
+        # Comments and processing instructions have a non string tag, their text is skipped but not their tail
+        if not isinstance(element.tag, str) or element.tag in ('script', 'style', 'template'):
+            continue
+        if element.text:
+            text = element.text.strip()
+            if text:
+                strings.append(text)
+        stack.extend((child, False) for child in reversed(element))
+
+    return ' '.join(strings).encode('utf-8')
+
+
+# Version of the transformation logic stored with staging metadata, bump it when the output of
+# processRecord changes so that every record is transformed again
+transformVersion = 2
+
+
+def stagingMetadata(item, stgFilePath, fileHash):
+    """
+        Turns landing metadata into staging metadata, keeping the landing hash and the transform version the record
+        was built from. Shared by Transform and the fused StagingPipeline so both write the same records.
+
+    Args:
+    ---------------------
+        item: The landing metadata, updated in place.
+        stgFilePath: The path of the file in the staging bucket.
+        fileHash: The hash of the staged file.
+    """
+    item['sourceFileHash'] = item.get('fileHash')
+    item['transformVersion'] = transformVersion
+    item['filePath'] = stgFilePath
+    item['fileHash'] = fileHash
+    item['processedDate'] = datetime.utcnow().strftime('%d-%m-%Y %H:%M:%S')
+
+
+def createWorkerPool(workers):
+    """
+        Process pool cleaning and hashing the HTML files.
+
+    Args:
+    ---------------------
+        workers: number of processes
+
+    Returns:
+    ---------------------
+        ProcessPoolExecutor: the pool
+    """
+    # spawn: worker processes do not inherit the running threads and connections of this process
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+# HTML cleaner engines selectable with TRANSFORM_HTML_CLEANER
+htmlCleaners = {
+    'bs4': cleanHTML,
+    'lxml': cleanHTMLLxml,
+}
+
+
+def cleanAndHash(rawContent, engine='bs4'):
+    """
+        Cleans HTML content and hashes the cleaned content, the CPU bound part of a record.
+
+    Args:
+    ---------------------
+        rawContent: Raw HTML content in bytes.
+        engine: Name of the cleaner in htmlCleaners.
+
+    Returns:
+    ---------------------
+        cleanedContent, fileHash: Cleaned text content in bytes and its SHA-256.
+    """
+    cleanedContent = htmlCleaners[engine](rawContent)
+    return cleanedContent, hashlib.sha256(cleanedContent).hexdigest()
+
+
+def extractPDFText(rawContent):
+    """
+        Text of the pages of a PDF file, the CPU bound part of signing a PDF record.
+
+    Args:
+    ---------------------
+        rawContent: PDF content in bytes.
+
+    Returns:
+    ---------------------
+        text: The text of the pages joined by spaces, empty when pypdf is missing or the file cannot be read.
+    """
+    if PdfReader is None:
+        return ''
+    try:
+        reader = PdfReader(io.BytesIO(rawContent))
+        return ' '.join(page.extract_text() or '' for page in reader.pages)
+    except Exception:
+        # Encrypted or malformed file, left without a cluster
+        return ''
+
 
 class Transform:
     """
@@ -16,9 +194,15 @@ class Transform:
         If of type docx/doc/pdf then no change/transofmations else if html then apply transformation to clean the html tags and relative inforation only.
         Rename files to their identifier and store the files in a new storage bucket.
         Store the metadata in a new collection with updated new file path and file hash. 
+        Records are processed concurrently: TRANSFORM_IO_THREADS threads download, upload and upsert,
+        while TRANSFORM_WORKERS processes clean and hash the HTML files. Both set to 1 processes records one by one.
+        Records whose staging metadata was built from the same landing fileHash and transformVersion are skipped,
+        failed records are kept in the transform_retry collection (TRANSFORM_RETRY_ONLY=1 only processes those).
+        The cleaned text of the HTML files is added to the full-text index in INDEX_DIR (see scraper.search)
+        and matched against the previous documents to record their near-duplicate cluster (see helper/nearDuplicate.py).
 
     """
-    def __init__(self, start_date, end_date):
+    def __init__(self, start_date, end_date, cpuPool=None):
         self.start_date = start_date
         self.end_date = end_date
         now = datetime.now()
@@ -29,10 +213,46 @@ class Transform:
         # Initialize helper class that will help construct urls based on inputs provided
         self.helperClass = HelperFunction( logFileFullPath = logFileName, loggerLevel='DEBUG')
         self.helperClass.logAction('info', 'Transformation Initiation', 'Done.')
+        # Number of landing items fetched per round trip
+        self.batchSize = int(os.getenv('TRANSFORM_BATCH_SIZE', 200))
+        # Processes cleaning and hashing HTML, threads doing the MinIO and MongoDB I/O
+        self.workers = max(1, int(os.getenv('TRANSFORM_WORKERS') or os.cpu_count() or 1))
+        self.ioThreads = max(1, int(os.getenv('TRANSFORM_IO_THREADS', 8)))
+        # Worker processes kept warm by the caller across runs (scheduler), created for this run when None
+        self.cpuPool = cpuPool
         #Initiate MinIO and MongoDB clients
-        self.lndMinioClient = MinioClient(bucketName='landing')
-        self.stgMinioClient = MinioClient(bucketName='staging')
+        # Both buckets share one MinIO connection pool, sized so that every I/O thread keeps its connection
+        self.lndMinioClient = MinioClient(bucketName='landing', poolSize=self.ioThreads)
+        self.stgMinioClient = MinioClient(bucketName='staging', poolSize=self.ioThreads)
         self.mongoClient = MongoDBClient()
+        # HTML cleaner engine: bs4 (BeautifulSoup) or lxml (same text, parsed without BeautifulSoup)
+        self.htmlCleaner = os.getenv('TRANSFORM_HTML_CLEANER', 'bs4')
+        if self.htmlCleaner not in htmlCleaners:
+            raise InvalidOperation(f'Unknown TRANSFORM_HTML_CLEANER {self.htmlCleaner}, expected one of {", ".join(htmlCleaners)}')
+        # Only process the records of the retry list, or process every record even if unchanged
+        self.retryOnly = os.getenv('TRANSFORM_RETRY_ONLY', '0').lower() in ('1', 'true', 'yes')
+        self.force = os.getenv('TRANSFORM_FORCE', '0').lower() in ('1', 'true', 'yes')
+        # Ids whose staging metadata failed in a bulk write
+        self.upsertFailures = set()
+        # Per-stage latencies and counters, summarized in Log/Metrics_Transforming_<timestamp>.json
+        # and served on http://127.0.0.1:<METRICS_PORT>/metrics when METRICS_PORT is set
+        self.metrics = Metrics('Transforming')
+        metricsPort = int(os.getenv('METRICS_PORT') or 0)
+        if metricsPort:
+            self.metrics.startServer(metricsPort, os.getenv('METRICS_HOST', '127.0.0.1'))
+        # SCRAPER_PROFILE=cpu|mem profiles one processRecord call out of SCRAPER_PROFILE_SAMPLE, nothing is wrapped otherwise
+        self.profiler = createProfiler(os.getenv('SCRAPER_PROFILE'), 'Transforming', os.getenv('SCRAPER_PROFILE_SAMPLE'))
+        if self.profiler is not None:
+            self.processRecord = self.profiler.wrap('processRecord', self.processRecord)
+        # Full-text index of the cleaned text, updated as records are processed, INDEX_DIR empty disables it
+        indexDir = os.getenv('INDEX_DIR', 'Index')
+        self.index = IndexWriter.shared(indexDir) if indexDir else None
+        if self.index is not None:
+            # Staged records are skipped by the next run, they have to be indexed before their metadata is written
+            self.mongoClient.beforeWrite('stg_documents_metadata', self.flushIndex)
+        # MinHash/LSH near-duplicate clusters of the cleaned text, NEARDUP_ENABLED=0 disables them
+        nearDuplicatesEnabled = os.getenv('NEARDUP_ENABLED', '1').lower() in ('1', 'true', 'yes')
+        self.nearDuplicates = NearDuplicateIndex(self.mongoClient) if nearDuplicatesEnabled else None
 
     def apply(self):
         """
@@ -41,25 +261,208 @@ class Transform:
             uploads to staging bucket, and updates metadata in staging collection.
         """
         self.helperClass.logAction('info', 'Transformation Started', 'fetching metadata from landing collection.')
-        # Get landing collection
-        lndItems = self.mongoClient.findItems('lnd_documents_metadata')
-
         startfilter =  datetime.strptime(self.start_date, "%Y-%m-%d")
         endFilter = datetime.strptime(self.end_date, "%Y-%m-%d")
+
+        self.mongoClient.ensureIndexes('lnd_documents_metadata')
+        self.mongoClient.ensureIndexes('stg_documents_metadata')
+        self.backfillDecisionDate()
+
+        # Only the requested window is read, streamed in batches from the server
+        if self.retryOnly:
+            retryIds = [item['Id'] for item in self.mongoClient.findItems('transform_retry', None, {'_id': 0, 'Id': 1})]
+            query = {'Id': {'$in': retryIds}}
+        else:
+            query = {'decisionDate': {'$gte': startfilter, '$lte': endFilter}}
+        itemCount = self.mongoClient.countItems('lnd_documents_metadata', query)
+        # Landing only fields (_id, HTTP validators) are not carried to staging
+        projection = {'_id': 0, 'etag': 0, 'lastModified': 0, 'contentLength': 0}
+        lndItems = self.mongoClient.findItems('lnd_documents_metadata', query, projection, batchSize=self.batchSize)
         
-        self.helperClass.logAction('info', 'Metadata Fetched', f'Number of items fetched: {len(lndItems)}. Beginning transformation process.')
+        self.helperClass.logAction('info', 'Metadata Fetched', f'Number of items fetched: {itemCount}. Beginning transformation process.')
 
         stgFolder = f"from_{self.start_date.replace('-', '')}_to_{self.end_date.replace('-', '')}"
 
-        for item in lndItems:
-            itemDate = datetime.strptime(item['date'], "%d/%m/%Y")
-            if startfilter <= itemDate <= endFilter:
+        # Staging state of the window, read in one query to skip the records that did not change
+        stgStates = {} if self.force or self.retryOnly else self.findStagingStates(query)
+        processedIds = []
+        pendingItems = self.pendingRecords(lndItems, stgStates, processedIds)
+
+        errors = []
+        if self.workers == 1 and self.ioThreads == 1:
+            for item in pendingItems:
                 try:
                     self.processRecord(item, stgFolder)
                 except Exception as e:
+                    errors.append((item['Id'], str(e)))
+                    self.metrics.increment('errors.record')
                     self.helperClass.logAction('error', 'Error in Transformation', f'Error processing item with ID {item["Id"]}: {str(e)}')
-        
-    def processRecord(self, item, stgFolder):
+        else:
+            errors = self.processConcurrently(pendingItems, stgFolder)
+
+        # Write the staging metadata still buffered for the last bulk write
+        with self.metrics.timer('mongo.upsert'):
+            failures = self.mongoClient.flush('stg_documents_metadata')
+        self.reportFailures(failures, retry=True)
+        # Merge the segments written before each staging bulk write when there are too many
+        if self.index is not None:
+            with self.metrics.timer('index.commit'):
+                self.index.commit()
+        # Clusters merged during the run are renamed once the staging metadata holding their old names was written
+        if self.nearDuplicates is not None:
+            with self.metrics.timer('mongo.upsert'):
+                failures = self.nearDuplicates.close()
+            self.reportFailures(failures, retry=True)
+        self.metrics.increment('items.unchanged', itemCount - len(processedIds))
+        self.helperClass.logAction('info', 'Incremental Transformation', f'{len(processedIds)} items processed, {itemCount - len(processedIds)} unchanged items skipped.')
+        self.updateRetryList(processedIds, errors)
+
+    def flushIndex(self):
+        """
+            Writes the documents buffered by the full-text index as a segment. Run before every bulk write of the
+            staging metadata (batch, flush timer or end of run), a record added to the index before its metadata is buffered.
+        """
+        with self.metrics.timer('index.commit'):
+            self.index.flush()
+
+    def findStagingStates(self, query):
+        """
+            Reads the landing fileHash and transformVersion each staging record of the window was built from.
+
+        Args:
+        ---------------------
+            query: The filter query of the window.
+
+        Returns:
+        ---------------------
+            stgStates: Id -> (sourceFileHash, transformVersion)
+        """
+        projection = {'_id': 0, 'Id': 1, 'sourceFileHash': 1, 'transformVersion': 1}
+        return {
+            item['Id']: (item.get('sourceFileHash'), item.get('transformVersion'))
+            for item in self.mongoClient.findItems('stg_documents_metadata', query, projection, batchSize=self.batchSize)
+        }
+
+    def pendingRecords(self, lndItems, stgStates, processedIds):
+        """
+            Yields the landing records that are new or changed since their staging record was built.
+
+        Args:
+        ---------------------
+            lndItems: The metadata items retrieved from landing collection.
+            stgStates: Id -> (sourceFileHash, transformVersion) of the staging records.
+            processedIds: list the Ids of the yielded records are appended to.
+
+        Returns:
+        ---------------------
+            Generator of landing items
+        """
+        for item in lndItems:
+            if stgStates.get(item['Id']) == (item.get('fileHash'), transformVersion):
+                continue
+            processedIds.append(item['Id'])
+            yield item
+
+    def updateRetryList(self, processedIds, errors):
+        """
+            Keeps the failed records in the transform_retry collection and removes the ones that succeeded.
+
+        Args:
+        ---------------------
+            processedIds: Ids of the records processed by this run.
+            errors: list of (Id, error message) of the records that failed.
+
+        Returns:
+        ---------------------
+            None
+        """
+        failed = dict(errors)
+        for Id in self.upsertFailures:
+            failed.setdefault(Id, 'Staging metadata bulk write failed')
+        failedAt = datetime.utcnow()
+        for Id, error in failed.items():
+            self.mongoClient.bufferUpsert('transform_retry', {'Id': Id}, {'Id': Id, 'error': error, 'failedAt': failedAt})
+        self.reportFailures(self.mongoClient.flush('transform_retry'))
+
+        succeeded = [Id for Id in processedIds if Id not in failed]
+        for start in range(0, len(succeeded), self.batchSize):
+            self.mongoClient.deleteItems('transform_retry', {'Id': {'$in': succeeded[start:start + self.batchSize]}})
+        if failed:
+            self.helperClass.logAction('warning', 'Retry List', f'{len(failed)} failed items kept for retry, rerun with TRANSFORM_RETRY_ONLY=1.')
+
+    def processConcurrently(self, lndItems, stgFolder):
+        """
+            Processes the records on a thread pool (download, upload, upsert) backed by a process pool (cleaning, hashing).
+            At most two records per I/O thread are queued at a time so that the cursor is read as records complete.
+            Errors are collected per record and logged in the order of the records once all of them finished.
+
+        Args:
+        ---------------------
+            lndItems: The metadata items retrieved from landing collection.
+            stgFolder: The folder in staging bucket to store the files.
+
+        Returns:
+        ---------------------
+            errors: list of (Id, error message) in the order of the records
+        """
+        self.helperClass.logAction('info', 'Concurrent Transformation', f'{self.workers} worker processes, {self.ioThreads} I/O threads.')
+        queued = threading.BoundedSemaphore(self.ioThreads * 2)
+        records = []
+        cpuPool = self.cpuPool or createWorkerPool(self.workers)
+        try:
+            with ThreadPoolExecutor(max_workers=self.ioThreads, thread_name_prefix='Transform') as ioPool:
+                for item in lndItems:
+                    queued.acquire()
+                    future = ioPool.submit(self.processRecord, item, stgFolder, cpuPool)
+                    future.add_done_callback(lambda _: queued.release())
+                    records.append((item['Id'], future))
+        finally:
+            if cpuPool is not self.cpuPool:
+                cpuPool.shutdown()
+
+        errors = [(Id, str(future.exception())) for Id, future in records if future.exception() is not None]
+        self.metrics.increment('errors.record', len(errors))
+        for Id, error in errors:
+            self.helperClass.logAction('error', 'Error in Transformation', f'Error processing item with ID {Id}: {error}')
+        self.helperClass.logAction('info', 'Concurrent Transformation', f'{len(records) - len(errors)} items processed, {len(errors)} failed.')
+        return errors
+
+    def backfillDecisionDate(self):
+        """
+            Sets the BSON decisionDate on landing metadata scraped before it existed,
+            parsed from its dd/mm/YYYY date string.
+        """
+        missing = self.mongoClient.findItems('lnd_documents_metadata', {'decisionDate': {'$exists': False}}, {'_id': 0, 'Id': 1, 'date': 1}, batchSize=self.batchSize)
+        count = 0
+        for item in missing:
+            try:
+                decisionDate = datetime.strptime(item['date'], "%d/%m/%Y")
+            except Exception:
+                # Missing or malformed date, left without decisionDate
+                continue
+            self.reportFailures(self.mongoClient.bufferUpsert('lnd_documents_metadata', {'Id': item['Id']}, {'decisionDate': decisionDate}))
+            count += 1
+        self.reportFailures(self.mongoClient.flush('lnd_documents_metadata'))
+        if count:
+            self.helperClass.logAction('info', 'Decision Date Backfill', f'decisionDate set on {count} landing items.')
+
+    def reportFailures(self, failures, retry=False):
+        """
+            Logs the Ids whose metadata could not be written by a bulk write.
+
+        Args:
+        ---------------------
+            failures: list of dicts with the keys Id and error as returned by MongoDBClient
+            retry: keep the Ids for the retry list (staging metadata failures)
+        """
+        if retry and failures:
+            self.metrics.increment('errors.mongo.upsert', len(failures))
+        for failure in failures:
+            if retry:
+                self.upsertFailures.add(failure['Id'])
+            self.helperClass.logAction('error', 'Error in Metadata Bulk Write', f'Error upserting item with ID {failure["Id"]}: {failure["error"]}')
+
+    def processRecord(self, item, stgFolder, cpuPool=None):
         """
             Process each record based on file type and apply transformations if needed.
             Upload transformed or original file to staging bucket and update metadata in staging collection.
@@ -68,6 +471,7 @@ class Transform:
         ---------------------
             item: The metadata item retrieved from landing collection.
             stgFolder: The folder in staging bucket to store the files.
+            cpuPool: Process pool the HTML is cleaned and hashed in, cleaned in this thread when None.
 
         Returns:
         ---------------------
@@ -77,36 +481,96 @@ class Transform:
         lndObjectPath = lndFilePath.replace('landing/', '')
         Id = item['Id']
         extension = lndObjectPath.split('.')[-1].lower()
-        rawContent = self.lndMinioClient.download(objectPath=lndObjectPath)
+        stgObjectPath = f"{stgFolder}/{Id}.{extension}"
 
+        metrics = self.metrics
         if extension in ['html', 'htm']:
-            # Apply HTML transformation
-            rawContent = self.cleanHTML(rawContent)
-            self.helperClass.logAction('info', 'HTML Transformation', f'Applied HTML cleaning for item ID {Id}.')
+            with metrics.timer('minio.download'):
+                rawContent = self.lndMinioClient.download(objectPath=lndObjectPath)
+            # Apply HTML transformation and generate new file hash
+            with metrics.timer('clean', len(rawContent)):
+                if cpuPool is not None:
+                    rawContent, fileHash = cpuPool.submit(cleanAndHash, rawContent, self.htmlCleaner).result()
+                else:
+                    rawContent, fileHash = cleanAndHash(rawContent, self.htmlCleaner)
+            self.helperClass.logAction('info', 'HTML Transformation', 'Applied HTML cleaning for item ID %s.', args=(Id,), sampled=True)
+            text = rawContent.decode('utf-8', 'replace')
+            if self.index is not None:
+                with metrics.timer('index', len(rawContent)):
+                    self.index.add(Id, text)
+            if self.nearDuplicates is not None:
+                self.assignCluster(item, text, cpuPool)
+            # Upload to staging bucket
+            # Cleaned text is stored compressed when MINIO_COMPRESSION is set, fileHash is the hash of the text itself
+            with metrics.timer('minio.upload', len(rawContent)):
+                stgFilePath = self.stgMinioClient.upload(stgObjectPath, rawContent, compress=True)
+        elif extension == 'pdf' and self.nearDuplicates is not None and PdfReader is not None:
+            # The PDF is read once to sign its text, so that a decision published both as a page and as a PDF shares a cluster
+            with metrics.timer('minio.download'):
+                rawContent = self.lndMinioClient.download(objectPath=lndObjectPath)
+            with metrics.timer('pdf.extract', len(rawContent)):
+                if cpuPool is not None:
+                    text = cpuPool.submit(extractPDFText, rawContent).result()
+                else:
+                    text = extractPDFText(rawContent)
+            self.assignCluster(item, text, cpuPool)
+            fileHash = item.get('fileHash') or hashlib.sha256(rawContent).hexdigest()
+            with metrics.timer('minio.upload', len(rawContent)):
+                stgFilePath = self.stgMinioClient.upload(stgObjectPath, rawContent)
+        elif item.get('fileHash'):
+            self.helperClass.logAction('info', 'No Transformation Needed', 'No transformation applied for item ID %s with file type %s.', args=(Id, extension), sampled=True)
+            # Content is unchanged: copied inside MinIO and the landing hash carried forward
+            with metrics.timer('minio.copy'):
+                stgFilePath = self.stgMinioClient.copyFrom(self.lndMinioClient.bucket_name, lndObjectPath, stgObjectPath)
+            fileHash = item['fileHash']
         else:
-            self.helperClass.logAction('info', 'No Transformation Needed', f'No transformation applied for item ID {Id} with file type {extension}.')
-        
-        # Generate new file hash
-        fileHash = hashlib.sha256(rawContent).hexdigest()
+            self.helperClass.logAction('info', 'No Transformation Needed', 'No transformation applied for item ID %s with file type %s.', args=(Id, extension), sampled=True)
+            # No landing hash to carry forward, the file is read to compute it
+            with metrics.timer('minio.download'):
+                rawContent = self.lndMinioClient.download(objectPath=lndObjectPath)
+            with metrics.timer('hash', len(rawContent)):
+                fileHash = hashlib.sha256(rawContent).hexdigest()
+            with metrics.timer('minio.upload', len(rawContent)):
+                stgFilePath = self.stgMinioClient.upload(stgObjectPath, rawContent)
 
-        stgObjectPath = f"{stgFolder}/{Id}.{extension}"
+        self.helperClass.logAction('info', 'File Uploaded to Staging', 'Uploaded item ID %s to staging bucket at %s.', args=(Id, stgFilePath), sampled=True)
+        stagingMetadata(item, stgFilePath, fileHash)
 
-        # Upload to staging bucket
-        stgFilePath = self.stgMinioClient.upload(stgObjectPath, rawContent)
-        self.helperClass.logAction('info', 'File Uploaded to Staging', f'Uploaded item ID {Id} to staging bucket at {stgFilePath}.')
-        # Update metadata
-        item['filePath'] = stgFilePath
-        item['fileHash'] = fileHash
-        item['processedDate'] = datetime.utcnow().strftime('%d-%m-%Y %H:%M:%S')
+        # Upsert into staging collection, buffered and written in bulk
+        with metrics.timer('mongo.upsert'):
+            failures = self.mongoClient.bufferUpsert('stg_documents_metadata', {'Id': Id}, item)
+        self.reportFailures(failures, retry=True)
+        metrics.increment('items')
+        self.helperClass.logAction('info', 'Metadata Upserted to Staging', 'Buffered metadata for item ID %s for the staging collection.', args=(Id,), sampled=True)
 
-        # Upsert into staging collection
-        self.mongoClient.upsertItem('stg_documents_metadata', {'Id': Id}, item)
-        self.helperClass.logAction('info', 'Metadata Upserted to Staging', f'Upserted metadata for item ID {Id} into staging collection.')
+    def assignCluster(self, item, text, cpuPool=None):
+        """
+            Signs the text of a record and stores its near-duplicate cluster fields in its metadata.
 
+        Args:
+        ---------------------
+            item: The metadata item, updated in place.
+            text: The cleaned HTML text or the text extracted from the PDF.
+            cpuPool: Process pool the signature is computed in, computed in this thread when None.
+
+        Returns:
+        ---------------------
+            None
+        """
+        nearDuplicates = self.nearDuplicates
+        with self.metrics.timer('minhash', len(text)):
+            if cpuPool is not None:
+                signature = cpuPool.submit(minhashSignature, text, nearDuplicates.numPerm, nearDuplicates.shingleSize).result()
+            else:
+                signature = nearDuplicates.signature(text)
+        with self.metrics.timer('lsh'):
+            fields, failures = nearDuplicates.assign(item['Id'], signature)
+        self.reportFailures(failures, retry=True)
+        item.update(fields)
 
     def cleanHTML(self, rawContent):
         """
-            Cleans HTML content by removing tags and extracting text.
+            Cleans HTML content by removing tags and extracting text with the configured cleaner engine.
 
         Args:
         ---------------------
@@ -116,11 +580,7 @@ class Transform:
         ---------------------
             cleanedContent: Cleaned text content in bytes.
         """
-        soup = BeautifulSoup(rawContent, 'lxml')
-        main = soup.find('main') or soup.find('div', {'class': 'main-content'}) or soup.body
-        text = main.get_text(' ', strip=True) if main else soup.get_text(' ', strip=True)
-
-        return text.encode('utf-8')
+        return htmlCleaners[self.htmlCleaner](rawContent)
     
     def run(self):
         """
@@ -129,6 +589,18 @@ class Transform:
         self.helperClass.logAction('info', 'Transformation Run', f'Starting transformation from {self.start_date} to {self.end_date}.'
         )
         self.apply()
+        self.metrics.writeSummary(Path('Log') / f"Metrics_Transforming_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+
+    def close(self):
+        """
+            Closes the MongoDB connection and the metrics endpoint, writes the profiles and the queued log messages.
+        """
+        self.metrics.close()
+        if self.profiler is not None:
+            for path in self.profiler.close():
+                self.helperClass.logAction('info', 'Profiling', f'Profile written to {path}')
+        self.mongoClient.close()
+        self.helperClass.close()
 
 if __name__ == "__main__":
     start_date = os.getenv("TRANSFORM_START_DATE")
@@ -138,4 +610,11 @@ if __name__ == "__main__":
         raise ValueError("TRANSFORM_START_DATE and TRANSFORM_END_DATE must be set")
 
     transform = Transform(start_date=start_date, end_date=end_date)
-    transform.run()
\ No newline at end of file
+    # The log writer is a daemon thread, close writes the queued messages even when the run fails
+    try:
+        transform.run()
+    except Exception as e:
+        transform.helperClass.logAction('critical', 'Transformation Failed', str(e))
+        raise
+    finally:
+        transform.close()
\ No newline at end of file
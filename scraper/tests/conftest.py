@@ -0,0 +1,15 @@
+from scrapy.utils.reactor import install_reactor
+import pytest
+
+# Default reactor of the crawls, it has to be installed before any module imports twisted.internet.reactor
+install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+
+
+@pytest.fixture
+def spider(tmp_path, monkeypatch):
+    from scraper.spiders.WorkplaceRelationSpider import WorkplaceRelationSpider
+    # The spider log is written under Log/ of the working directory
+    monkeypatch.chdir(tmp_path)
+    spider = WorkplaceRelationSpider(start_date='01/01/2025', end_date='11/01/2025', query='labour', body='Labour Court', partition='10')
+    yield spider
+    spider.helperClass.close()
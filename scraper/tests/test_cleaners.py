@@ -0,0 +1,22 @@
+from scraper.transformation.transform import cleanHTML, cleanHTMLLxml
+from scraper.benchmark.cleanerBenchmark import syntheticPages
+from pathlib import Path
+import pytest
+
+metadataPages = sorted((Path(__file__).resolve().parent.parent / 'Metadata').glob('*.html'))
+
+
+@pytest.mark.parametrize('path', metadataPages, ids=lambda path: path.name)
+def test_lxml_cleaner_matches_bs4_on_saved_pages(path):
+    rawContent = path.read_bytes()
+    assert cleanHTMLLxml(rawContent) == cleanHTML(rawContent)
+
+
+@pytest.mark.parametrize('name', sorted(syntheticPages))
+def test_lxml_cleaner_matches_bs4_on_edge_cases(name):
+    rawContent = syntheticPages[name]
+    assert cleanHTMLLxml(rawContent) == cleanHTML(rawContent)
+
+
+def test_saved_pages_are_found():
+    assert metadataPages
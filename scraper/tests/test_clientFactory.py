@@ -0,0 +1,22 @@
+from scraper.helper import clientFactory
+
+
+def test_larger_pool_does_not_close_the_pool_in_use(monkeypatch):
+    monkeypatch.setattr(clientFactory, '_minioClients', {})
+    monkeypatch.delenv('MINIO_POOL_SIZE', raising=False)
+    client = clientFactory.getMinio(4)
+    assert clientFactory.getMinio() is client
+    httpClient = client._http
+    # A storage thread holds a connection of the shared pool
+    pool = httpClient.connection_from_host('localhost', 9000)
+    connection = pool._get_conn()
+
+    larger = clientFactory.getMinio(32)
+    assert larger is not client
+    assert larger._http.connection_pool_kw['maxsize'] == 32
+    assert clientFactory.getMinio(8) is larger
+    # The pool of the first users is still open and takes its connection back
+    assert httpClient.connection_pool_kw['maxsize'] == 10
+    assert pool.pool is not None
+    pool._put_conn(connection)
+    assert pool._get_conn() is connection
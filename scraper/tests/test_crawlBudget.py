@@ -0,0 +1,103 @@
+from scraper.helper.crawlBudget import CrawlBudget
+from scraper.middlewares import BudgetDownloaderMiddleware
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from types import SimpleNamespace
+import asyncio
+
+
+def test_take_and_release_count_bytes_and_items():
+    budget = CrawlBudget(maxBytes=100, maxItems=3)
+    budget.take(60)
+    assert not budget.exhausted()
+    budget.take(40)
+    assert budget.exhausted()
+    budget.release(40)
+    assert not budget.exhausted()
+    assert (budget.inflightBytes, budget.pendingItems) == (60, 1)
+
+
+def test_item_limit_alone():
+    budget = CrawlBudget(maxItems=2)
+    budget.take(10 ** 9)
+    assert not budget.exhausted()
+    budget.take(0)
+    assert budget.exhausted()
+
+
+def test_disabled_budget_is_never_exhausted():
+    budget = CrawlBudget()
+    budget.take(10 ** 9)
+    assert not budget.enabled
+    assert not budget.exhausted()
+
+
+def test_waiters_fire_once_budget_is_available():
+    budget = CrawlBudget(maxItems=1)
+    assert budget.reserve().called
+    budget.settle()
+    budget.take(10)
+    first, second = budget.reserve(), budget.reserve()
+    assert not first.called and not second.called
+    budget.release(10)
+    # The first download holds the only slot until its response arrives
+    assert first.called and not second.called
+    budget.settle()
+    assert second.called
+    assert budget.waiters == []
+
+
+def test_release_wakes_only_as_many_waiters_as_the_budget_holds():
+    budget = CrawlBudget(maxBytes=100, maxItems=10)
+    budget.take(40)
+    budget.take(40)
+    # A download reserves the average item size, 40 bytes
+    assert budget.reserve().called
+    assert budget.exhausted()
+    waiters = [budget.reserve() for _ in range(4)]
+    assert not any(waiter.called for waiter in waiters)
+    budget.release(40)
+    assert [waiter.called for waiter in waiters] == [True, False, False, False]
+    assert budget.exhausted()
+    # The item of the woken download enters the pipeline, its reservation ends
+    budget.take(40)
+    budget.settle()
+    assert [waiter.called for waiter in waiters] == [True, False, False, False]
+    budget.release(40)
+    budget.release(40)
+    assert [waiter.called for waiter in waiters] == [True, True, True, False]
+    assert (budget.reservedItems, budget.pendingItems) == (3, 0)
+
+
+def test_middleware_waits_for_budget_under_asyncio_reactor():
+    from twisted.internet import reactor
+    budget = CrawlBudget(maxItems=1)
+    middleware = BudgetDownloaderMiddleware(crawler=None, budget=budget)
+    spider = SimpleNamespace(metrics=None)
+
+    async def exhaustBudget():
+        budget.take(10)
+        request = Request('https://www.workplacerelations.ie/en/cases/ADJ-1.html', meta={'item': {'Id': 'ADJ-1'}})
+        waiting = asyncio.ensure_future(middleware.process_request(request, spider))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        # Search pages carry no item and are never held
+        assert await middleware.process_request(Request('https://www.workplacerelations.ie/en/search/'), spider) is None
+        budget.release(10)
+        result = await asyncio.wait_for(waiting, timeout=1)
+        assert budget.reservedItems == 1
+        # A retry or redirect of the request keeps its reservation
+        assert await middleware.process_request(request.replace(), spider) is None
+        assert budget.reservedItems == 1
+        response = HtmlResponse(request.url, body=b'', request=request)
+        assert middleware.process_response(request, response, spider) is response
+        assert budget.reservedItems == 0
+        # A failed download gives its reservation back too
+        other = Request('https://www.workplacerelations.ie/en/cases/ADJ-2.html', meta={'item': {'Id': 'ADJ-2'}})
+        await middleware.process_request(other, spider)
+        assert budget.reservedItems == 1
+        assert middleware.process_exception(other, ConnectionError('refused'), spider) is None
+        assert budget.reservedItems == 0
+        return result
+
+    assert reactor._asyncioEventloop.run_until_complete(exhaustBudget()) is None
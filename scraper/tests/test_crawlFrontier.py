@@ -0,0 +1,180 @@
+from scraper.middlewares import FrontierSpiderMiddleware
+from scraper.helper.crawlFrontier import CrawlFrontier
+from scraper.benchmark.stubs import InMemoryMongoDBClient
+from scraper.items import ScraperItem
+from scrapy.http import HtmlResponse, Request
+from twisted.python.failure import Failure
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+import pytest
+
+
+class RecordingFrontier:
+    """
+        CrawlFrontier stand-in recording the completed fingerprints.
+    """
+
+    def __init__(self):
+        self.completed = []
+        self.failed = []
+
+    def complete(self, fingerprint):
+        self.completed.append(fingerprint)
+
+    def fail(self, fingerprint, url, error):
+        self.failed.append((fingerprint, url, error))
+
+
+def documentResponse(fingerprint='f1'):
+    request = Request('https://www.workplacerelations.ie/en/cases/ADJ-1.html', meta={'frontierFingerprint': fingerprint})
+    return HtmlResponse(request.url, body=b'<html></html>', request=request)
+
+
+def frontierMiddleware():
+    middleware = FrontierSpiderMiddleware(crawler=None)
+    middleware.frontier = RecordingFrontier()
+    return middleware
+
+
+def test_request_is_done_once_its_items_are_stored():
+    middleware = frontierMiddleware()
+    response = documentResponse()
+    items = [ScraperItem(Id='ADJ-1'), ScraperItem(Id='ADJ-1')]
+    assert list(middleware.process_spider_output(response, iter(items), spider=None)) == items
+    # Output recorded, items still in the pipelines
+    assert middleware.frontier.completed == []
+    middleware.item_scraped(response)
+    assert middleware.frontier.completed == []
+    middleware.item_dropped(response)
+    assert middleware.frontier.completed == ['f1']
+    assert middleware.held == {}
+
+
+def test_request_without_items_is_done_after_its_output():
+    middleware = frontierMiddleware()
+    assert list(middleware.process_spider_output(documentResponse(), iter([]), spider=None)) == []
+    assert middleware.frontier.completed == ['f1']
+
+
+def test_item_stored_while_output_is_iterated():
+    middleware = frontierMiddleware()
+    response = documentResponse()
+    output = middleware.process_spider_output(response, iter([ScraperItem(Id='ADJ-1')]), spider=None)
+    next(output)
+    # A synchronous pipeline stores the item before the output goes on
+    middleware.item_scraped(response)
+    assert middleware.frontier.completed == []
+    assert list(output) == []
+    assert middleware.frontier.completed == ['f1']
+
+
+def test_item_error_fails_request():
+    middleware = frontierMiddleware()
+    response = documentResponse()
+    list(middleware.process_spider_output(response, iter([ScraperItem(Id='ADJ-1')]), spider=None))
+    middleware.item_error(response, Failure(ValueError('upload failed')))
+    middleware.item_scraped(response)
+    assert middleware.frontier.completed == []
+    assert middleware.frontier.failed == [('f1', response.url, 'upload failed')]
+
+
+def test_errback_records_failure_and_passes_it_on():
+    middleware = frontierMiddleware()
+    request = documentResponse().request
+    middleware._setErrback(request)
+    failure = Failure(ConnectionError('refused'))
+    failure.request = request
+    assert request.errback(failure) is failure
+    assert middleware.frontier.failed == [('f1', request.url, 'refused')]
+
+
+@pytest.fixture
+def mongoClient():
+    InMemoryMongoDBClient.collections.clear()
+    yield InMemoryMongoDBClient()
+    InMemoryMongoDBClient.collections.clear()
+
+
+def runDocument(mongoClient, runKey):
+    return next(iter(mongoClient.findItems(CrawlFrontier.collectionName, {'runKey': runKey, 'kind': 'run'})), None)
+
+
+def test_run_with_failures_only_left_is_completed(mongoClient):
+    frontier = CrawlFrontier(mongoClient, 'run1')
+    frontier.load()
+    frontier.plan(['https://www.workplacerelations.ie/en/search/?from=1/1/2025'])
+    frontier.add(Request('https://www.workplacerelations.ie/en/cases/ADJ-1.html'), 'f1', 'p1')
+    frontier.add(Request('https://www.workplacerelations.ie/en/cases/ADJ-2.html'), 'f2', 'p1')
+    frontier.complete('f1')
+    frontier.fail('f2', 'https://www.workplacerelations.ie/en/cases/ADJ-2.html', 'HTTP 404')
+    assert not frontier.pending
+    # A partition holding a failure is not completed
+    assert frontier.completedPartitions == set()
+    assert frontier.close(finished=True) == 0
+    # A completed run is deleted, the next crawl with the same arguments starts over
+    assert mongoClient.findItems(CrawlFrontier.collectionName, {'runKey': 'run1'}) == []
+    assert list(frontier.failed.values()) == [('https://www.workplacerelations.ie/en/cases/ADJ-2.html', 'HTTP 404')]
+
+
+def test_interrupted_run_requests_failures_again(mongoClient):
+    frontier = CrawlFrontier(mongoClient, 'run2')
+    frontier.load()
+    frontier.plan([])
+    for fingerprint in ('f1', 'f2', 'f3'):
+        frontier.add(Request(f'https://www.workplacerelations.ie/en/cases/{fingerprint}.html'), fingerprint, 'p1')
+    frontier.complete('f1')
+    frontier.fail('f2', 'https://www.workplacerelations.ie/en/cases/f2.html', 'timeout')
+    frontier.close(finished=False)
+    assert runDocument(mongoClient, 'run2') is not None
+
+    resumed = CrawlFrontier(mongoClient, 'run2')
+    pending = resumed.load()
+    assert resumed.resumed
+    assert sorted(document['fingerprint'] for document in pending) == ['f2', 'f3']
+    assert resumed.isKnown('f1')
+
+
+def test_abandoned_runs_are_deleted(mongoClient):
+    old = CrawlFrontier(mongoClient, 'old')
+    old.load()
+    old.plan([])
+    old.add(Request('https://www.workplacerelations.ie/en/cases/ADJ-1.html'), 'f1', 'p1')
+    old.close(finished=False)
+    mongoClient.updateItems(CrawlFrontier.collectionName, {'runKey': 'old', 'kind': 'run'}, {'startedAt': datetime.utcnow() - timedelta(days=31)})
+    recent = CrawlFrontier(mongoClient, 'recent')
+    recent.load()
+    recent.plan([])
+
+    CrawlFrontier(mongoClient, 'new', maxAgeDays=30).load()
+    assert runDocument(mongoClient, 'old') is None
+    assert mongoClient.findItems(CrawlFrontier.collectionName, {'runKey': 'old'}) == []
+    assert runDocument(mongoClient, 'recent') is not None
+
+
+def test_conditional_request_round_trip(mongoClient):
+    def parse_html(response):
+        pass
+
+    item = ScraperItem(Id='ADJ-1', documentURL='https://www.workplacerelations.ie/en/cases/ADJ-1.html', storedFileHash='abc')
+    validators = {'etag': '"v1"', 'lastModified': 'Mon, 06 Oct 2025 10:00:00 GMT', 'contentLength': '120', 'fileHash': 'abc'}
+    request = Request(item['documentURL'], callback=parse_html, priority=5,
+                      meta={'item': item, 'validators': validators, 'handle_httpstatus_list': [304], 'partition_date': '01-10-2025'},
+                      headers={'If-None-Match': '"v1"', 'If-Modified-Since': validators['lastModified']})
+    frontier = CrawlFrontier(mongoClient, 'run3')
+    frontier.load()
+    frontier.plan([])
+    frontier.add(request, 'f1', 'p1')
+    frontier.close(finished=False)
+
+    document, = CrawlFrontier(mongoClient, 'run3').load()
+    rebuilt = frontier.toRequest(document, SimpleNamespace(parse_html=parse_html))
+    assert rebuilt.url == request.url
+    assert rebuilt.callback is parse_html
+    assert rebuilt.priority == 5
+    assert rebuilt.headers.get('If-None-Match') == b'"v1"'
+    # A 304 is still let through to the callback and compared with the stored validators
+    assert rebuilt.meta['handle_httpstatus_list'] == [304]
+    assert rebuilt.meta['validators'] == validators
+    assert isinstance(rebuilt.meta['item'], ScraperItem)
+    assert dict(rebuilt.meta['item']) == dict(item)
+    assert rebuilt.meta['frontierPartition'] == 'p1'
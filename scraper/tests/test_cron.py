@@ -0,0 +1,92 @@
+from scraper.scheduler.cron import CronSchedule
+from scraper.scheduler.daemon import ScheduledJob, loadJobs, transformWindows
+from scraper.exception.Exception import InvalidOperation
+from datetime import datetime
+import json
+import pytest
+
+
+@pytest.mark.parametrize('expression, moment, expected', [
+    ('0 2 * * *', datetime(2025, 3, 4, 2, 0), True),
+    ('0 2 * * *', datetime(2025, 3, 4, 2, 1), False),
+    ('30 */6 * * 1-5', datetime(2025, 3, 7, 18, 30), True),
+    # Saturday
+    ('30 */6 * * 1-5', datetime(2025, 3, 8, 18, 30), False),
+    ('30 */6 * * 1-5', datetime(2025, 3, 7, 19, 30), False),
+    ('0 5 * * 0', datetime(2025, 3, 9, 5, 0), True),
+    ('0 5 * * 7', datetime(2025, 3, 9, 5, 0), True),
+    ('0 0 1,15 * *', datetime(2025, 3, 15), True),
+    ('0 0 1,15 * *', datetime(2025, 3, 14), False),
+    ('0 0 * 1-3/2 *', datetime(2025, 3, 1), True),
+    ('0 0 * 1-3/2 *', datetime(2025, 2, 1), False),
+    # Both days restricted: the 13th or a Friday
+    ('0 0 13 * 5', datetime(2025, 3, 13), True),
+    ('0 0 13 * 5', datetime(2025, 3, 14), True),
+    ('0 0 13 * 5', datetime(2025, 3, 12), False),
+    # One day restricted: only that one counts
+    ('0 0 13 * *', datetime(2025, 3, 14), False),
+    ('0 0 * * 5', datetime(2025, 3, 13), False),
+])
+def test_matches(expression, moment, expected):
+    assert CronSchedule(expression).matches(moment) is expected
+
+
+@pytest.mark.parametrize('expression, moment, expected', [
+    ('0 2 * * *', datetime(2025, 3, 4, 1, 59, 30), datetime(2025, 3, 4, 2, 0)),
+    ('0 2 * * *', datetime(2025, 3, 4, 2, 0), datetime(2025, 3, 5, 2, 0)),
+    ('*/15 * * * *', datetime(2025, 3, 4, 10, 7), datetime(2025, 3, 4, 10, 15)),
+    ('0 5 * * 0', datetime(2025, 3, 4, 12, 0), datetime(2025, 3, 9, 5, 0)),
+    ('0 0 1 * *', datetime(2025, 12, 31, 23, 59), datetime(2026, 1, 1, 0, 0)),
+    ('0 0 29 2 *', datetime(2025, 3, 1), datetime(2028, 2, 29, 0, 0)),
+    ('0 0 31 2 *', datetime(2025, 3, 1), None),
+])
+def test_next_after(expression, moment, expected):
+    assert CronSchedule(expression).nextAfter(moment) == expected
+
+
+@pytest.mark.parametrize('expression', ['0 2 * *', '0 2 * * * *', '60 * * * *', '* 24 * * *', '* * 0 * *',
+                                        '* * * 13 *', '* * * * 8', '*/0 * * * *', '5-1 * * * *', 'a * * * *', '1,,2 * * * *'])
+def test_invalid_expressions_are_rejected(expression):
+    with pytest.raises(InvalidOperation):
+        CronSchedule(expression)
+
+
+def test_transform_windows_join_consecutive_days():
+    dates = [datetime(2025, 3, day) for day in (7, 1, 2, 3, 7, 10, 9)]
+    assert transformWindows(dates) == [
+        (datetime(2025, 3, 1), datetime(2025, 3, 3)),
+        (datetime(2025, 3, 7), datetime(2025, 3, 7)),
+        (datetime(2025, 3, 9), datetime(2025, 3, 10)),
+    ]
+    assert transformWindows([]) == []
+
+
+def test_job_window_covers_the_lookback_days():
+    job = ScheduledJob({'name': 'labour-court', 'cron': '0 2 * * *', 'lookbackDays': 14})
+    assert job.kind == 'crawl'
+    assert job.window(datetime(2025, 3, 15, 2, 0)) == (datetime(2025, 3, 1), datetime(2025, 3, 15))
+
+
+def test_load_jobs(tmp_path):
+    path = tmp_path / 'schedule.json'
+    path.write_text(json.dumps({'jobs': [
+        {'name': 'labour-court', 'kind': 'crawl', 'cron': '0 2 * * *', 'transform': True,
+         'arguments': {'query': 'labour', 'body': 'Labour Court', 'partition': 7}},
+        {'name': 'weekly-transform', 'kind': 'transform', 'cron': '0 5 * * 0', 'lookbackDays': 90},
+    ]}))
+    crawl, transform = loadJobs(path)
+    assert (crawl.name, crawl.kind, crawl.lookbackDays, crawl.chainTransform) == ('labour-court', 'crawl', 7, True)
+    assert crawl.arguments == {'query': 'labour', 'body': 'Labour Court', 'partition': 7}
+    assert (transform.kind, transform.lookbackDays, transform.schedule.expression) == ('transform', 90, '0 5 * * 0')
+
+
+@pytest.mark.parametrize('jobs', [
+    [{'name': 'a', 'cron': '0 2 * * *'}, {'name': 'a', 'cron': '0 3 * * *'}],
+    [{'name': 'a', 'kind': 'index', 'cron': '0 2 * * *'}],
+    [{'name': 'a', 'cron': '0 2 * *'}],
+])
+def test_invalid_schedules_are_rejected(tmp_path, jobs):
+    path = tmp_path / 'schedule.json'
+    path.write_text(json.dumps({'jobs': jobs}))
+    with pytest.raises(InvalidOperation):
+        loadJobs(path)
@@ -0,0 +1,41 @@
+from scraper.helper.HelperFunction import HelperFunction
+import threading
+
+
+def test_sampling_counters_are_exact_across_threads(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOG_SAMPLE_RATE', '10')
+    helperClass = HelperFunction(logFileFullPath=tmp_path / 'Sampling_Log.txt', loggerLevel='INFO')
+    kept = []
+
+    def logItems():
+        count = sum(helperClass._keepSampled('Parse HTML File') for _ in range(5000))
+        kept.append(count)
+
+    threads = [threading.Thread(target=logItems) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    helperClass.close()
+    seen, _, _, dropped = helperClass.sampledCounters['Parse HTML File']
+    assert seen == 40000
+    assert sum(kept) == 4000
+    assert dropped == 36000
+
+
+def test_log_file_keeps_debug_messages_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv('LOG_LEVEL', raising=False)
+    helperClass = HelperFunction(logFileFullPath=tmp_path / 'Default_Log.txt', loggerLevel='INFO')
+    helperClass.logAction('debug', 'Detail', 'kept')
+    helperClass.close()
+    assert 'Detail: kept' in (tmp_path / 'Default_Log.txt').read_text()
+
+
+def test_log_level_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOG_LEVEL', 'info')
+    helperClass = HelperFunction(logFileFullPath=tmp_path / 'Info_Log.txt', loggerLevel='DEBUG')
+    helperClass.logAction('debug', 'Detail', 'dropped')
+    helperClass.logAction('info', 'Summary', 'kept')
+    helperClass.close()
+    text = (tmp_path / 'Info_Log.txt').read_text()
+    assert 'Summary: kept' in text and 'dropped' not in text
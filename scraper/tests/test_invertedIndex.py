@@ -0,0 +1,101 @@
+from scraper.search.InvertedIndex import IndexWriter, IndexReader, encodeVarints, decodeVarints
+from multiprocessing import get_context
+import json
+import pytest
+
+
+@pytest.mark.parametrize('values', [[], [0], [127], [128], [300, 0, 16383, 16384], [2 ** 32 - 1, 2 ** 63, 1]])
+def test_varints_round_trip(values):
+    out = bytearray()
+    encodeVarints(values, out)
+    assert decodeVarints(bytes(out)) == values
+
+
+def test_varints_use_seven_bits_per_byte():
+    out = bytearray()
+    encodeVarints([127, 128, 300], out)
+    assert bytes(out) == b'\x7f\x80\x01\xac\x02'
+
+
+def test_document_indexed_again_only_matches_its_new_text(tmp_path):
+    writer = IndexWriter(tmp_path, segmentSize=1)
+    writer.add('ADJ-1', 'unfair dismissal')
+    writer.add('ADJ-2', 'unfair pay')
+    writer.add('ADJ-1', 'redundancy')
+    writer.commit()
+    reader = IndexReader(tmp_path)
+    try:
+        assert reader.allIds() == {'ADJ-1', 'ADJ-2'}
+        assert reader.termIds('unfair') == {'ADJ-2'}
+        assert reader.termIds('redundancy') == {'ADJ-1'}
+    finally:
+        reader.close()
+
+
+def writeDocuments(directory, prefix, count):
+    # Small segments so that both processes write and merge many times
+    writer = IndexWriter(directory, segmentSize=3, maxSegments=4)
+    for number in range(count):
+        writer.add(f'{prefix}-{number}', f'decision {prefix} number {number}')
+        if number % 5 == 0:
+            writer.commit()
+    writer.commit()
+
+
+def test_writers_of_two_processes_keep_each_others_segments(tmp_path):
+    context = get_context('spawn')
+    processes = [context.Process(target=writeDocuments, args=(str(tmp_path), prefix, 40)) for prefix in ('crawl', 'transform')]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+    reader = IndexReader(tmp_path)
+    try:
+        assert reader.allIds() == {f'{prefix}-{number}' for prefix in ('crawl', 'transform') for number in range(40)}
+        assert reader.termIds('crawl') == {f'crawl-{number}' for number in range(40)}
+    finally:
+        reader.close()
+
+
+def test_staging_batch_is_indexed_before_it_is_written(tmp_path):
+    from scraper.helper.mongoClient import MongoDBClient
+
+    writer = IndexWriter(tmp_path)
+    client = MongoDBClient(batchSize=2, flushInterval=60)
+    indexed = []
+
+    class StagingCollection:
+        def bulk_write(self, operations, ordered=True):
+            reader = IndexReader(tmp_path)
+            indexed.append(reader.allIds())
+            reader.close()
+
+    client.getCollection = lambda collectionName: StagingCollection()
+    client.beforeWrite('stg_documents_metadata', writer.flush)
+    try:
+        for Id in ('ADJ-1', 'ADJ-2'):
+            writer.add(Id, f'decision {Id}')
+            client.bufferUpsert('stg_documents_metadata', {'Id': Id}, {'Id': Id})
+    finally:
+        client.close()
+    assert indexed == [{'ADJ-1', 'ADJ-2'}]
+
+
+def test_manifest_only_lists_the_segments(tmp_path):
+    writer = IndexWriter(tmp_path, segmentSize=100, maxSegments=100)
+    for number in range(1000):
+        writer.add(f'ADJ-{number}', f'decision number {number}')
+    writer.flush()
+    writer.add('ADJ-1', 'amended decision')
+    writer.flush()
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    assert set(manifest) == {'nextSegment', 'segments'}
+    assert len(manifest['segments']) == 11
+    reader = IndexReader(tmp_path)
+    try:
+        assert len(reader.allIds()) == 1000
+        assert reader.termIds('amended') == {'ADJ-1'}
+        assert reader.phraseIds(['number', '1']) == set()
+    finally:
+        reader.close()
@@ -0,0 +1,36 @@
+from scraper.metrics.Metrics import Metrics
+import threading
+import time
+
+
+class SlowStats:
+    """
+        Stats collector reading and writing a value as StatsCollector.inc_value does, with a thread switch in between.
+    """
+    def __init__(self):
+        self.values = {}
+
+    def inc_value(self, key, count=1, start=0):
+        value = self.values.setdefault(key, start)
+        time.sleep(0)
+        self.values[key] = value + count
+
+
+def test_stats_mirror_keeps_every_update_of_the_storage_threads():
+    stats = SlowStats()
+    metrics = Metrics('Scraping', stats=stats)
+
+    def storeItems():
+        for _ in range(500):
+            metrics.observe('minio.upload', 0.001, 10)
+            metrics.increment('items')
+
+    threads = [threading.Thread(target=storeItems) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stats.values['metrics/minio.upload/count'] == 4000
+    assert stats.values['metrics/minio.upload/bytes'] == 40000
+    assert stats.values['metrics/items'] == 4000
+    assert metrics.counters['items'] == 4000
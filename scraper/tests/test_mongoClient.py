@@ -0,0 +1,81 @@
+from scraper.helper.mongoClient import MongoDBClient
+from pymongo.errors import PyMongoError
+import threading
+
+
+class RecordingCollection:
+    """
+        Collection stand-in recording the bulk writes, failing them when fail is set.
+    """
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.written = threading.Event()
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append(len(operations))
+        self.written.set()
+        if self.fail:
+            raise PyMongoError('unreachable')
+
+
+def recordingClient(collection, batchSize, flushInterval):
+    client = MongoDBClient(batchSize=batchSize, flushInterval=flushInterval)
+    client.getCollection = lambda collectionName: collection
+    return client
+
+
+def test_full_batch_is_written_by_the_upsert():
+    collection = RecordingCollection()
+    client = recordingClient(collection, batchSize=3, flushInterval=60)
+    try:
+        for Id in range(7):
+            assert client.bufferUpsert('lnd_documents_metadata', {'Id': Id}, {'Id': Id}) == []
+        assert collection.batches == [3, 3]
+        assert client.flush() == []
+        assert collection.batches == [3, 3, 1]
+    finally:
+        client.close()
+
+
+def test_quiet_buffer_is_written_by_the_timer():
+    collection = RecordingCollection()
+    client = recordingClient(collection, batchSize=500, flushInterval=0.1)
+    try:
+        client.bufferUpsert('crawl_frontier', {'fingerprint': 'a'}, {'doneAt': 1})
+        # No further upsert comes, the timer writes the batch on its own
+        assert collection.written.wait(timeout=2)
+        assert collection.batches == [1]
+    finally:
+        client.close()
+
+
+def test_timer_failures_are_returned_by_the_next_flush():
+    collection = RecordingCollection(fail=True)
+    client = recordingClient(collection, batchSize=500, flushInterval=0.1)
+    try:
+        client.bufferUpsert('lnd_documents_metadata', {'Id': 'ADJ-1'}, {'Id': 'ADJ-1'})
+        assert collection.written.wait(timeout=2)
+        failures = client.flush('lnd_documents_metadata')
+        assert [failure['Id'] for failure in failures] == ['ADJ-1']
+        assert client.flush() == []
+    finally:
+        client.close()
+
+
+def test_before_write_runs_ahead_of_each_batch():
+    collection = RecordingCollection()
+    client = recordingClient(collection, batchSize=2, flushInterval=60)
+    calls = []
+    client.beforeWrite('crawl_frontier', lambda: calls.append(len(collection.batches)))
+    try:
+        client.bufferUpsert('crawl_frontier', {'fingerprint': 'a'}, {'doneAt': 1})
+        assert calls == []
+        client.bufferUpsert('crawl_frontier', {'fingerprint': 'b'}, {'doneAt': 1})
+        client.bufferUpsert('lnd_documents_metadata', {'Id': 'ADJ-1'}, {'Id': 'ADJ-1'})
+        client.flush()
+        # Once per frontier batch, before it is written, never for other collections
+        assert calls == [0]
+    finally:
+        client.close()
@@ -0,0 +1,94 @@
+from scraper.helper.nearDuplicate import NearDuplicateIndex, minhashSignature
+from scraper.benchmark.stubs import InMemoryMongoDBClient
+import numpy as np
+import pytest
+import re
+
+decision = ('The complainant was employed as a sales assistant from March 2019 until she was dismissed in June 2023 '
+            'following a disciplinary process. She submits that the process was unfair, that she was not given the '
+            'opportunity to respond to the allegations and that the sanction was disproportionate. The respondent '
+            'submits that the dismissal was for gross misconduct and that fair procedures were followed throughout.')
+
+
+@pytest.fixture
+def mongoClient():
+    InMemoryMongoDBClient.collections.clear()
+    yield InMemoryMongoDBClient()
+    InMemoryMongoDBClient.collections.clear()
+
+
+@pytest.fixture
+def index(mongoClient, monkeypatch):
+    for name in ('NEARDUP_BANDS', 'NEARDUP_ROWS', 'NEARDUP_SHINGLE', 'NEARDUP_THRESHOLD'):
+        monkeypatch.delenv(name, raising=False)
+    return NearDuplicateIndex(mongoClient)
+
+
+def test_signature_is_deterministic():
+    signature = minhashSignature(decision)
+    assert signature.dtype == np.uint32
+    assert signature.shape == (128,)
+    assert np.array_equal(signature, minhashSignature(decision))
+
+
+def test_signature_ignores_case_and_punctuation():
+    assert np.array_equal(minhashSignature(decision), minhashSignature(decision.upper().replace('.', ' ;')))
+
+
+@pytest.mark.parametrize('text', ['', '   ', '... ;'])
+def test_text_without_words_has_no_signature(text):
+    assert minhashSignature(text) is None
+
+
+def test_text_shorter_than_a_shingle_has_a_signature():
+    assert minhashSignature('unfair dismissal').shape == (128,)
+
+
+def test_signature_agreement_follows_similarity():
+    signature = minhashSignature(decision)
+    edited = minhashSignature(decision.replace('June 2023', 'July 2023'))
+    other = minhashSignature('Claim for unpaid wages under the Payment of Wages Act 1991, the claim is not well founded.')
+    assert (signature == edited).mean() >= 0.8
+    assert (signature == other).mean() <= 0.1
+
+
+def test_band_keys(index):
+    signature = minhashSignature(decision)
+    keys = index.bandKeys(signature)
+    assert len(keys) == index.bands == 16
+    assert all(re.fullmatch(rf'16x8:{band}:[0-9a-f]{{16}}', key) for band, key in enumerate(keys))
+    assert keys == index.bandKeys(minhashSignature(decision))
+
+
+def test_band_keys_differ_with_the_layout(mongoClient, monkeypatch):
+    monkeypatch.setenv('NEARDUP_BANDS', '32')
+    monkeypatch.setenv('NEARDUP_ROWS', '4')
+    wide = NearDuplicateIndex(mongoClient)
+    monkeypatch.setenv('NEARDUP_BANDS', '16')
+    monkeypatch.setenv('NEARDUP_ROWS', '8')
+    narrow = NearDuplicateIndex(mongoClient)
+    signature = minhashSignature(decision)
+    assert len(wide.bandKeys(signature)) == 32
+    assert not set(wide.bandKeys(signature)) & set(narrow.bandKeys(signature))
+
+
+def test_near_duplicates_share_a_cluster(index):
+    first, _ = index.assign('ADJ-1', index.signature(decision))
+    second, _ = index.assign('ADJ-2', index.signature(decision.replace('June 2023', 'July 2023')))
+    third, _ = index.assign('ADJ-3', index.signature('Claim for unpaid wages under the Payment of Wages Act 1991.'))
+    assert first == {'duplicateCluster': 'ADJ-1', 'duplicateOf': None, 'duplicateSimilarity': 0.0}
+    assert second['duplicateCluster'] == 'ADJ-1'
+    assert second['duplicateOf'] == 'ADJ-1'
+    assert second['duplicateSimilarity'] >= 0.8
+    assert third['duplicateCluster'] == 'ADJ-3'
+
+
+def test_near_duplicates_of_a_previous_run_are_found(mongoClient, index):
+    index.assign('ADJ-1', index.signature(decision))
+    index.close()
+    fields, _ = NearDuplicateIndex(mongoClient).assign('ADJ-2', minhashSignature(decision))
+    assert fields == {'duplicateCluster': 'ADJ-1', 'duplicateOf': 'ADJ-1', 'duplicateSimilarity': 1.0}
+
+
+def test_document_without_text_is_its_own_cluster(index):
+    assert index.assign('ADJ-1', None) == ({'duplicateCluster': 'ADJ-1', 'duplicateOf': None, 'duplicateSimilarity': 0.0}, [])
@@ -0,0 +1,158 @@
+from scraper.benchmark.stubs import InMemoryMinioClient, InMemoryMongoDBClient
+from scraper.pipelines import ScraperPipeline
+from scraper.items import ScraperItem
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.utils.defer import maybe_deferred_to_future
+import scraper.pipelines as pipelines
+import hashlib
+import pytest
+
+pageURL = 'https://www.workplacerelations.ie/en/cases/2025/january/adj-00012345.html'
+attachmentURL = 'https://www.workplacerelations.ie/en/cases/2025/january/adj-00012345.pdf'
+pageBody = b'<html><body><div class="main-content">Decision <a href="adj-00012345.pdf">PDF</a></div></body></html>'
+attachmentBody = b'%PDF-1.4 decision'
+
+
+@pytest.fixture(autouse=True)
+def stores():
+    InMemoryMinioClient.objects.clear()
+    InMemoryMongoDBClient.collections.clear()
+    yield
+    InMemoryMinioClient.objects.clear()
+    InMemoryMongoDBClient.collections.clear()
+
+
+@pytest.fixture
+def openPipeline(spider, monkeypatch):
+    monkeypatch.setattr(pipelines, 'MinioClient', InMemoryMinioClient)
+    monkeypatch.setattr(pipelines, 'MongoDBClient', InMemoryMongoDBClient)
+    opened = []
+
+    def openPipeline(asyncEnabled):
+        pipeline = ScraperPipeline(asyncEnabled=asyncEnabled, storageThreads=2)
+        pipeline.open_spider(spider)
+        opened.append(pipeline)
+        return pipeline
+
+    yield openPipeline
+    for pipeline in opened:
+        pipeline.close_spider(spider)
+
+
+def pageItem():
+    item = ScraperItem()
+    item['Id'] = 'ADJ-00012345'
+    item['title'] = item['Id']
+    item['description'] = 'An employee V A company'
+    item['date'] = '07/01/2025'
+    item['partition_date'] = '01-01-2025'
+    item['sourceURL'] = 'https://www.workplacerelations.ie/en/search/?decisions=1'
+    item['documentURL'] = pageURL
+    item['body'] = 'Labour Court'
+    return item
+
+
+def documentResponse(request, body, etag, status=200):
+    headers = {'ETag': etag, 'Content-Length': str(len(body))}
+    if request.url.endswith('.html'):
+        return HtmlResponse(url=request.url, status=status, headers=headers, body=body, request=request, encoding='utf-8')
+    return Response(url=request.url, status=status, headers=headers, body=body, request=request)
+
+
+def test_attachment_is_stored_while_its_page_is_stored_on_a_thread(spider, openPipeline):
+    from twisted.internet import reactor
+    pipeline = openPipeline(asyncEnabled=True)
+    request = Request(pageURL, meta={'item': pageItem()})
+    response = HtmlResponse(url=pageURL, body=pageBody, request=request, encoding='utf-8')
+
+    async def crawl():
+        stored = []
+        for output in spider.parse_html(response):
+            if isinstance(output, Request):
+                for item in output.callback(Response(url=output.url, body=attachmentBody, request=output)):
+                    stored.append(await maybe_deferred_to_future(pipeline.process_item(item, spider)))
+            else:
+                # The generator only resumes once the page was stored, the pipeline has changed the yielded item
+                stored.append(await maybe_deferred_to_future(pipeline.process_item(output, spider)))
+        return stored
+
+    page, attachment = reactor._asyncioEventloop.run_until_complete(crawl())
+    assert page['filePath'] == 'landing/Labour Court_01-01-2025/ADJ-00012345.html'
+    assert attachment['filePath'] == 'landing/Labour Court_01-01-2025/ADJ-00012345.pdf'
+    assert attachment['fileHash'] == hashlib.sha256(attachmentBody).hexdigest()
+    assert InMemoryMinioClient.objects[('landing', 'Labour Court_01-01-2025/ADJ-00012345.pdf')] == attachmentBody
+
+
+def test_page_and_attachment_keep_their_own_validators(spider, openPipeline):
+    pipeline = openPipeline(asyncEnabled=False)
+    meta, headers = spider._conditionalRequest(pageItem())
+    page = documentResponse(Request(pageURL, meta=meta, headers=headers), pageBody, '"page-1"')
+    for output in spider.parse_html(page):
+        if isinstance(output, Request):
+            assert output.meta['item']['documentURL'] == attachmentURL
+            for item in output.callback(documentResponse(output, attachmentBody, '"pdf-1"')):
+                pipeline.process_item(item, spider)
+        else:
+            pipeline.process_item(output, spider)
+
+    spider.validators = InMemoryMongoDBClient().findValidators('document_validators')
+    assert spider.validators[pageURL]['etag'] == '"page-1"'
+    assert spider.validators[pageURL]['fileHash'] == hashlib.sha256(pageBody).hexdigest()
+    assert spider.validators[attachmentURL]['etag'] == '"pdf-1"'
+    assert spider.validators[attachmentURL]['fileHash'] == hashlib.sha256(attachmentBody).hexdigest()
+
+    # Next crawl: the page changed, the attachment did not
+    meta, headers = spider._conditionalRequest(pageItem())
+    assert headers['If-None-Match'] == '"page-1"'
+    assert meta['item']['storedFileHash'] == hashlib.sha256(pageBody).hexdigest()
+    changedPage = documentResponse(Request(pageURL, meta=meta, headers=headers), pageBody.replace(b'Decision', b'Amended decision'), '"page-2"')
+    outputs = list(spider.parse_html(changedPage))
+    assert outputs[0]['etag'] == '"page-2"'
+    attachmentRequest = outputs[1]
+    assert attachmentRequest.headers.get('If-None-Match') == b'"pdf-1"'
+    assert attachmentRequest.meta['item']['storedFileHash'] == hashlib.sha256(attachmentBody).hexdigest()
+    assert list(attachmentRequest.callback(documentResponse(attachmentRequest, b'', '"pdf-1"', status=304))) == []
+
+
+def pdfDocument(text):
+    """A one page PDF showing text."""
+    stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'.encode()
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    document = b'%PDF-1.4\n'
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(document))
+        document += b'%d 0 obj\n%s\nendobj\n' % (number, content)
+    xref = b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1) + b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    trailer = b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, len(document))
+    return document + xref + trailer
+
+
+def test_decision_published_as_page_and_pdf_shares_a_cluster(spider, monkeypatch):
+    pytest.importorskip('pypdf')
+    monkeypatch.setattr(pipelines, 'MinioClient', InMemoryMinioClient)
+    monkeypatch.setattr(pipelines, 'MongoDBClient', InMemoryMongoDBClient)
+    monkeypatch.setenv('INDEX_DIR', '')
+    text = 'The complainant was dismissed without notice after raising a grievance about unpaid overtime ' \
+           'and the adjudication officer finds that the complaint is well founded and awards compensation'
+    pipeline = pipelines.StagingPipeline()
+    pipeline.open_spider(spider)
+    page = dict(pageItem(), fileType='html', filePath='landing/Labour Court_01-01-2025/ADJ-00012345.html',
+                fileHash='page', pendingStaging=True, rawContent=f'<html><body><main>{text}</main></body></html>'.encode())
+    pdf = dict(pageItem(), Id='ADJ-00012346', fileType='pdf', filePath='landing/Labour Court_01-01-2025/ADJ-00012346.pdf',
+               fileHash='pdf', pendingStaging=True, rawContent=pdfDocument(text))
+    InMemoryMinioClient.objects[('landing', 'Labour Court_01-01-2025/ADJ-00012346.pdf')] = pdf['rawContent']
+    pipeline.process_item(page, spider)
+    pipeline.process_item(pdf, spider)
+    pipeline.close_spider(spider)
+
+    staged = {record['Id']: record for record in InMemoryMongoDBClient().findItems('stg_documents_metadata')}
+    assert staged['ADJ-00012346']['duplicateCluster'] == 'ADJ-00012345'
+    assert staged['ADJ-00012346']['duplicateOf'] == 'ADJ-00012345'
+    assert staged['ADJ-00012346']['fileHash'] == 'pdf'
@@ -0,0 +1,59 @@
+from scraper.search.InvertedIndex import IndexWriter
+from scraper.search.query import parseQuery, search
+from scraper.exception.Exception import InvalidOperation
+import pytest
+
+documents = {
+    'ADJ-1': 'The complaint of unfair dismissal is well founded.',
+    'ADJ-2': 'The dismissal was not unfair, the redundancy was genuine.',
+    'ADJ-3': 'Claim for unpaid wages under the Payment of Wages Act.',
+    'LCR-4': 'The Labour Court upholds the decision on pay and unfair dismissal.',
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    writer = IndexWriter(tmp_path, segmentSize=2)
+    for Id, text in documents.items():
+        writer.add(Id, text)
+    writer.commit()
+    return tmp_path
+
+
+@pytest.mark.parametrize('query, tree', [
+    ('labour', ('terms', ['labour'])),
+    ('Labour Court', ('and', ('terms', ['labour']), ('terms', ['court']))),
+    ('"labour court"', ('terms', ['labour', 'court'])),
+    ('ADJ-00012345', ('terms', ['adj', '00012345'])),
+    ('pay OR wages court', ('or', ('terms', ['pay']), ('and', ('terms', ['wages']), ('terms', ['court'])))),
+    ('(pay OR wages) AND court', ('and', ('or', ('terms', ['pay']), ('terms', ['wages'])), ('terms', ['court']))),
+    ('NOT NOT pay', ('not', ('not', ('terms', ['pay'])))),
+    ('', None),
+])
+def test_parse_query(query, tree):
+    assert parseQuery(query) == tree
+
+
+@pytest.mark.parametrize('query', ['(pay OR wages', 'pay )', 'pay AND', 'OR pay', 'NOT'])
+def test_parse_query_rejects_malformed_queries(query):
+    with pytest.raises(InvalidOperation):
+        parseQuery(query)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('dismissal', {'ADJ-1', 'ADJ-2', 'LCR-4'}),
+    ('"unfair dismissal"', {'ADJ-1', 'LCR-4'}),
+    ('"dismissal unfair"', set()),
+    ('unfair dismissal', {'ADJ-1', 'ADJ-2', 'LCR-4'}),
+    ('"unfair dismissal" AND NOT court', {'ADJ-1'}),
+    ('NOT court AND "unfair dismissal"', {'ADJ-1'}),
+    ('redundancy OR wages', {'ADJ-2', 'ADJ-3'}),
+    ('(pay OR wages) AND "labour court"', {'LCR-4'}),
+    ('NOT dismissal', {'ADJ-3'}),
+    ('Wages', {'ADJ-3'}),
+    ('missing', set()),
+    ('-', set(documents)),
+    ('', set()),
+])
+def test_search(index, query, expected):
+    assert search(query, index) == expected
@@ -0,0 +1,118 @@
+from scraper.spiders.WorkplaceRelationSpider import WorkplaceRelationSpider
+from scraper.benchmark.stubs import InMemoryMongoDBClient
+from scrapy.http import HtmlResponse
+from datetime import date, datetime
+import pytest
+
+baseURL = 'https://www.workplacerelations.ie/en/search/?decisions=1&q=%22labour%22'
+
+
+def searchURL(fromDate, toDate):
+    return f'{baseURL}&from={fromDate}&to={toDate}&body=3'
+
+
+def searchPage(head, url=searchURL('01/01/2025', '11/01/2025')):
+    body = f'<html><body><div class="searchhead">{head}</div><ul><li class="each-item"></li></ul></body></html>'
+    return HtmlResponse(url=url, body=body.encode('utf-8'), encoding='utf-8')
+
+
+def windows(urls):
+    return [(url.split('&from=')[1].split('&')[0], url.split('&to=')[1].split('&')[0]) for url in urls]
+
+
+@pytest.fixture
+def mongoClient():
+    InMemoryMongoDBClient.collections.clear()
+    yield InMemoryMongoDBClient()
+    InMemoryMongoDBClient.collections.clear()
+
+
+@pytest.mark.parametrize('head, expected', [
+    ('Shows 1 to 10 of 18 results', 18),
+    ('Shows 1 to 10 of\n  1234   results', 1234),
+    ('Shows 1 to 1 of 1 results', 1),
+    ('Shows 0 to 0 of 0 results', 0),
+])
+def test_result_count_is_read_from_the_search_head(head, expected):
+    assert WorkplaceRelationSpider._extract_result_count(searchPage(head)) == expected
+
+
+@pytest.mark.parametrize('head', ['No results found', 'Shows 1 to 10 of many results', ''])
+def test_result_count_is_none_when_unreadable(head):
+    assert WorkplaceRelationSpider._extract_result_count(searchPage(head)) is None
+
+
+def test_result_count_is_none_without_search_head():
+    response = HtmlResponse(url=searchURL('01/01/2025', '11/01/2025'), body=b'<html><body><p>of 18 results</p></body></html>', encoding='utf-8')
+    assert WorkplaceRelationSpider._extract_result_count(response) is None
+
+
+def test_density_spreads_each_count_over_its_days(spider):
+    density = spider.helperClass.buildDayDensity([
+        {'from': datetime(2025, 1, 1), 'to': datetime(2025, 1, 4), 'count': 40, 'observedAt': datetime(2025, 2, 1)},
+        {'from': datetime(2025, 1, 5), 'to': datetime(2025, 1, 5), 'count': 7, 'observedAt': datetime(2025, 2, 1)},
+        # Inverted window, ignored
+        {'from': datetime(2025, 1, 9), 'to': datetime(2025, 1, 8), 'count': 70, 'observedAt': datetime(2025, 2, 1)},
+    ])
+    assert density == {date(2025, 1, day): 10 for day in range(1, 5)} | {date(2025, 1, 5): 7}
+
+
+def test_density_keeps_the_latest_observation_of_a_day(spider):
+    density = spider.helperClass.buildDayDensity([
+        {'from': datetime(2025, 1, 2), 'to': datetime(2025, 1, 2), 'count': 6, 'observedAt': datetime(2025, 3, 1)},
+        {'from': datetime(2025, 1, 1), 'to': datetime(2025, 1, 2), 'count': 100, 'observedAt': datetime(2025, 2, 1)},
+    ])
+    assert density == {date(2025, 1, 1): 50, date(2025, 1, 2): 6}
+
+
+def test_sparse_days_are_merged_and_dense_days_kept_alone(spider):
+    density = {date(2025, 1, 1): 60} | {date(2025, 1, day): 20 for day in (2, 3, 4)} | {date(2025, 1, day): 1 for day in range(5, 11)}
+    urls = spider.helperClass.constructScrapingList('01/01/2025', '10/01/2025', 'labour', 'Labour Court', 10, density=density, targetPages=5)
+    assert windows(urls) == [
+        # Above the 50 results of 5 pages on its own: a single day window, it is not split further when planning
+        ('01/01/2025', '01/01/2025'),
+        ('02/01/2025', '03/01/2025'),
+        ('04/01/2025', '10/01/2025'),
+    ]
+
+
+def test_days_without_density_use_the_fixed_partition(spider):
+    helperClass = spider.helperClass
+    adaptive = helperClass.constructScrapingList('01/01/2025', '20/01/2025', 'labour', 'Labour Court', 3, density={date(2025, 1, 1): 60}, targetPages=5)
+    fixed = helperClass.constructScrapingList('02/01/2025', '20/01/2025', 'labour', 'Labour Court', 3)
+    assert windows(adaptive) == [('01/01/2025', '01/01/2025')] + windows(fixed)
+
+
+@pytest.mark.parametrize('fromDate, toDate, halves', [
+    ('01/01/2025', '10/01/2025', [('01/01/2025', '05/01/2025'), ('06/01/2025', '10/01/2025')]),
+    ('01/01/2025', '02/01/2025', [('01/01/2025', '01/01/2025'), ('02/01/2025', '02/01/2025')]),
+    ('30/12/2024', '02/01/2025', [('30/12/2024', '31/12/2024'), ('01/01/2025', '02/01/2025')]),
+    ('01/01/2025', '01/01/2025', []),
+])
+def test_split_url(spider, fromDate, toDate, halves):
+    urls = spider.helperClass.splitScrapingURL(searchURL(fromDate, toDate) + '&pageNumber=1')
+    assert windows(urls) == halves
+    assert all(url.startswith(baseURL) and url.endswith('&body=3&pageNumber=1') for url in urls)
+
+
+@pytest.mark.parametrize('fromDate, toDate, count, halves', [
+    ('01/01/2025', '10/01/2025', 51, [('01/01/2025', '05/01/2025'), ('06/01/2025', '10/01/2025')]),
+    ('01/01/2025', '10/01/2025', 50, []),
+    # A single day above the target can not be split
+    ('01/01/2025', '01/01/2025', 500, []),
+])
+def test_dense_window_is_split_and_its_count_cached(spider, mongoClient, fromDate, toDate, count, halves):
+    spider.mongoClient = mongoClient
+    spider.targetPages = 5
+    response = searchPage(f'Shows 1 to 10 of {count} results', searchURL(fromDate, toDate))
+    assert windows(spider._splitDenseWindow(response)) == halves
+    observation, = mongoClient.findItems('partition_density')
+    assert (observation['query'], observation['body'], observation['count']) == ('labour', spider.bodyIds, count)
+    assert (observation['from'], observation['to']) == (datetime.strptime(fromDate, '%d/%m/%Y'), datetime.strptime(toDate, '%d/%m/%Y'))
+
+
+def test_window_without_count_is_kept_and_not_cached(spider, mongoClient):
+    spider.mongoClient = mongoClient
+    spider.targetPages = 5
+    assert spider._splitDenseWindow(searchPage('No results found')) == []
+    assert mongoClient.findItems('partition_density') == []